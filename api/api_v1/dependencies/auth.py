@@ -1,22 +1,26 @@
 from fastapi import Depends, Cookie
 from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
+from starlette.requests import Request
 from jwt import InvalidTokenError
 from redis.asyncio import Redis
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from api.api_v1.dependencies.database.db_helper import db_helper
 from api.api_v1.dependencies.database.redis_helper import redis_helper
+from api.api_v1.dependencies.tracing_helper import tracing_helper
 from api.api_v1.exceptions.http_exceptions import (
     InvalidCredentials,
     InvalidJWT,
     InvalidJWTType,
     InactiveUser,
     InvalidEmail,
+    TooManyEmailRequests,
 )
 from api.api_v1.utils.cache import is_token_in_blacklist
 from api.api_v1.utils.database import get_user_by_username_or_email
+from api.api_v1.utils.email_throttle import email_throttle
 from api.api_v1.utils.jwt_auth import decode_jwt
-from api.api_v1.utils.security import verify_password, validate_token_type
+from api.api_v1.utils.security import verify_password_async, validate_token_type
 from core.config import settings
 from core.models import User
 
@@ -57,7 +61,7 @@ class GetUserFromForm:
         if user is None:
             raise InvalidCredentials()
 
-        if not verify_password(
+        if not await verify_password_async(
             password=user_data.password,
             correct_password=user.hashed_password,
         ):
@@ -167,12 +171,13 @@ class GetUserFromAccessToken(_GetUserFromTokenBase):
         cache: Redis = Depends(redis_helper.get_redis),
     ) -> User:
 
-        return await self._get_user_from_token(
-            token=access_token,
-            token_type=settings.jwt_auth.access_token_type,
-            session=session,
-            cache=cache,
-        )
+        with tracing_helper.start_span("GetUserFromAccessToken"):
+            return await self._get_user_from_token(
+                token=access_token,
+                token_type=settings.jwt_auth.access_token_type,
+                session=session,
+                cache=cache,
+            )
 
 
 class GetUserFromRefreshToken(_GetUserFromTokenBase):
@@ -203,7 +208,6 @@ class GetUserFromRefreshToken(_GetUserFromTokenBase):
 
 
 get_user_from_form = GetUserFromForm()
-get_user_from_form_with_tokens = GetUserFromForm(load_tokens=True)
 
 get_payload_from_access_token = GetPayloadFromAccessToken()
 
@@ -216,3 +220,14 @@ get_user_from_access_token_with_liked_stories = GetUserFromAccessToken(
 )
 
 get_user_from_refresh_token = GetUserFromRefreshToken()
+
+
+async def limit_email_requests_by_ip(
+    request: Request,
+    cache: Redis = Depends(redis_helper.get_redis),
+) -> None:
+    # приложение доступно только через nginx, который перезаписывает X-Real-IP
+    ip = request.headers.get("x-real-ip") or getattr(request.client, "host", "")
+    retry_after = await email_throttle.acquire_for_ip(ip=ip, cache=cache)
+    if retry_after:
+        raise TooManyEmailRequests(retry_after_seconds=retry_after)
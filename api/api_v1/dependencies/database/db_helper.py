@@ -1,4 +1,8 @@
+import asyncio
+import os
+import time
 from collections.abc import AsyncGenerator
+from contextlib import AsyncExitStack
 
 from sqlalchemy.ext.asyncio import (
     create_async_engine,
@@ -6,10 +10,29 @@ from sqlalchemy.ext.asyncio import (
     AsyncSession,
     AsyncEngine,
 )
+from sqlalchemy.pool import AsyncAdaptedQueuePool, ConnectionPoolEntry
 
+from api.api_v1.utils.metrics import db_pool_pending_waits, observe_db_pool_wait
 from core.config import settings
 
 
+class TimedAsyncAdaptedQueuePool(AsyncAdaptedQueuePool):
+    # у пула нет события "начали ждать соединение", поэтому время ожидания
+    # меряется вокруг получения соединения из очереди, а начало ожидания
+    # отмечается сразу, чтобы контроль допуска видел еще не закончившееся
+    # логи пула остаются в пространстве sqlalchemy, а не попадают в логгер api
+    _sqla_logger_namespace = "sqlalchemy.pool.impl.AsyncAdaptedQueuePool"
+
+    def _do_get(self) -> ConnectionPoolEntry:
+        wait_id = db_pool_pending_waits.start()
+        start_time = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            db_pool_pending_waits.finish(wait_id)
+            observe_db_pool_wait(time.perf_counter() - start_time)
+
+
 class DbHelper:
     def __init__(
         self,
@@ -18,13 +41,19 @@ class DbHelper:
         echo_pool: bool,
         max_overflow: int,
         pool_size: int,
+        application_name: str | None = None,
     ):
+        connect_args = {}
+        if application_name is not None:
+            connect_args["server_settings"] = {"application_name": application_name}
         self.engine: AsyncEngine = create_async_engine(
             url=url,
             echo=echo,
             echo_pool=echo_pool,
             max_overflow=max_overflow,
             pool_size=pool_size,
+            poolclass=TimedAsyncAdaptedQueuePool,
+            connect_args=connect_args,
         )
         self.session_factory: async_sessionmaker = async_sessionmaker(
             bind=self.engine,
@@ -37,6 +66,20 @@ class DbHelper:
         async with self.session_factory() as session:
             yield session
 
+    async def warmup(self, connections: int) -> None:
+        # соединения берутся одновременно, поэтому пул открывает их все,
+        # а после выхода из стека они остаются в пуле готовыми к работе
+        async with AsyncExitStack() as stack:
+            await asyncio.gather(
+                *(
+                    stack.enter_async_context(self.engine.connect())
+                    for _ in range(connections)
+                )
+            )
+
+    async def dispose(self) -> None:
+        await self.engine.dispose()
+
 
 db_helper: DbHelper = DbHelper(
     url=str(settings.db.url),
@@ -44,4 +87,6 @@ db_helper: DbHelper = DbHelper(
     echo_pool=settings.db.echo_pool,
     max_overflow=settings.db.max_overflow,
     pool_size=settings.db.pool_size,
+    # pid позволяет отличить соединения разных воркеров в pg_stat_activity
+    application_name=f"{settings.db.application_name}:{os.getpid()}",
 )
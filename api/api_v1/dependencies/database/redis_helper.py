@@ -1,8 +1,31 @@
+import asyncio
+import time
+from collections.abc import Awaitable
+from typing import Any, cast
+
 from redis.asyncio import ConnectionPool, Redis
 
+from api.api_v1.dependencies.tracing_helper import tracing_helper
+from api.api_v1.utils.metrics import redis_command_latency_histogram
 from core.config import settings
 
 
+class InstrumentedRedis(Redis):
+    async def execute_command(self, *args: Any, **options: Any) -> Any:
+        command = str(args[0]).upper()
+        start_time = time.perf_counter()
+        try:
+            with tracing_helper.start_span(
+                f"redis {command}",
+                attributes={"db.system": "redis", "db.operation": command},
+            ):
+                return await super().execute_command(*args, **options)
+        finally:
+            redis_command_latency_histogram.labels(command=command).observe(
+                time.perf_counter() - start_time
+            )
+
+
 class RedisHelper:
     def __init__(
         self,
@@ -11,7 +34,17 @@ class RedisHelper:
         self.pool = ConnectionPool.from_url(url=url)
 
     def get_redis(self) -> Redis:
-        return Redis(connection_pool=self.pool)
+        return InstrumentedRedis(connection_pool=self.pool)
+
+    async def warmup(self, connections: int) -> None:
+        # одновременные команды занимают разные соединения пула
+        redis = self.get_redis()
+        await asyncio.gather(
+            *(cast(Awaitable[bool], redis.ping()) for _ in range(connections))
+        )
+
+    async def close(self) -> None:
+        await self.pool.aclose()
 
 
 redis_helper: RedisHelper = RedisHelper(url=str(settings.redis.url))
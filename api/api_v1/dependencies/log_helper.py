@@ -1,15 +1,45 @@
+import atexit
 import logging
 import os
+import queue
 from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
 from os import PathLike
+from typing import Literal
 
+from api.api_v1.utils.metrics import log_records_dropped_counter
 from core.config import settings
 
 
+class BoundedQueueHandler(QueueHandler):
+    def __init__(
+        self,
+        log_queue: queue.Queue,
+        overflow_policy: Literal["drop", "block"] = "drop",
+    ):
+        super().__init__(log_queue)
+        # QueueHandler.queue типизирован как _QueueLike без put с блокировкой
+        self.log_queue: queue.Queue = log_queue
+        self.overflow_policy: Literal["drop", "block"] = overflow_policy
+        self.dropped_records: int = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self.overflow_policy == "block":
+            self.log_queue.put(record)
+            return
+        try:
+            self.log_queue.put_nowait(record)
+        except queue.Full:
+            self.dropped_records += 1
+            # сам отказ в лог не пишется: очередь и так переполнена
+            log_records_dropped_counter.labels(logger=record.name).inc()
+
+
 class LogHelper:
     _instance: LogHelper | None = None
     _loggers: dict[str, logging.Logger] = {}
     _request_id_var: ContextVar = ContextVar("request_id", default=None)
+    _listeners: dict[str, tuple[QueueListener, BoundedQueueHandler]] = {}
 
     def __new__(cls):
         if cls._instance is None:
@@ -29,11 +59,17 @@ class LogHelper:
         logger = logging.getLogger(name)
         logger.setLevel(level)
 
+        class RequestIdFilter(logging.Filter):
+            def filter(self, record) -> bool:
+                # запись форматируется в потоке QueueListener, где contextvar
+                # текущего запроса уже недоступен, поэтому запоминаем его заранее
+                record.request_id = cls._request_id_var.get()
+                return True
+
         class RequestIdFormatter(logging.Formatter):
             def format(self, record) -> str:
-                request_id = cls._request_id_var.get()
+                request_id = getattr(record, "request_id", None)
                 if request_id is not None:
-                    record.request_id = request_id
                     return f"[{request_id}] {super().format(record)}"
                 return super().format(record)
 
@@ -48,7 +84,23 @@ class LogHelper:
             else logging.FileHandler(filename)
         )
         handler.setFormatter(formatter)
-        logger.addHandler(handler)
+
+        queue_handler = BoundedQueueHandler(
+            log_queue=queue.Queue(maxsize=settings.log.queue_max_size),
+            overflow_policy=settings.log.queue_overflow_policy,
+        )
+        queue_handler.addFilter(RequestIdFilter())
+        logger.addHandler(queue_handler)
+
+        listener = QueueListener(
+            queue_handler.queue,
+            handler,
+            respect_handler_level=True,
+        )
+        listener.start()
+        if not cls._listeners:
+            atexit.register(cls.shutdown)
+        cls._listeners[name] = (listener, queue_handler)
 
         cls._loggers[name] = logger
         return logger
@@ -67,6 +119,21 @@ class LogHelper:
             filename=settings.log.app_log_file,
         )
 
+    @classmethod
+    def shutdown(cls) -> None:
+        for name, (listener, queue_handler) in list(cls._listeners.items()):
+            # stop() дожидается, пока поток запишет все накопленные записи
+            listener.stop()
+            logger = cls._loggers[name]
+            logger.removeHandler(queue_handler)
+            # после остановки очередь никто не разбирает, поэтому
+            # оставшиеся записи пишем напрямую, без очереди
+            for handler in listener.handlers:
+                for log_filter in queue_handler.filters:
+                    handler.addFilter(log_filter)
+                logger.addHandler(handler)
+            del cls._listeners[name]
+
     @classmethod
     def set_request_id(cls, request_id: str | None) -> None:
         cls._request_id_var.set(request_id)
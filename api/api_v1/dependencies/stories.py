@@ -4,6 +4,7 @@ from fastapi import Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from api.api_v1.dependencies.database.db_helper import db_helper
+from api.api_v1.dependencies.tracing_helper import tracing_helper
 from api.api_v1.exceptions.http_exceptions import StoryNotFound
 from api.api_v1.utils.database import get_story_by_uuid
 from core.models import Story
@@ -23,12 +24,16 @@ class GetStoryByUUID:
         story_uuid: UUID,
         session: AsyncSession = Depends(db_helper.get_session),
     ) -> Story:
-        story = await get_story_by_uuid(
-            story_uuid=story_uuid,
-            session=session,
-            load_author=self.load_author,
-            load_likers=self.load_likers,
-        )
+        with tracing_helper.start_span(
+            "GetStoryByUUID",
+            attributes={"story.uuid": str(story_uuid)},
+        ):
+            story = await get_story_by_uuid(
+                story_uuid=story_uuid,
+                session=session,
+                load_author=self.load_author,
+                load_likers=self.load_likers,
+            )
         if story is None:
             raise StoryNotFound()
         return story
@@ -0,0 +1,146 @@
+import os
+from contextlib import AbstractContextManager, nullcontext
+from typing import Any, TextIO
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from api.api_v1.dependencies.log_helper import LogHelper
+from api.api_v1.utils.query_tracking import is_service_query
+from core.config import settings, TracingConfig
+
+logger = LogHelper.get_app_logger()
+
+REQUEST_ID_ATTRIBUTE = "http.request_id"
+
+
+class TracingHelper:
+    def __init__(self, config: TracingConfig):
+        self.config: TracingConfig = config
+        self._tracer: Any = None
+        self._provider: Any = None
+        self._file: TextIO | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return self._tracer is not None
+
+    def setup(self, span_processor: Any = None) -> None:
+        if self._tracer is not None:
+            return
+        if not self.config.enabled and span_processor is None:
+            return
+
+        # opentelemetry ставится только вместе с extra "tracing",
+        # поэтому импортируем его лишь тогда, когда трассировка включена
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+        if span_processor is None:
+            span_processor = BatchSpanProcessor(self._create_exporter())
+
+        logger.debug(
+            "Setting up tracing. ServiceName=%r, Exporter=%r",
+            self.config.service_name,
+            self.config.exporter,
+        )
+        self._provider = TracerProvider(
+            resource=Resource.create({"service.name": self.config.service_name})
+        )
+        self._provider.add_span_processor(span_processor)
+        self._tracer = self._provider.get_tracer(__name__)
+
+    def _create_exporter(self) -> Any:
+        if self.config.exporter == "file":
+            from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+
+            self._file = open(self.config.file_path, "a", encoding="utf-8")
+            return ConsoleSpanExporter(
+                service_name=self.config.service_name,
+                out=self._file,
+                formatter=lambda span: span.to_json(indent=None) + os.linesep,
+            )
+
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import (
+            OTLPSpanExporter,
+        )
+
+        return OTLPSpanExporter(endpoint=self.config.otlp_endpoint)
+
+    def _get_attributes(self, attributes: dict[str, Any] | None) -> dict[str, Any]:
+        attributes = dict(attributes or {})
+        request_id = LogHelper.get_request_id()
+        if request_id is not None:
+            attributes[REQUEST_ID_ATTRIBUTE] = request_id
+        return attributes
+
+    def start_span(
+        self,
+        name: str,
+        attributes: dict[str, Any] | None = None,
+    ) -> AbstractContextManager[Any]:
+        # при выключенной трассировке возвращаем пустой контекст,
+        # чтобы вызывающему коду не нужно было проверять enabled
+        if self._tracer is None:
+            return nullcontext()
+        return self._tracer.start_as_current_span(
+            name,
+            attributes=self._get_attributes(attributes),
+        )
+
+    def instrument_engine(self, engine: AsyncEngine) -> None:
+        sync_engine = engine.sync_engine
+
+        @event.listens_for(sync_engine, "before_cursor_execute")
+        def on_before_cursor_execute(
+            conn, cursor, statement, parameters, context, executemany
+        ):
+            if self._tracer is None or is_service_query(context):
+                return
+            operation = statement.split(maxsplit=1)[0].upper() if statement else "SQL"
+            context._tracing_span = self._tracer.start_span(
+                f"SQL {operation}",
+                attributes=self._get_attributes(
+                    {
+                        "db.system": sync_engine.dialect.name,
+                        "db.operation": operation,
+                        "db.statement": statement,
+                    }
+                ),
+            )
+
+        @event.listens_for(sync_engine, "after_cursor_execute")
+        def on_after_cursor_execute(
+            conn, cursor, statement, parameters, context, executemany
+        ):
+            span = getattr(context, "_tracing_span", None)
+            if span is not None:
+                span.end()
+                context._tracing_span = None
+
+        @event.listens_for(sync_engine, "handle_error")
+        def on_handle_error(exception_context):
+            context = exception_context.execution_context
+            span = getattr(context, "_tracing_span", None)
+            if span is None:
+                return
+            from opentelemetry.trace import Status, StatusCode
+
+            span.record_exception(exception_context.original_exception)
+            span.set_status(Status(StatusCode.ERROR))
+            span.end()
+            context._tracing_span = None
+
+    def shutdown(self) -> None:
+        if self._provider is not None:
+            # shutdown() выгружает накопленные в BatchSpanProcessor спаны
+            self._provider.shutdown()
+        if self._file is not None:
+            self._file.close()
+        self._tracer = None
+        self._provider = None
+        self._file = None
+
+
+tracing_helper: TracingHelper = TracingHelper(config=settings.tracing)
@@ -1,6 +1,5 @@
 from pathlib import Path
 
-import aiofiles.os
 from fastapi import Depends, UploadFile, File
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -12,7 +11,9 @@ from api.api_v1.exceptions.http_exceptions import (
     AvatarNotFound,
     UnsupportedAvatarExtension,
 )
+from api.api_v1.utils.avatar_storage import avatar_storage
 from api.api_v1.utils.database import get_user_by_username_or_email
+from api.api_v1.utils.memory_cache import avatar_path_cache
 from api.api_v1.utils.security import validate_avatar_extension, validate_avatar_size
 from core.config import settings
 from core.models import User
@@ -47,11 +48,19 @@ class GetUserByUsername:
 
 
 class GetAvatarPath:
+    _missing = object()
+
     async def __call__(
         self,
         username: str,
         session: AsyncSession = Depends(db_helper.get_session),
-    ) -> Path:
+    ) -> tuple[str, str, str | None]:
+        cached = avatar_path_cache.get(username, default=self._missing)
+        if cached is not self._missing:
+            if cached is None:
+                raise AvatarNotFound()
+            return cached
+
         user = await get_user_by_username_or_email(
             username=username,
             session=session,
@@ -62,17 +71,18 @@ class GetAvatarPath:
 
         if not user:
             raise UserNotFound()
-        if not user.avatar_name:
-            raise AvatarNotFound()
-
-        avatar_path = settings.avatar.avatars_dir / user.avatar_name
-        if not await aiofiles.os.path.exists(avatar_path):
+        if not user.avatar_name or not await avatar_storage.exists(user.avatar_name):
+            avatar_path_cache.set(username, None)
             raise AvatarNotFound()
 
         avatar_extension = Path(user.avatar_name).suffix.lower()
         if avatar_extension not in settings.avatar.allowed_extensions_to_mime.keys():
             raise UnsupportedAvatarExtension()
-        return avatar_path
+
+        media_type = settings.avatar.allowed_extensions_to_mime[avatar_extension]
+        avatar = (user.avatar_name, media_type, user.avatar_etag)
+        avatar_path_cache.set(username, avatar)
+        return avatar
 
 
 class ValidateAvatar:
@@ -38,6 +38,18 @@ class AvatarNotFound(HTTPException):
         )
 
 
+class TooManyUsernames(HTTPException):
+    def __init__(
+        self,
+        status_code: int = status.HTTP_400_BAD_REQUEST,
+        detail: str = "Too many usernames requested",
+    ):
+        super().__init__(
+            status_code=status_code,
+            detail=detail,
+        )
+
+
 class InvalidJWT(HTTPException):
     def __init__(
         self,
@@ -264,3 +276,29 @@ class UserIsNotBlocked(HTTPException):
             status_code=status_code,
             detail=detail,
         )
+
+
+class StatementTimeoutExceeded(HTTPException):
+    def __init__(
+        self,
+        status_code: int = status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail: str = "Request took too long, try again later",
+    ):
+        super().__init__(
+            status_code=status_code,
+            detail=detail,
+        )
+
+
+class TooManyEmailRequests(HTTPException):
+    def __init__(
+        self,
+        retry_after_seconds: int,
+        status_code: int = status.HTTP_429_TOO_MANY_REQUESTS,
+        detail: str = "Too many email requests, try again later",
+    ):
+        super().__init__(
+            status_code=status_code,
+            detail=detail,
+            headers={"Retry-After": str(retry_after_seconds)},
+        )
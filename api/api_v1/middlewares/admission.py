@@ -0,0 +1,42 @@
+from starlette import status
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Scope, Receive, Send
+
+from api.api_v1.utils.admission import AdmissionController, admission_controller
+from api.api_v1.utils.metrics import requests_shed_counter
+
+
+class AdmissionControlMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        controller: AdmissionController = admission_controller,
+    ):
+        self.app: ASGIApp = app
+        self.controller: AdmissionController = controller
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        priority, reason = self.controller.check(scope["path"])
+        if reason is not None:
+            # быстрый отказ дешевле, чем запрос, который простоит в очереди
+            # к пулу БД и все равно отвалится по таймауту nginx
+            requests_shed_counter.labels(priority=priority, reason=reason).inc()
+            response = JSONResponse(
+                {"detail": "Service is overloaded, try again later"},
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={
+                    "Retry-After": str(self.controller.config.retry_after_seconds)
+                },
+            )
+            await response(scope, receive, send)
+            return
+
+        self.controller.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.in_flight -= 1
@@ -0,0 +1,75 @@
+import asyncio
+
+from starlette.types import ASGIApp, Scope, Receive, Send, Message
+
+from api.api_v1.dependencies.log_helper import LogHelper
+
+logger = LogHelper.get_api_logger()
+
+# код nginx для запросов, которые клиент закрыл, не дождавшись ответа
+CLIENT_CLOSED_REQUEST = 499
+CANCELLABLE_METHODS = ("GET", "HEAD")
+
+
+class ClientDisconnectMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app: ASGIApp = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        # отменяются только читающие запросы: прерванная на середине запись
+        # может оставить, например, отправленное письмо без закоммиченного токена
+        if scope["type"] != "http" or scope["method"] not in CANCELLABLE_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        messages: asyncio.Queue[Message] = asyncio.Queue()
+        response_complete = False
+        disconnected = False
+
+        async def receive_wrapper() -> Message:
+            return await messages.get()
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal response_complete
+            if message["type"] == "http.response.body" and not message.get(
+                "more_body", False
+            ):
+                response_complete = True
+            await send(message)
+
+        async def run_app() -> None:
+            # ASGIApp возвращает Awaitable, а create_task нужна корутина
+            await self.app(scope, receive_wrapper, send_wrapper)
+
+        app_task = asyncio.create_task(run_app())
+
+        async def watch_disconnect() -> None:
+            nonlocal disconnected
+            while True:
+                message = await receive()
+                messages.put_nowait(message)
+                if message["type"] != "http.disconnect":
+                    continue
+                # после ответа сервер тоже отдает http.disconnect, это не обрыв
+                if not response_complete and not app_task.done():
+                    disconnected = True
+                    # отмена задачи отменяет и ожидание ответа от asyncpg,
+                    # который отправляет PostgreSQL запрос на отмену запроса
+                    app_task.cancel()
+                return
+
+        watcher = asyncio.create_task(watch_disconnect())
+        try:
+            await app_task
+        except asyncio.CancelledError:
+            current_task = asyncio.current_task()
+            if not disconnected or (current_task and current_task.cancelling()):
+                raise
+            scope["client_disconnected"] = True
+            logger.info(
+                "Client disconnected, request cancelled. Method=%s Path=%s",
+                scope["method"],
+                scope["path"],
+            )
+        finally:
+            watcher.cancel()
@@ -0,0 +1,91 @@
+import time
+
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Scope, Receive, Send, Message
+
+from api.api_v1.dependencies.log_helper import LogHelper
+from api.api_v1.dependencies.tracing_helper import tracing_helper
+from api.api_v1.middlewares.client_disconnect import CLIENT_CLOSED_REQUEST
+from api.api_v1.utils.metrics import observe_request, in_flight_requests_gauge
+from api.api_v1.utils.query_tracking import track_queries
+from api.api_v1.utils.sql_comments import set_request_scope
+
+logger = LogHelper.get_api_logger()
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+def get_route_template(scope: Scope) -> str:
+    # FastAPI кладет найденный роут в scope, поэтому после обработки запроса
+    # можно взять шаблон пути вместо сырого пути с uuid и юзернеймами
+    route = scope.get("route")
+    return getattr(route, "path_format", None) or UNMATCHED_ROUTE
+
+
+class ProcessTimeMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app: ASGIApp = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        LogHelper.set_request_id(Headers(scope=scope).get("x-request-id"))
+        set_request_scope(scope)
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_flight_requests_gauge.inc()
+        start_time = time.perf_counter_ns()
+        with (
+            tracing_helper.start_span(
+                f"{scope['method']} {UNMATCHED_ROUTE}",
+                attributes={
+                    "http.method": scope["method"],
+                    "http.target": scope["path"],
+                },
+            ) as span,
+            track_queries() as query_stats,
+        ):
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                process_time_ns = time.perf_counter_ns() - start_time
+                in_flight_requests_gauge.dec()
+                if scope.get("client_disconnected"):
+                    status_code = CLIENT_CLOSED_REQUEST
+                route = get_route_template(scope)
+                if span is not None:
+                    # роут становится известен только после обработки запроса
+                    span.update_name(f"{scope['method']} {route}")
+                    span.set_attribute("http.route", route)
+                    span.set_attribute("http.status_code", status_code)
+                logger.info(
+                    "Method=%s Path=%s Route=%s StatusCode=%s ProcessTime=%.6f QueryCount=%s",
+                    scope["method"],
+                    scope["path"],
+                    route,
+                    status_code,
+                    process_time_ns / 1_000_000_000,
+                    query_stats.count,
+                )
+                if query_stats.is_over_budget:
+                    logger.warning(
+                        "Query budget exceeded. Method=%s Route=%s QueryCount=%s QueryBudget=%s",
+                        scope["method"],
+                        route,
+                        query_stats.count,
+                        query_stats.budget,
+                    )
+                observe_request(
+                    method=scope["method"],
+                    route=route,
+                    status_code=status_code,
+                    duration_ns=process_time_ns,
+                )
@@ -10,19 +10,22 @@ from api.api_v1.dependencies.database.db_helper import db_helper
 from api.api_v1.exceptions.http_exceptions import UserAlreadyBlocked, UserIsNotBlocked
 from api.api_v1.schemas.user import UserWithStoriesScheme, UserScheme
 from api.api_v1.utils.database import (
-    get_active_users,
-    get_inactive_users,
+    get_user_list_items,
     make_admin,
     demote_admin,
     block_user,
     unblock_user,
 )
+from api.api_v1.utils.statement_timeout import StatementTimeout
 from core.config import settings
 from core.models import User
 
 admin_router = APIRouter(
     prefix=settings.admin_router.prefix,
     tags=settings.admin_router.tags,
+    dependencies=[
+        Depends(StatementTimeout(settings.admin_router.statement_timeout_ms))
+    ],
 )
 
 
@@ -36,8 +39,9 @@ async def get_active_users_endpoint(
     session: AsyncSession = Depends(db_helper.get_session),
     page: int = 1,
 ):
-    users = await get_active_users(
+    users = await get_user_list_items(
         session=session,
+        is_active=True,
         page=page,
     )
     return users
@@ -53,8 +57,9 @@ async def get_inactive_users_endpoint(
     session: AsyncSession = Depends(db_helper.get_session),
     page: int = 1,
 ):
-    users = await get_inactive_users(
+    users = await get_user_list_items(
         session=session,
+        is_active=False,
         page=page,
     )
     return users
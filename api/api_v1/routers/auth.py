@@ -1,7 +1,6 @@
-import datetime
 import re
 
-from fastapi import APIRouter, Depends, BackgroundTasks, Form
+from fastapi import APIRouter, Depends, Form
 from pydantic import EmailStr
 from redis.asyncio import Redis
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -10,9 +9,9 @@ from starlette.responses import Response
 
 from api.api_v1.dependencies.auth import (
     get_user_from_form,
-    get_user_from_form_with_tokens,
     get_user_from_refresh_token,
     get_payload_from_access_token,
+    limit_email_requests_by_ip,
 )
 from api.api_v1.dependencies.database.db_helper import db_helper
 from api.api_v1.dependencies.database.redis_helper import redis_helper
@@ -24,6 +23,7 @@ from api.api_v1.exceptions.http_exceptions import (
     InactiveUser,
     InvalidChangePasswordCode,
     EmailAlreadyVerified,
+    TooManyEmailRequests,
 )
 from api.api_v1.schemas.auth_responses import (
     StatusSuccessResponse,
@@ -33,23 +33,24 @@ from api.api_v1.schemas.auth_responses import (
 from api.api_v1.utils.cache import add_token_to_blacklist
 from api.api_v1.utils.database import (
     get_user_by_username_or_email,
-    update_user_email_verification_token,
-    get_user_by_email_verification_token,
     confirm_user_email,
-    update_forgot_password_token,
     create_user_with_tokens,
-    get_user_by_forgot_password_token,
     change_user_password,
 )
 from api.api_v1.utils.email import send_plain_message_to_email
+from api.api_v1.utils.email_codes import email_code_store
+from api.api_v1.utils.email_throttle import email_throttle
 from api.api_v1.utils.jwt_auth import create_access_token, create_refresh_token
-from api.api_v1.utils.security import hash_password, generate_email_token
+from api.api_v1.utils.security import hash_password_async
+from api.api_v1.utils.statement_timeout import StatementTimeout
 from core.config import settings
 from core.models import User
+from core.models.email_code import EmailCodeKind
 
 auth_router = APIRouter(
     prefix=settings.auth_router.prefix,
     tags=settings.auth_router.tags,
+    dependencies=[Depends(StatementTimeout(settings.auth_router.statement_timeout_ms))],
 )
 logger = LogHelper.get_app_logger()
 
@@ -99,7 +100,7 @@ async def registration_endpoint(
         )
         raise AlreadyRegistered()
 
-    hashed_password = hash_password(password=password)
+    hashed_password = await hash_password_async(password=password)
     await create_user_with_tokens(
         username=username,
         hashed_password=hashed_password,
@@ -119,11 +120,11 @@ async def registration_endpoint(
     settings.auth_router.send_email_token_endpoint_path,
     status_code=status.HTTP_200_OK,
     response_model=StatusSuccessResponse,
+    dependencies=[Depends(limit_email_requests_by_ip)],
 )
 async def send_email_verification_token_endpoint(
-    background_tasks: BackgroundTasks,
-    user: User = Depends(get_user_from_form_with_tokens),
-    session: AsyncSession = Depends(db_helper.get_session),
+    user: User = Depends(get_user_from_form),
+    cache: Redis = Depends(redis_helper.get_redis),
 ):
     logger.info(
         "Attempt to send email verification token. %s",
@@ -136,22 +137,46 @@ async def send_email_verification_token_endpoint(
         )
         raise EmailAlreadyVerified()
 
-    email_verification_token = generate_email_token()
+    if not await email_throttle.coalesce(
+        kind=EmailCodeKind.EMAIL_VERIFICATION, email=user.email, cache=cache
+    ):
+        logger.info(
+            "Email verification token was sent recently, reusing it. %s",
+            user,
+        )
+        return StatusSuccessResponse()
 
-    updated_user = await update_user_email_verification_token(
-        user=user,
-        email_verification_token=email_verification_token,
-        session=session,
-    )
+    try:
+        retry_after = await email_throttle.acquire_for_email(
+            email=user.email, cache=cache
+        )
+        if retry_after:
+            logger.warning(
+                "Attempt to send email verification token failed. Too many requests. %s",
+                user,
+            )
+            raise TooManyEmailRequests(retry_after_seconds=retry_after)
+
+        email_verification_token = await email_code_store.issue(
+            kind=EmailCodeKind.EMAIL_VERIFICATION,
+            username=user.username,
+        )
+
+        await send_plain_message_to_email(
+            subject="Email Verification",
+            email_address=user.email,
+            body=email_verification_token,
+            cache=cache,
+        )
+    except Exception:
+        # письмо не ушло - следующий запрос не должен попасть в окно
+        await email_throttle.release(
+            kind=EmailCodeKind.EMAIL_VERIFICATION, email=user.email, cache=cache
+        )
+        raise
 
-    send_plain_message_to_email(
-        subject="Email Verification",
-        email_address=user.email,
-        body=updated_user.tokens.email_verification_token,
-        background_tasks=background_tasks,
-    )
     logger.info(
-        "Background task scheduled for sending email verification token. %s",
+        "Email verification token queued for sending. %s",
         user,
     )
 
@@ -169,10 +194,15 @@ async def confirm_email_endpoint(
 ):
     logger.info("Attempt to confirm email")
     email_verification_token = email_verification_token.lower().strip()
-    user = await get_user_by_email_verification_token(
-        email_verification_token=email_verification_token,
-        session=session,
-        load_tokens=True,
+    # код гасится сразу, просроченный код хранилище уже удалило само
+    username = await email_code_store.pop(
+        kind=EmailCodeKind.EMAIL_VERIFICATION,
+        code=email_verification_token,
+    )
+    user = (
+        await get_user_by_username_or_email(username=username, session=session)
+        if username is not None
+        else None
     )
     if user is None:
         logger.warning(
@@ -186,11 +216,6 @@ async def confirm_email_endpoint(
         )
         raise EmailAlreadyVerified()
 
-    token_exp = user.tokens.email_verification_token_exp
-    if token_exp is None or token_exp < datetime.datetime.now(datetime.UTC):
-        logger.warning("Attempt to confirm email failed. Token expired or invalid")
-        raise InvalidConfirmEmailCode()
-
     await confirm_user_email(
         user=user,
         session=session,
@@ -207,11 +232,12 @@ async def confirm_email_endpoint(
     settings.auth_router.forgot_password_endpoint_path,
     status_code=status.HTTP_200_OK,
     response_model=StatusSuccessResponse,
+    dependencies=[Depends(limit_email_requests_by_ip)],
 )
 async def forgot_password_endpoint(
-    background_tasks: BackgroundTasks,
     email: EmailStr = Form(default=""),
     session: AsyncSession = Depends(db_helper.get_session),
+    cache: Redis = Depends(redis_helper.get_redis),
 ):
     logger.info(
         "Attempt to send forgot password token. Email=%r",
@@ -220,7 +246,6 @@ async def forgot_password_endpoint(
     user = await get_user_by_username_or_email(
         email=email,
         session=session,
-        load_tokens=True,
     )
     if user is None:
         logger.warning(
@@ -241,21 +266,45 @@ async def forgot_password_endpoint(
         )
         raise InactiveUser()
 
-    forgot_password_token = generate_email_token()
-    updated_user = await update_forgot_password_token(
-        user=user,
-        forgot_password_token=forgot_password_token,
-        session=session,
-    )
+    if not await email_throttle.coalesce(
+        kind=EmailCodeKind.FORGOT_PASSWORD, email=user.email, cache=cache
+    ):
+        logger.info(
+            "Forgot password token was sent recently, reusing it. %s",
+            user,
+        )
+        return StatusSuccessResponse()
+
+    try:
+        retry_after = await email_throttle.acquire_for_email(
+            email=user.email, cache=cache
+        )
+        if retry_after:
+            logger.warning(
+                "Attempt to send forgot password token failed. Too many requests. %s",
+                user,
+            )
+            raise TooManyEmailRequests(retry_after_seconds=retry_after)
+
+        forgot_password_token = await email_code_store.issue(
+            kind=EmailCodeKind.FORGOT_PASSWORD,
+            username=user.username,
+        )
+
+        await send_plain_message_to_email(
+            subject="Resetting password",
+            email_address=user.email,
+            body=forgot_password_token,
+            cache=cache,
+        )
+    except Exception:
+        await email_throttle.release(
+            kind=EmailCodeKind.FORGOT_PASSWORD, email=user.email, cache=cache
+        )
+        raise
 
-    send_plain_message_to_email(
-        subject="Resetting password",
-        email_address=user.email,
-        body=updated_user.tokens.forgot_password_token,
-        background_tasks=background_tasks,
-    )
     logger.info(
-        "Background task scheduled for sending forgot password token. %s",
+        "Forgot password token queued for sending. %s",
         user,
     )
 
@@ -281,10 +330,14 @@ async def change_password_endpoint(
 ):
     logger.info("Attempt to change password")
     forgot_password_token = forgot_password_token.lower().strip()
-    user = await get_user_by_forgot_password_token(
-        forgot_password_token=forgot_password_token,
-        session=session,
-        load_tokens=True,
+    username = await email_code_store.pop(
+        kind=EmailCodeKind.FORGOT_PASSWORD,
+        code=forgot_password_token,
+    )
+    user = (
+        await get_user_by_username_or_email(username=username, session=session)
+        if username is not None
+        else None
     )
     if user is None:
         logger.warning(
@@ -304,12 +357,7 @@ async def change_password_endpoint(
         )
         raise InactiveUser()
 
-    token_exp = user.tokens.forgot_password_token_exp
-    if token_exp is None or token_exp < datetime.datetime.now(datetime.UTC):
-        logger.warning("Attempt to change password failed. Token expired or invalid")
-        raise InvalidChangePasswordCode()
-
-    new_hashed_password = hash_password(password=new_password)
+    new_hashed_password = await hash_password_async(password=new_password)
     await change_user_password(
         user=user,
         new_hashed_password=new_hashed_password,
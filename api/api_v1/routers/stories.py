@@ -1,33 +1,53 @@
-from fastapi import APIRouter, Depends, Form
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, Form, Query
+from redis.asyncio import Redis
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
+from starlette.responses import Response
 
 from api.api_v1.dependencies.auth import (
     get_user_from_access_token,
     get_user_from_access_token_with_stories,
 )
 from api.api_v1.dependencies.database.db_helper import db_helper
+from api.api_v1.dependencies.database.redis_helper import redis_helper
 from api.api_v1.dependencies.stories import (
     get_story_by_uuid_dependency,
     get_story_by_uuid_dependency_with_likers,
 )
-from api.api_v1.exceptions.http_exceptions import ManageOtherStories
+from api.api_v1.exceptions.http_exceptions import ManageOtherStories, StoryNotFound
 from api.api_v1.schemas.auth_responses import StatusSuccessResponse
 from api.api_v1.schemas.story import StoryScheme, StoryDetailScheme
+from api.api_v1.utils.cache import (
+    get_cached_stories_page,
+    get_feed_version,
+    acquire_feed_fill_lock,
+    fill_stories_feed,
+    add_story_to_feed,
+    update_story_in_feed,
+    remove_story_from_feed,
+)
 from api.api_v1.utils.database import (
-    get_stories,
+    get_story_list_items,
     get_stories_by_name_or_text,
     create_story,
     edit_story,
     delete_story,
     like_story,
 )
+from api.api_v1.utils.json_response import model_json_response
+from api.api_v1.utils.statement_timeout import StatementTimeout
+from api.api_v1.utils.story_cache import story_detail_cache
 from core.config import settings
 from core.models import Story, User
 
 stories_router = APIRouter(
     prefix=settings.stories_router.prefix,
     tags=settings.stories_router.tags,
+    dependencies=[
+        Depends(StatementTimeout(settings.stories_router.statement_timeout_ms))
+    ],
 )
 
 
@@ -38,33 +58,65 @@ stories_router = APIRouter(
 )
 async def get_stories_endpoint(
     session: AsyncSession = Depends(db_helper.get_session),
-    page: int = 1,
+    cache: Redis = Depends(redis_helper.get_redis),
+    page: int = Query(default=1, ge=1),
 ):
-    stories = await get_stories(
+    per_page = settings.stories_router.stories_per_page
+    cached_stories = await get_cached_stories_page(page=page, cache=cache)
+    if cached_stories is not None:
+        # в кэше уже лежит сериализованный StoryScheme, собираем из него
+        # ответ без повторной валидации
+        return Response(
+            content=b"[" + b",".join(cached_stories) + b"]",
+            media_type="application/json",
+        )
+
+    if page * per_page <= settings.stories_cache.feed_max_size and (
+        await acquire_feed_fill_lock(cache=cache)
+    ):
+        # версия читается до запроса в БД, чтобы изменения ленты во время
+        # чтения не перезаписались устаревшим снимком
+        version = await get_feed_version(cache=cache)
+        feed_stories = await get_story_list_items(
+            session=session,
+            page=1,
+            per_page=settings.stories_cache.feed_max_size,
+        )
+        if version is not None:
+            await fill_stories_feed(stories=feed_stories, version=version, cache=cache)
+        start = (page - 1) * per_page
+        return model_json_response(
+            content=feed_stories[start : start + per_page],
+            response_model=list[StoryScheme],
+        )
+
+    stories = await get_story_list_items(
         session=session,
         page=page,
-        load_author=True,
+        per_page=per_page,
     )
-    return stories
+    return model_json_response(content=stories, response_model=list[StoryScheme])
 
 
 @stories_router.get(
     settings.stories_router.get_stories_by_name_or_text_endpoint_path,
     response_model=list[StoryScheme],
     status_code=status.HTTP_200_OK,
+    dependencies=[
+        Depends(StatementTimeout(settings.stories_router.search_statement_timeout_ms))
+    ],
 )
 async def get_stories_by_name_or_text_endpoint(
     query: str,
     session: AsyncSession = Depends(db_helper.get_session),
-    page: int = 1,
+    page: int = Query(default=1, ge=1),
 ):
     stories = await get_stories_by_name_or_text(
         query=query,
         session=session,
         page=page,
-        load_author=True,
     )
-    return stories
+    return model_json_response(content=stories, response_model=list[StoryScheme])
 
 
 @stories_router.get(
@@ -73,9 +125,13 @@ async def get_stories_by_name_or_text_endpoint(
     status_code=status.HTTP_200_OK,
 )
 async def get_story_endpoint(
-    story: Story = Depends(get_story_by_uuid_dependency),
+    story_uuid: UUID,
+    cache: Redis = Depends(redis_helper.get_redis),
 ):
-    return story
+    payload = await story_detail_cache.get(story_uuid=story_uuid, cache=cache)
+    if payload is None:
+        raise StoryNotFound()
+    return Response(content=payload, media_type="application/json")
 
 
 @stories_router.post(
@@ -88,6 +144,7 @@ async def create_story_endpoint(
     text: str = Form(default=""),
     user: User = Depends(get_user_from_access_token),
     session: AsyncSession = Depends(db_helper.get_session),
+    cache: Redis = Depends(redis_helper.get_redis),
 ):
     new_story = await create_story(
         name=name,
@@ -95,6 +152,7 @@ async def create_story_endpoint(
         author_username=user.username,
         session=session,
     )
+    await add_story_to_feed(story=new_story, cache=cache)
     return new_story
 
 
@@ -109,6 +167,7 @@ async def edit_story_endpoint(
     name: str = Form(default=""),
     text: str = Form(default=""),
     user: User = Depends(get_user_from_access_token_with_stories),
+    cache: Redis = Depends(redis_helper.get_redis),
 ):
     if story not in user.stories:
         raise ManageOtherStories()
@@ -118,6 +177,8 @@ async def edit_story_endpoint(
         story=story,
         session=session,
     )
+    await update_story_in_feed(story=edited_story, cache=cache)
+    await story_detail_cache.invalidate(story_uuid=edited_story.id, cache=cache)
     return edited_story
 
 
@@ -130,13 +191,17 @@ async def delete_story_endpoint(
     story: Story = Depends(get_story_by_uuid_dependency),
     session: AsyncSession = Depends(db_helper.get_session),
     user: User = Depends(get_user_from_access_token_with_stories),
+    cache: Redis = Depends(redis_helper.get_redis),
 ):
     if story not in user.stories:
         raise ManageOtherStories()
+    story_id = story.id
     await delete_story(
         story=story,
         session=session,
     )
+    await remove_story_from_feed(story_id=story_id, cache=cache)
+    await story_detail_cache.invalidate(story_uuid=story_id, cache=cache)
     return StatusSuccessResponse()
 
 
@@ -149,10 +214,13 @@ async def like_story_endpoint(
     story: Story = Depends(get_story_by_uuid_dependency_with_likers),
     session: AsyncSession = Depends(db_helper.get_session),
     user: User = Depends(get_user_from_access_token),
+    cache: Redis = Depends(redis_helper.get_redis),
 ):
     liked_story = await like_story(
         story=story,
         user=user,
         session=session,
     )
+    await update_story_in_feed(story=liked_story, cache=cache)
+    await story_detail_cache.invalidate(story_uuid=liked_story.id, cache=cache)
     return liked_story
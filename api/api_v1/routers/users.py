@@ -1,9 +1,9 @@
 from pathlib import Path
 
-from fastapi import APIRouter, Depends, Form, UploadFile
+from fastapi import APIRouter, Depends, Form, Header, UploadFile, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
-from starlette.responses import FileResponse
+from starlette.responses import Response
 
 from api.api_v1.dependencies.auth import (
     get_user_from_access_token_with_liked_stories,
@@ -15,17 +15,39 @@ from api.api_v1.dependencies.users import (
     get_avatar_path,
     validate_avatar,
 )
-from api.api_v1.exceptions.http_exceptions import InvalidAvatarFormat
+from api.api_v1.exceptions.http_exceptions import (
+    AvatarNotFound,
+    InvalidAvatarFormat,
+    TooManyUsernames,
+)
 from api.api_v1.schemas.story import StoryScheme
-from api.api_v1.schemas.user import UserWithStoriesScheme, CurrentUserScheme
-from api.api_v1.utils.database import update_user
-from api.api_v1.utils.files import save_avatar, delete_avatar
+from api.api_v1.schemas.user import (
+    UserWithStoriesScheme,
+    CurrentUserScheme,
+    AvatarMetadataScheme,
+)
+from api.api_v1.utils.avatar_storage import avatar_storage
+from api.api_v1.utils.cache_invalidation import avatar_path_invalidation
+from api.api_v1.utils.database import update_user, get_avatars_metadata
+from api.api_v1.utils.json_response import model_json_response
+from api.api_v1.utils.files import (
+    save_avatar,
+    delete_avatar,
+    get_avatar_size_and_etag,
+    get_avatar_url,
+    format_etag,
+    is_etag_matching,
+)
+from api.api_v1.utils.statement_timeout import StatementTimeout
 from core.config import settings
 from core.models import User
 
 users_router = APIRouter(
     prefix=settings.users_router.prefix,
     tags=settings.users_router.tags,
+    dependencies=[
+        Depends(StatementTimeout(settings.users_router.statement_timeout_ms))
+    ],
 )
 
 
@@ -37,7 +59,7 @@ users_router = APIRouter(
 async def get_profile_endpoint(
     user: User = Depends(get_user_from_access_token_with_stories),
 ):
-    return user
+    return model_json_response(content=user, response_model=CurrentUserScheme)
 
 
 @users_router.get(
@@ -48,7 +70,10 @@ async def get_profile_endpoint(
 async def get_liked_stories_endpoint(
     user: User = Depends(get_user_from_access_token_with_liked_stories),
 ):
-    return user.liked_stories
+    return model_json_response(
+        content=user.liked_stories,
+        response_model=list[StoryScheme],
+    )
 
 
 @users_router.get(
@@ -59,7 +84,7 @@ async def get_liked_stories_endpoint(
 async def get_user_endpoint(
     user: User = Depends(get_user_by_username_with_stories),
 ):
-    return user
+    return model_json_response(content=user, response_model=UserWithStoriesScheme)
 
 
 @users_router.patch(
@@ -74,8 +99,13 @@ async def edit_profile_endpoint(
     session: AsyncSession = Depends(db_helper.get_session),
 ):
     new_avatar_name = None
+    new_avatar_size = None
+    new_avatar_etag = None
 
     if avatar:
+        new_avatar_size, new_avatar_etag = await get_avatar_size_and_etag(
+            avatar=avatar,
+        )
         new_avatar_name = await save_avatar(
             avatar=avatar,
             username=user.username,
@@ -98,6 +128,8 @@ async def edit_profile_endpoint(
     updated_user = await update_user(
         bio=bio,
         avatar_name=new_avatar_name,
+        avatar_size=new_avatar_size,
+        avatar_etag=new_avatar_etag,
         user=user,
         session=session,
     )
@@ -109,7 +141,54 @@ async def edit_profile_endpoint(
     settings.users_router.get_avatar_endpoint_path,
     status_code=status.HTTP_200_OK,
 )
-async def get_avatar_endpoint(avatar_path: Path = Depends(get_avatar_path)):
-    avatar_extension = Path(avatar_path).suffix.lower()
-    media_type = settings.avatar.allowed_extensions_to_mime[avatar_extension]
-    return FileResponse(avatar_path, media_type=media_type)
+async def get_avatar_endpoint(
+    username: str,
+    avatar: tuple[str, str, str | None] = Depends(get_avatar_path),
+    if_none_match: str | None = Header(default=None),
+):
+    avatar_name, media_type, avatar_etag = avatar
+    headers = {"Cache-Control": settings.avatar.cache_control}
+    if avatar_etag is not None:
+        headers["ETag"] = format_etag(avatar_etag)
+        if is_etag_matching(if_none_match=if_none_match, etag=avatar_etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    try:
+        response = await avatar_storage.get_avatar_response(
+            avatar_name=avatar_name,
+            media_type=media_type,
+        )
+    except FileNotFoundError:
+        # в кэше осталось имя уже удаленного файла
+        await avatar_path_invalidation.invalidate(username)
+        raise AvatarNotFound()
+    response.headers.update(headers)
+    return response
+
+
+@users_router.get(
+    settings.users_router.get_avatars_metadata_endpoint_path,
+    response_model=list[AvatarMetadataScheme],
+    status_code=status.HTTP_200_OK,
+)
+async def get_avatars_metadata_endpoint(
+    usernames: list[str] = Query(),
+    session: AsyncSession = Depends(db_helper.get_session),
+):
+    usernames = list(dict.fromkeys(usernames))
+    if len(usernames) > settings.avatar.batch_max_usernames:
+        raise TooManyUsernames()
+
+    avatars_metadata = await get_avatars_metadata(
+        usernames=usernames,
+        session=session,
+    )
+    return [
+        AvatarMetadataScheme(
+            username=username,
+            avatar_url=get_avatar_url(username=username) if avatar_name else None,
+            etag=avatar_etag if avatar_name else None,
+            size=avatar_size if avatar_name else None,
+        )
+        for username, avatar_name, avatar_size, avatar_etag in avatars_metadata
+    ]
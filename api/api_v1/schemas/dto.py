@@ -0,0 +1,38 @@
+import datetime
+from uuid import UUID
+
+
+class StoryListItem:
+    __slots__ = ("id", "name", "likes_number", "created_at", "author_username")
+
+    def __init__(
+        self,
+        id: UUID,  # noqa
+        name: str,
+        likes_number: int,
+        created_at: datetime.datetime,
+        author_username: str,
+    ):
+        self.id: UUID = id
+        self.name: str = name
+        self.likes_number: int = likes_number
+        self.created_at: datetime.datetime = created_at
+        self.author_username: str = author_username
+
+
+class UserListItem:
+    __slots__ = ("username", "is_active", "role", "registered_at", "avatar_name")
+
+    def __init__(
+        self,
+        username: str,
+        is_active: bool,
+        role: str,
+        registered_at: datetime.datetime,
+        avatar_name: str | None,
+    ):
+        self.username: str = username
+        self.is_active: bool = is_active
+        self.role: str = role
+        self.registered_at: datetime.datetime = registered_at
+        self.avatar_name: str | None = avatar_name
@@ -0,0 +1,16 @@
+import uuid
+
+from pydantic import BaseModel, Field
+
+
+class OutboxEmailScheme(BaseModel):
+    id: str = Field(default_factory=lambda: uuid.uuid4().hex)
+    recipient: str
+    subject: str
+    body: str
+    attempts: int = 0
+    last_error: str | None = None
+
+    @property
+    def domain(self) -> str:
+        return self.recipient.rpartition("@")[2].lower()
@@ -0,0 +1,14 @@
+from typing import Literal
+
+from pydantic import BaseModel
+
+
+class HealthCheckScheme(BaseModel):
+    status: Literal["ok", "fail"]
+    latency_ms: float | None = None
+    detail: str | None = None
+
+
+class ReadinessScheme(BaseModel):
+    status: Literal["ok", "fail"]
+    checks: dict[str, HealthCheckScheme]
@@ -13,6 +13,13 @@ class UserScheme(BaseModel):
     avatar_name: str | None = None
 
 
+class AvatarMetadataScheme(BaseModel):
+    username: str
+    avatar_url: str | None = None
+    etag: str | None = None
+    size: int | None = None
+
+
 class UserWithStoriesScheme(UserScheme):
     bio: str | None = None
     stories: list[StoryScheme]
@@ -0,0 +1,72 @@
+from typing import Literal
+
+from api.api_v1.utils.loop_monitor import event_loop_monitor
+from api.api_v1.utils.metrics import get_db_pool_wait
+from core.config import settings, AdmissionConfig
+
+Priority = Literal["critical", "normal", "low"]
+
+
+def get_default_critical_paths() -> list[str]:
+    return [
+        settings.health.prefix,
+        settings.metrics.path,
+        settings.main_router.prefix
+        + settings.v1_router.prefix
+        + settings.auth_router.prefix
+        + settings.auth_router.refresh_endpoint_path,
+    ]
+
+
+def get_default_low_priority_paths() -> list[str]:
+    return [
+        settings.main_router.prefix
+        + settings.v1_router.prefix
+        + settings.stories_router.prefix
+        + settings.stories_router.get_stories_by_name_or_text_endpoint_path,
+    ]
+
+
+class AdmissionController:
+    def __init__(self, config: AdmissionConfig):
+        self.config: AdmissionConfig = config
+        self.critical_paths: list[str] = (
+            config.critical_paths
+            if config.critical_paths is not None
+            else get_default_critical_paths()
+        )
+        self.low_priority_paths: list[str] = (
+            config.low_priority_paths
+            if config.low_priority_paths is not None
+            else get_default_low_priority_paths()
+        )
+        self.in_flight: int = 0
+
+    def get_priority(self, path: str) -> Priority:
+        if any(path.startswith(prefix) for prefix in self.critical_paths):
+            return "critical"
+        if any(path.startswith(prefix) for prefix in self.low_priority_paths):
+            return "low"
+        return "normal"
+
+    def get_overload_reason(self, ratio: float = 1) -> str | None:
+        if self.in_flight >= self.config.max_in_flight * ratio:
+            return "in_flight"
+        if get_db_pool_wait() * 1000 > self.config.max_db_pool_wait_ms * ratio:
+            return "db_pool_wait"
+        lag_ms = event_loop_monitor.last_lag_seconds * 1000
+        if lag_ms > self.config.max_event_loop_lag_ms * ratio:
+            return "event_loop_lag"
+        return None
+
+    def check(self, path: str) -> tuple[Priority, str | None]:
+        priority = self.get_priority(path)
+        if priority == "critical":
+            return priority, None
+        ratio = self.config.low_priority_ratio if priority == "low" else 1
+        return priority, self.get_overload_reason(ratio)
+
+
+admission_controller: AdmissionController = AdmissionController(
+    config=settings.admission
+)
@@ -0,0 +1,179 @@
+import asyncio
+from abc import ABC, abstractmethod
+from contextlib import AsyncExitStack
+from pathlib import Path
+from typing import Any
+from urllib.parse import quote
+
+import aiofiles
+import aiofiles.os
+from starlette import status
+from starlette.responses import FileResponse, RedirectResponse, Response
+
+from api.api_v1.dependencies.log_helper import LogHelper
+from core.config import settings, AvatarS3Config
+
+logger = LogHelper.get_app_logger()
+
+
+class AvatarStorage(ABC):
+    @abstractmethod
+    async def save(self, avatar_name: str, content: bytes, media_type: str) -> None:
+        pass
+
+    @abstractmethod
+    async def delete(self, avatar_name: str) -> None:
+        pass
+
+    @abstractmethod
+    async def exists(self, avatar_name: str) -> bool:
+        pass
+
+    @abstractmethod
+    async def get_avatar_response(self, avatar_name: str, media_type: str) -> Response:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+
+class LocalAvatarStorage(AvatarStorage):
+    def __init__(
+        self,
+        avatars_dir: Path,
+        x_accel_redirect_location: str | None = None,
+    ):
+        self.avatars_dir: Path = avatars_dir
+        self.x_accel_redirect_location: str | None = x_accel_redirect_location
+
+    def get_path(self, avatar_name: str) -> Path:
+        return self.avatars_dir / avatar_name
+
+    async def save(self, avatar_name: str, content: bytes, media_type: str) -> None:
+        async with aiofiles.open(self.get_path(avatar_name), "wb") as file:
+            await file.write(content)
+
+    async def delete(self, avatar_name: str) -> None:
+        avatar_path = self.get_path(avatar_name)
+        if await aiofiles.os.path.exists(avatar_path):
+            await aiofiles.os.remove(avatar_path)
+
+    async def exists(self, avatar_name: str) -> bool:
+        return await aiofiles.os.path.exists(self.get_path(avatar_name))
+
+    async def get_avatar_response(self, avatar_name: str, media_type: str) -> Response:
+        if self.x_accel_redirect_location is not None:
+            # файл отдаст nginx через internal location, приложение только
+            # проверяет доступ и указывает, какой файл нужно отдать
+            return Response(
+                media_type=media_type,
+                headers={
+                    "X-Accel-Redirect": self.x_accel_redirect_location
+                    + quote(avatar_name)
+                },
+            )
+        # FileResponse все равно делает stat, но так пропавший файл виден сразу
+        # как FileNotFoundError, а не как ошибка уже во время отправки ответа
+        avatar_path = self.get_path(avatar_name)
+        stat_result = await aiofiles.os.stat(avatar_path)
+        return FileResponse(avatar_path, media_type=media_type, stat_result=stat_result)
+
+
+class S3AvatarStorage(AvatarStorage):
+    def __init__(self, config: AvatarS3Config):
+        self.config: AvatarS3Config = config
+        self._client: Any = None
+        self._client_lock: asyncio.Lock = asyncio.Lock()
+        self._exit_stack: AsyncExitStack = AsyncExitStack()
+
+    def get_key(self, avatar_name: str) -> str:
+        return self.config.key_prefix + avatar_name
+
+    async def _get_client(self) -> Any:
+        if self._client is not None:
+            return self._client
+        async with self._client_lock:
+            if self._client is None:
+                # aiobotocore ставится только вместе с extra "s3",
+                # поэтому импортируем его лишь тогда, когда бэкенд реально используется
+                from aiobotocore.session import get_session
+
+                logger.debug(
+                    "Creating S3 client. Endpoint=%r, Bucket=%r",
+                    self.config.endpoint_url,
+                    self.config.bucket,
+                )
+                self._client = await self._exit_stack.enter_async_context(
+                    get_session().create_client(
+                        "s3",
+                        endpoint_url=self.config.endpoint_url,
+                        region_name=self.config.region_name,
+                        aws_access_key_id=self.config.access_key_id,
+                        aws_secret_access_key=self.config.secret_access_key,
+                    )
+                )
+        return self._client
+
+    async def save(self, avatar_name: str, content: bytes, media_type: str) -> None:
+        client = await self._get_client()
+        await client.put_object(
+            Bucket=self.config.bucket,
+            Key=self.get_key(avatar_name),
+            Body=content,
+            ContentType=media_type,
+        )
+
+    async def delete(self, avatar_name: str) -> None:
+        client = await self._get_client()
+        await client.delete_object(
+            Bucket=self.config.bucket,
+            Key=self.get_key(avatar_name),
+        )
+
+    async def exists(self, avatar_name: str) -> bool:
+        from botocore.exceptions import ClientError
+
+        client = await self._get_client()
+        try:
+            await client.head_object(
+                Bucket=self.config.bucket,
+                Key=self.get_key(avatar_name),
+            )
+        except ClientError as exc:
+            if exc.response.get("Error", {}).get("Code") in {"404", "NoSuchKey"}:
+                return False
+            raise
+        return True
+
+    async def get_avatar_response(self, avatar_name: str, media_type: str) -> Response:
+        client = await self._get_client()
+        url = await client.generate_presigned_url(
+            "get_object",
+            Params={
+                "Bucket": self.config.bucket,
+                "Key": self.get_key(avatar_name),
+                "ResponseContentType": media_type,
+            },
+            ExpiresIn=self.config.presigned_url_expire_seconds,
+        )
+        return RedirectResponse(url=url, status_code=status.HTTP_307_TEMPORARY_REDIRECT)
+
+    async def close(self) -> None:
+        await self._exit_stack.aclose()
+        self._client = None
+
+
+def create_avatar_storage() -> AvatarStorage:
+    if settings.avatar.storage == "s3":
+        return S3AvatarStorage(config=settings.avatar.s3)
+    return LocalAvatarStorage(
+        avatars_dir=settings.avatar.avatars_dir,
+        x_accel_redirect_location=(
+            settings.avatar.x_accel_redirect_location
+            if settings.avatar.x_accel_redirect
+            else None
+        ),
+    )
+
+
+avatar_storage: AvatarStorage = create_avatar_storage()
@@ -1,9 +1,41 @@
+import functools
+from collections.abc import Sequence
+from typing import Any, Callable
+from uuid import UUID
+
 from api.api_v1.dependencies.log_helper import LogHelper
 from api.api_v1.exceptions.http_exceptions import InvalidJWT
+from api.api_v1.schemas.dto import StoryListItem
+from api.api_v1.schemas.story import StoryScheme
 from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from core.config import settings
+from core.models import Story
 
 logger = LogHelper.get_app_logger()
 
+# снимок из БД дописывается в ленту, только если версия ленты не изменилась
+# с момента чтения: иначе параллельное добавление или удаление истории было бы
+# перезаписано устаревшими данными. Ничего не удаляется - лишнее срезается
+# по размеру ленты, а удаленные истории уже убраны remove_story_from_feed
+FILL_FEED_SCRIPT = """
+if (redis.call('GET', KEYS[3]) or '0') ~= ARGV[1] then
+    return 0
+end
+local ttl = tonumber(ARGV[2])
+for i = 6, #ARGV, 3 do
+    redis.call('ZADD', KEYS[1], ARGV[i + 1], ARGV[i])
+    redis.call('SET', ARGV[5] .. ARGV[i], ARGV[i + 2], 'EX', ttl)
+end
+redis.call('ZREMRANGEBYRANK', KEYS[1], 0, -tonumber(ARGV[3]) - 1)
+redis.call('EXPIRE', KEYS[1], ttl)
+if ARGV[4] == '1' then
+    redis.call('SET', KEYS[2], '', 'EX', ttl)
+end
+return 1
+"""
+
 
 async def add_token_to_blacklist(
     payload: dict,
@@ -37,3 +69,159 @@ async def add_token_to_blacklist(
 async def is_token_in_blacklist(jti: str, cache: Redis) -> bool:
     jti = await cache.get(jti)
     return True if jti is not None else False
+
+
+def _fallback_on_redis_error(default: Any = None):
+    # лента - только кэш: без Redis страницы читаются из БД, а изменения ленты
+    # пропускаются, потому что запись в БД уже сохранена
+    def inner(func: Callable) -> Callable:
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            try:
+                return await func(*args, **kwargs)
+            except RedisError as exc:
+                logger.warning(
+                    "RedisError occurred in %s, stories feed cache skipped. Error: %r",
+                    func.__name__,
+                    exc,
+                )
+                return default
+
+        return wrapper
+
+    return inner
+
+
+def _get_feed_story_key(story_id: UUID | str | bytes) -> str:
+    if isinstance(story_id, bytes):
+        story_id = story_id.decode()
+    return f"{settings.stories_cache.story_key_prefix}{story_id}"
+
+
+def _serialize_feed_story(story: Story | StoryListItem) -> str:
+    return StoryScheme.model_validate(story, from_attributes=True).model_dump_json()
+
+
+@_fallback_on_redis_error()
+async def get_cached_stories_page(
+    page: int,
+    cache: Redis,
+    per_page: int = settings.stories_router.stories_per_page,
+) -> list[bytes] | None:
+    # в ленте всегда лежат самые новые истории без пропусков, поэтому
+    # полная страница из sorted set совпадает с тем, что вернула бы БД
+    start = (page - 1) * per_page
+    story_ids = await cache.zrevrange(
+        settings.stories_cache.feed_key,
+        start,
+        start + per_page - 1,
+    )
+    if len(story_ids) < per_page and not await cache.exists(
+        settings.stories_cache.feed_complete_key
+    ):
+        return None
+    if not story_ids:
+        return []
+    payloads = await cache.mget(
+        [_get_feed_story_key(story_id) for story_id in story_ids]
+    )
+    if any(payload is None for payload in payloads):
+        return None
+    return payloads
+
+
+@_fallback_on_redis_error()
+async def get_feed_version(cache: Redis) -> int | None:
+    version = await cache.get(settings.stories_cache.feed_version_key)
+    return int(version or 0)
+
+
+@_fallback_on_redis_error(default=False)
+async def acquire_feed_fill_lock(cache: Redis) -> bool:
+    # ленту из БД заполняет один запрос, остальные промахи читают свою страницу
+    # напрямую. Блокировка не снимается, а истекает: ключ короткоживущий
+    is_locked = await cache.set(
+        settings.stories_cache.feed_lock_key,
+        "",
+        nx=True,
+        ex=settings.stories_cache.feed_lock_seconds,
+    )
+    return bool(is_locked)
+
+
+@_fallback_on_redis_error(default=False)
+async def fill_stories_feed(
+    stories: Sequence[Story | StoryListItem],
+    version: int,
+    cache: Redis,
+) -> bool:
+    # version - значение get_feed_version до чтения stories из БД. Если лента
+    # с тех пор менялась, снимок мог устареть, и заполнение пропускается
+    logger.debug("Filling stories feed cache. Stories=%s", len(stories))
+    story_args = []
+    for story in stories:
+        story_args.extend(
+            (
+                str(story.id),
+                story.created_at.timestamp(),
+                _serialize_feed_story(story),
+            )
+        )
+    is_filled = await cache.eval(  # pyright: ignore
+        FILL_FEED_SCRIPT,
+        3,
+        settings.stories_cache.feed_key,
+        settings.stories_cache.feed_complete_key,
+        settings.stories_cache.feed_version_key,
+        version,
+        settings.stories_cache.ttl_seconds,
+        settings.stories_cache.feed_max_size,
+        # в ленту поместились все истории, короткая страница - это ее конец
+        int(len(stories) < settings.stories_cache.feed_max_size),
+        settings.stories_cache.story_key_prefix,
+        *story_args,
+    )
+    if not is_filled:
+        logger.debug("Stories feed changed during fill, snapshot skipped")
+    return bool(is_filled)
+
+
+@_fallback_on_redis_error()
+async def add_story_to_feed(story: Story, cache: Redis) -> None:
+    feed_key = settings.stories_cache.feed_key
+    async with cache.pipeline(transaction=True) as pipe:
+        pipe.incr(settings.stories_cache.feed_version_key)
+        pipe.zadd(feed_key, {str(story.id): story.created_at.timestamp()})
+        pipe.set(
+            _get_feed_story_key(story.id),
+            _serialize_feed_story(story),
+            ex=settings.stories_cache.ttl_seconds,
+        )
+        pipe.zremrangebyrank(feed_key, 0, -settings.stories_cache.feed_max_size - 1)
+        *_, trimmed = await pipe.execute()
+    if trimmed:
+        await cache.delete(settings.stories_cache.feed_complete_key)
+
+
+@_fallback_on_redis_error()
+async def update_story_in_feed(story: Story, cache: Redis) -> None:
+    async with cache.pipeline(transaction=True) as pipe:
+        pipe.incr(settings.stories_cache.feed_version_key)
+        # xx=True: обновляем только истории, которые уже есть в ленте,
+        # иначе старая история попала бы в кэш в обход порядка ленты
+        pipe.set(
+            _get_feed_story_key(story.id),
+            _serialize_feed_story(story),
+            ex=settings.stories_cache.ttl_seconds,
+            xx=True,
+        )
+        await pipe.execute()
+
+
+@_fallback_on_redis_error()
+async def remove_story_from_feed(story_id: UUID, cache: Redis) -> None:
+    async with cache.pipeline(transaction=True) as pipe:
+        pipe.incr(settings.stories_cache.feed_version_key)
+        pipe.zrem(settings.stories_cache.feed_key, str(story_id))
+        pipe.delete(_get_feed_story_key(story_id))
+        await pipe.execute()
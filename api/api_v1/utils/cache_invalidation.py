@@ -0,0 +1,81 @@
+import asyncio
+from collections.abc import Hashable
+
+from redis.exceptions import RedisError
+
+from api.api_v1.dependencies.database.redis_helper import RedisHelper, redis_helper
+from api.api_v1.dependencies.log_helper import LogHelper
+from api.api_v1.utils.memory_cache import TTLLRUCache, avatar_path_cache
+from core.config import settings
+
+logger = LogHelper.get_app_logger()
+
+
+class CacheInvalidation:
+    # кэш в памяти есть у каждого воркера, поэтому сброс ключа рассылается
+    # через Redis pub/sub всем воркерам, а не только тому, что обработал запись
+    def __init__(
+        self,
+        cache: TTLLRUCache,
+        channel: str,
+        redis_helper: RedisHelper,
+        reconnect_seconds: float = 1,
+    ):
+        self.cache: TTLLRUCache = cache
+        self.channel: str = channel
+        self.redis_helper: RedisHelper = redis_helper
+        self.reconnect_seconds: float = reconnect_seconds
+        self._task: asyncio.Task[None] | None = None
+
+    async def invalidate(self, key: str) -> None:
+        self.cache.invalidate(key)
+        try:
+            await self.redis_helper.get_redis().publish(self.channel, key)
+        except RedisError as exc:
+            # остальные воркеры увидят изменение не позже истечения TTL
+            logger.warning(
+                "Cache invalidation broadcast failed. Channel=%s Key=%r Exception=%r",
+                self.channel,
+                key,
+                exc,
+            )
+
+    def _on_message(self, key: Hashable) -> None:
+        if isinstance(key, bytes):
+            key = key.decode()
+        self.cache.invalidate(key)
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                async with self.redis_helper.get_redis().pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    # пока подписки не было, сообщения могли потеряться
+                    self.cache.clear()
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self._on_message(message["data"])
+            except RedisError as exc:
+                logger.warning(
+                    "Cache invalidation subscription lost. Channel=%s Exception=%r",
+                    self.channel,
+                    exc,
+                )
+            await asyncio.sleep(self.reconnect_seconds)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+avatar_path_invalidation: CacheInvalidation = CacheInvalidation(
+    cache=avatar_path_cache,
+    channel=settings.avatar.path_cache_invalidation_channel,
+    redis_helper=redis_helper,
+)
@@ -1,17 +1,18 @@
-import datetime
 import functools
 import inspect
 from typing import Callable, Sequence
 from uuid import UUID
 
 from pydantic import EmailStr
-from sqlalchemy import select, or_
+from sqlalchemy import select, or_, any_, bindparam, String, Row
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.orm import joinedload, selectinload, defer
 
 from api.api_v1.dependencies.log_helper import LogHelper
-from core.config import settings
+from api.api_v1.schemas.dto import StoryListItem, UserListItem
+from api.api_v1.utils.cache_invalidation import avatar_path_invalidation
 from core.models import User, Token, Story
 from core.models.user import Role
 
@@ -95,72 +96,6 @@ async def get_user_by_username_or_email(
     return user
 
 
-async def get_user_by_email_verification_token(
-    email_verification_token: str,
-    session: AsyncSession,
-    load_tokens: bool = False,
-    load_stories: bool = False,
-    load_liked_stories: bool = False,
-) -> User | None:
-    logger.debug(
-        "Searching for user by email verification token. Loading relations: Tokens=%s, Stories=%s, Liked Stories=%s",
-        load_tokens,
-        load_stories,
-        load_liked_stories,
-    )
-    stmt = (
-        select(User)
-        .join(User.tokens)
-        .where(Token.email_verification_token == email_verification_token)
-    )
-    if load_tokens:
-        stmt = stmt.options(joinedload(User.tokens))
-    if load_stories:
-        stmt = stmt.options(selectinload(User.stories))
-    if load_liked_stories:
-        stmt = stmt.options(selectinload(User.liked_stories))
-    result = await session.execute(stmt)
-    user = result.scalar_one_or_none()
-    if user:
-        logger.debug("Found user. %s", user)
-    else:
-        logger.debug("User not found")
-    return user
-
-
-async def get_user_by_forgot_password_token(
-    forgot_password_token: str,
-    session: AsyncSession,
-    load_tokens: bool = False,
-    load_stories: bool = False,
-    load_liked_stories: bool = False,
-) -> User | None:
-    logger.debug(
-        "Searching for user by forgot password token. Loading relations: Tokens=%s, Stories=%s, Liked Stories=%s",
-        load_tokens,
-        load_stories,
-        load_liked_stories,
-    )
-    stmt = (
-        select(User)
-        .join(User.tokens)
-        .where(Token.forgot_password_token == forgot_password_token)
-    )
-    if load_tokens:
-        stmt = stmt.options(joinedload(User.tokens))
-    if load_stories:
-        stmt = stmt.options(selectinload(User.stories))
-    if load_liked_stories:
-        stmt = stmt.options(selectinload(User.liked_stories))
-    result = await session.execute(stmt)
-    user = result.scalar_one_or_none()
-    if user:
-        logger.debug("Found user. %s", user)
-    else:
-        logger.debug("User not found")
-    return user
-
-
 @_rollback_if_db_exception()
 async def create_user_with_tokens(
     username: str,
@@ -185,31 +120,6 @@ async def create_user_with_tokens(
     logger.debug("User created successfully. %s", new_user)
 
 
-@_rollback_if_db_exception()
-async def update_user_email_verification_token(
-    user: User,
-    email_verification_token: str,
-    session: AsyncSession,
-    expire_minutes: int = settings.email_tokens.email_verification_token_exp_minutes,
-) -> User:
-    logger.debug(
-        "Updating user's email verification token. %s",
-        user,
-    )
-    email_verification_token_exp = datetime.datetime.now(
-        datetime.UTC
-    ) + datetime.timedelta(minutes=expire_minutes)
-    user.tokens.email_verification_token = email_verification_token
-    user.tokens.email_verification_token_exp = email_verification_token_exp
-    await session.commit()
-    await session.refresh(user)
-    logger.debug(
-        "User's email verification token updated successfully. %s",
-        user,
-    )
-    return user
-
-
 @_rollback_if_db_exception()
 async def confirm_user_email(
     user: User,
@@ -220,8 +130,6 @@ async def confirm_user_email(
         user,
     )
     user.is_email_verified = True
-    user.tokens.email_verification_token = None
-    user.tokens.email_verification_token_exp = None
     await session.commit()
     logger.debug(
         "Email confirmed successfully. %s",
@@ -229,31 +137,6 @@ async def confirm_user_email(
     )
 
 
-@_rollback_if_db_exception()
-async def update_forgot_password_token(
-    user: User,
-    forgot_password_token: str,
-    session: AsyncSession,
-    expire_minutes: int = settings.email_tokens.forgot_password_token_exp_minutes,
-) -> User:
-    logger.debug(
-        "Starting updating forgot password token. %s",
-        user,
-    )
-    forgot_password_token_exp = datetime.datetime.now(
-        datetime.UTC
-    ) + datetime.timedelta(minutes=expire_minutes)
-    user.tokens.forgot_password_token = forgot_password_token
-    user.tokens.forgot_password_token_exp = forgot_password_token_exp
-    await session.commit()
-    await session.refresh(user)
-    logger.debug(
-        "Forgot password token updated successfully. %s",
-        user,
-    )
-    return user
-
-
 @_rollback_if_db_exception()
 async def change_user_password(
     user: User,
@@ -265,8 +148,6 @@ async def change_user_password(
         user,
     )
     user.hashed_password = new_hashed_password
-    user.tokens.forgot_password_token = None
-    user.tokens.forgot_password_token_exp = None
     await session.commit()
     await session.refresh(user)
     logger.debug(
@@ -276,36 +157,20 @@ async def change_user_password(
     return user
 
 
-async def get_stories(
-    session: AsyncSession,
-    load_author: bool = False,
-    load_likers: bool = False,
-    page: int = 1,
-    per_page: int = 20,
-) -> Sequence[Story]:
-    offset = (page - 1) * per_page
-    stmt = select(Story)
-    if load_author:
-        stmt = stmt.options(joinedload(Story.author))
-    if load_likers:
-        stmt = stmt.options(selectinload(Story.likers))
-    result = await session.execute(
-        stmt.order_by(Story.created_at.desc()).offset(offset).limit(per_page)
-    )
-    stories = result.scalars().fetchall()
-    return stories
-
-
 async def get_stories_by_name_or_text(
     query: str,
     session: AsyncSession,
     load_author: bool = False,
     load_likers: bool = False,
+    load_text: bool = False,
     page: int = 1,
     per_page: int = 20,
 ) -> Sequence[Story]:
     offset = (page - 1) * per_page
     stmt = select(Story)
+    if not load_text:
+        # в списках текст истории не отдается, а он самая тяжелая колонка
+        stmt = stmt.options(defer(Story.text, raiseload=True))
     if load_author:
         stmt = stmt.options(joinedload(Story.author))
     if load_likers:
@@ -400,66 +265,73 @@ async def update_user(
     session: AsyncSession,
     bio: str | None = None,
     avatar_name: str | None = None,
+    avatar_size: int | None = None,
+    avatar_etag: str | None = None,
 ) -> User:
     user.bio = bio
     user.avatar_name = avatar_name
+    user.avatar_size = avatar_size
+    user.avatar_etag = avatar_etag
     await session.commit()
+    await avatar_path_invalidation.invalidate(user.username)
     await session.refresh(user)
     return user
 
 
-async def get_active_users(
+async def get_avatars_metadata(
+    usernames: Sequence[str],
+    session: AsyncSession,
+) -> Sequence[Row[tuple[str, str | None, int | None, str | None]]]:
+    stmt = select(
+        User.username,
+        User.avatar_name,
+        User.avatar_size,
+        User.avatar_etag,
+    ).where(
+        # один параметр-массив вместо IN (...) с отдельным параметром на каждое имя
+        User.username
+        == any_(bindparam("usernames", value=list(usernames), type_=ARRAY(String)))
+    )
+    result = await session.execute(stmt)
+    return result.all()
+
+
+# списки только читаются и сразу сериализуются, поэтому выбираем колонки
+# через Core и кладем строки в легкие DTO без identity map и отслеживания
+_story_list_columns = [Story.__table__.c[name] for name in StoryListItem.__slots__]
+_user_list_columns = [User.__table__.c[name] for name in UserListItem.__slots__]
+
+
+async def get_story_list_items(
     session: AsyncSession,
-    load_tokens: bool = False,
-    load_stories: bool = False,
-    load_liked_stories: bool = False,
     page: int = 1,
     per_page: int = 20,
-) -> Sequence[User]:
+) -> list[StoryListItem]:
     offset = (page - 1) * per_page
-    stmt = (
-        select(User)
-        .where(User.is_active)
-        .order_by(User.registered_at.desc())
+    result = await session.execute(
+        select(*_story_list_columns)
+        .order_by(Story.__table__.c.created_at.desc())
         .offset(offset)
         .limit(per_page)
     )
-    if load_tokens:
-        stmt = stmt.options(joinedload(User.tokens))
-    if load_stories:
-        stmt = stmt.options(selectinload(User.stories))
-    if load_liked_stories:
-        stmt = stmt.options(selectinload(User.liked_stories))
-    result = await session.execute(stmt)
-    users = result.scalars().fetchall()
-    return users
+    return [StoryListItem(*row) for row in result]
 
 
-async def get_inactive_users(
+async def get_user_list_items(
     session: AsyncSession,
-    load_tokens: bool = False,
-    load_stories: bool = False,
-    load_liked_stories: bool = False,
+    is_active: bool,
     page: int = 1,
     per_page: int = 20,
-) -> Sequence[User]:
+) -> list[UserListItem]:
     offset = (page - 1) * per_page
-    stmt = (
-        select(User)
-        .where(~User.is_active)
-        .order_by(User.registered_at.desc())
+    result = await session.execute(
+        select(*_user_list_columns)
+        .where(User.__table__.c.is_active.is_(is_active))
+        .order_by(User.__table__.c.registered_at.desc())
         .offset(offset)
         .limit(per_page)
     )
-    if load_tokens:
-        stmt = stmt.options(joinedload(User.tokens))
-    if load_stories:
-        stmt = stmt.options(selectinload(User.stories))
-    if load_liked_stories:
-        stmt = stmt.options(selectinload(User.liked_stories))
-    result = await session.execute(stmt)
-    users = result.scalars().fetchall()
-    return users
+    return [UserListItem(*row) for row in result]
 
 
 @_rollback_if_db_exception()
@@ -1,23 +1,37 @@
-from fastapi import BackgroundTasks
-from fastapi_mail import MessageSchema, MessageType, ConnectionConfig, FastMail
-from pydantic import EmailStr, NameEmail
+from email.headerregistry import Address
+from email.message import EmailMessage
 
-from core.config import settings
+from pydantic import EmailStr
+from redis.asyncio import Redis
 
-smtp_config = ConnectionConfig(**settings.smtp.model_dump())
-fm = FastMail(smtp_config)
+from api.api_v1.schemas.email import OutboxEmailScheme
+from api.api_v1.utils.email_outbox import email_outbox
+from core.config import settings, SmtpConfig
 
 
-def send_plain_message_to_email(
+def build_email_message(
+    email: OutboxEmailScheme,
+    smtp_config: SmtpConfig = settings.smtp,
+) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = Address(
+        display_name=smtp_config.MAIL_FROM_NAME,
+        addr_spec=smtp_config.MAIL_FROM,
+    )
+    message["To"] = email.recipient
+    message["Subject"] = email.subject
+    message.set_content(email.body)
+    return message
+
+
+async def send_plain_message_to_email(
     subject: str,
     email_address: str | EmailStr,
     body: str,
-    background_tasks: BackgroundTasks,
+    cache: Redis,
 ) -> None:
-    message = MessageSchema(
-        subject=subject,
-        recipients=[NameEmail(name=email_address, email=email_address)],
-        body=body,
-        subtype=MessageType.plain,
+    # веб-воркер только кладет письмо в очередь, отправляет его email_worker.py
+    await email_outbox.enqueue(
+        email=OutboxEmailScheme(recipient=email_address, subject=subject, body=body),
+        cache=cache,
     )
-    background_tasks.add_task(fm.send_message, message, None)
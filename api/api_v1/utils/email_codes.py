@@ -0,0 +1,218 @@
+import datetime
+import hashlib
+from abc import ABC, abstractmethod
+
+from sqlalchemy import delete, func, bindparam
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from api.api_v1.dependencies.database.db_helper import db_helper
+from api.api_v1.dependencies.database.redis_helper import RedisHelper, redis_helper
+from api.api_v1.dependencies.log_helper import LogHelper
+from api.api_v1.utils.security import generate_email_token
+from core.config import settings, EmailTokensConfig
+from core.models import EmailCode
+from core.models.email_code import EmailCodeKind
+
+logger = LogHelper.get_app_logger()
+
+# новый код пишется только если такого хеша еще нет, а прежний код пользователя
+# того же вида удаляется, чтобы действовал только последний
+ISSUE_SCRIPT = """
+if not redis.call('SET', KEYS[1], ARGV[1], 'NX', 'EX', ARGV[3]) then
+    return 0
+end
+local old_hash = redis.call('SET', KEYS[2], ARGV[2], 'EX', ARGV[3], 'GET')
+if old_hash and old_hash ~= ARGV[2] then
+    redis.call('DEL', ARGV[4] .. old_hash)
+end
+return 1
+"""
+
+# код одноразовый: GETDEL отдает владельца и сразу удаляет ключ
+POP_SCRIPT = """
+local username = redis.call('GETDEL', KEYS[1])
+if not username then
+    return false
+end
+local user_key = ARGV[1] .. username
+if redis.call('GET', user_key) == ARGV[2] then
+    redis.call('DEL', user_key)
+end
+return username
+"""
+
+
+def hash_code(code: str) -> str:
+    return hashlib.sha256(code.encode()).hexdigest()
+
+
+class EmailCodeStore(ABC):
+    def __init__(self, config: EmailTokensConfig):
+        self.config: EmailTokensConfig = config
+
+    def get_ttl_seconds(self, kind: EmailCodeKind) -> int:
+        if kind == EmailCodeKind.EMAIL_VERIFICATION:
+            return self.config.email_verification_token_exp_minutes * 60
+        return self.config.forgot_password_token_exp_minutes * 60
+
+    async def issue(self, kind: EmailCodeKind, username: str) -> str:
+        ttl_seconds = self.get_ttl_seconds(kind)
+        for _ in range(self.config.issue_attempts):
+            code = generate_email_token()
+            if await self._save(
+                kind=kind,
+                username=username,
+                code_hash=hash_code(code),
+                ttl_seconds=ttl_seconds,
+            ):
+                return code
+            # такой код сейчас действует у другого пользователя
+            logger.debug("Email code collision, regenerating. Kind=%s", kind.value)
+        raise RuntimeError(
+            f"Failed to issue a unique {kind.value} code "
+            f"in {self.config.issue_attempts} attempts"
+        )
+
+    @abstractmethod
+    async def _save(
+        self,
+        kind: EmailCodeKind,
+        username: str,
+        code_hash: str,
+        ttl_seconds: int,
+    ) -> bool:
+        pass
+
+    @abstractmethod
+    async def pop(self, kind: EmailCodeKind, code: str) -> str | None:
+        # возвращает username владельца действующего кода и гасит код
+        pass
+
+    async def close(self) -> None:
+        pass
+
+
+class RedisEmailCodeStore(EmailCodeStore):
+    def __init__(self, config: EmailTokensConfig, redis_helper: RedisHelper):
+        super().__init__(config=config)
+        self.redis_helper: RedisHelper = redis_helper
+
+    def _get_code_key_prefix(self, kind: EmailCodeKind) -> str:
+        return f"{self.config.key_prefix}:{kind.value}:"
+
+    def _get_user_key_prefix(self, kind: EmailCodeKind) -> str:
+        return f"{self.config.key_prefix}:{kind.value}:user:"
+
+    async def _save(
+        self,
+        kind: EmailCodeKind,
+        username: str,
+        code_hash: str,
+        ttl_seconds: int,
+    ) -> bool:
+        code_key_prefix = self._get_code_key_prefix(kind)
+        is_saved = await self.redis_helper.get_redis().eval(  # pyright: ignore
+            ISSUE_SCRIPT,
+            2,
+            code_key_prefix + code_hash,
+            self._get_user_key_prefix(kind) + username,
+            username,
+            code_hash,
+            ttl_seconds,
+            code_key_prefix,
+        )
+        return bool(is_saved)
+
+    async def pop(self, kind: EmailCodeKind, code: str) -> str | None:
+        code_hash = hash_code(code)
+        username = await self.redis_helper.get_redis().eval(  # pyright: ignore
+            POP_SCRIPT,
+            1,
+            self._get_code_key_prefix(kind) + code_hash,
+            self._get_user_key_prefix(kind),
+            code_hash,
+        )
+        if username is None:
+            return None
+        return username.decode() if isinstance(username, bytes) else username
+
+
+class PostgresEmailCodeStore(EmailCodeStore):
+    def __init__(
+        self,
+        config: EmailTokensConfig,
+        session_factory: async_sessionmaker,
+    ):
+        super().__init__(config=config)
+        # коды живут в своих коротких транзакциях, независимо от сессии запроса
+        self.session_factory: async_sessionmaker = session_factory
+
+    async def _save(
+        self,
+        kind: EmailCodeKind,
+        username: str,
+        code_hash: str,
+        ttl_seconds: int,
+    ) -> bool:
+        expires_at = datetime.datetime.now(datetime.UTC) + datetime.timedelta(
+            seconds=ttl_seconds
+        )
+        stmt = insert(EmailCode).values(
+            username=username,
+            kind=kind.value,
+            code_hash=code_hash,
+            expires_at=expires_at,
+        )
+        async with self.session_factory() as session:
+            try:
+                # просроченные коды убираются попутно, по индексу на expires_at
+                await session.execute(
+                    delete(EmailCode).where(EmailCode.expires_at <= func.now())
+                )
+                await session.execute(
+                    stmt.on_conflict_do_update(
+                        index_elements=[EmailCode.username, EmailCode.kind],
+                        set_={
+                            "code_hash": stmt.excluded.code_hash,
+                            "expires_at": stmt.excluded.expires_at,
+                        },
+                    )
+                )
+                await session.commit()
+            except IntegrityError:
+                # хеш уже занят в частичном уникальном индексе этого вида
+                await session.rollback()
+                return False
+        return True
+
+    async def pop(self, kind: EmailCodeKind, code: str) -> str | None:
+        async with self.session_factory() as session:
+            result = await session.execute(
+                delete(EmailCode)
+                .where(
+                    # вид подставляется в SQL литералом, иначе в generic-плане
+                    # подготовленного запроса частичный индекс не подходит
+                    EmailCode.kind
+                    == bindparam("kind", kind.value, literal_execute=True),
+                    EmailCode.code_hash == hash_code(code),
+                    EmailCode.expires_at > func.now(),
+                )
+                .returning(EmailCode.username)
+            )
+            username = result.scalar_one_or_none()
+            await session.commit()
+        return username
+
+
+def create_email_code_store() -> EmailCodeStore:
+    if settings.email_tokens.storage == "postgres":
+        return PostgresEmailCodeStore(
+            config=settings.email_tokens,
+            session_factory=db_helper.session_factory,
+        )
+    return RedisEmailCodeStore(config=settings.email_tokens, redis_helper=redis_helper)
+
+
+email_code_store: EmailCodeStore = create_email_code_store()
@@ -0,0 +1,75 @@
+import time
+
+from redis.asyncio import Redis
+
+from api.api_v1.schemas.email import OutboxEmailScheme
+from core.config import settings, EmailOutboxConfig
+
+# берет письма, срок отправки которых наступил, и сразу сдвигает их срок на
+# время аренды: если воркер упадет, не подтвердив отправку, письмо вернется в очередь
+CLAIM_SCRIPT = """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+local payloads = {}
+for _, id in ipairs(ids) do
+    local payload = redis.call('HGET', KEYS[2], id)
+    if payload then
+        redis.call('ZADD', KEYS[1], ARGV[3], id)
+        table.insert(payloads, payload)
+    else
+        redis.call('ZREM', KEYS[1], id)
+    end
+end
+return payloads
+"""
+
+
+class EmailOutbox:
+    def __init__(self, config: EmailOutboxConfig):
+        self.config: EmailOutboxConfig = config
+        # срок отправки каждого письма, включая отложенные повторы и аренду воркером
+        self.schedule_key: str = f"{config.key_prefix}:schedule"
+        self.messages_key: str = f"{config.key_prefix}:messages"
+        self.dead_key: str = f"{config.key_prefix}:dead"
+
+    async def enqueue(self, email: OutboxEmailScheme, cache: Redis) -> None:
+        await self.reschedule(email=email, delay_seconds=0, cache=cache)
+
+    async def claim(self, cache: Redis, batch_size: int) -> list[OutboxEmailScheme]:
+        now = time.time()
+        payloads = await cache.eval(  # pyright: ignore
+            CLAIM_SCRIPT,
+            2,
+            self.schedule_key,
+            self.messages_key,
+            now,
+            batch_size,
+            now + self.config.lease_seconds,
+        )
+        return [OutboxEmailScheme.model_validate_json(payload) for payload in payloads]
+
+    async def ack(self, email: OutboxEmailScheme, cache: Redis) -> None:
+        async with cache.pipeline(transaction=True) as pipe:
+            pipe.zrem(self.schedule_key, email.id)
+            pipe.hdel(self.messages_key, email.id)
+            await pipe.execute()
+
+    async def reschedule(
+        self,
+        email: OutboxEmailScheme,
+        delay_seconds: float,
+        cache: Redis,
+    ) -> None:
+        async with cache.pipeline(transaction=True) as pipe:
+            pipe.hset(self.messages_key, email.id, email.model_dump_json())
+            pipe.zadd(self.schedule_key, {email.id: time.time() + delay_seconds})
+            await pipe.execute()
+
+    async def dead_letter(self, email: OutboxEmailScheme, cache: Redis) -> None:
+        async with cache.pipeline(transaction=True) as pipe:
+            pipe.zrem(self.schedule_key, email.id)
+            pipe.hdel(self.messages_key, email.id)
+            pipe.rpush(self.dead_key, email.model_dump_json())
+            await pipe.execute()
+
+
+email_outbox: EmailOutbox = EmailOutbox(config=settings.email_outbox)
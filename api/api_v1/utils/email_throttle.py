@@ -0,0 +1,90 @@
+import math
+import time
+
+from redis.asyncio import Redis
+
+from core.config import settings, EmailThrottleConfig
+from core.models.email_code import EmailCodeKind
+
+# атомарный token bucket: ведро пополняется со скоростью rate токенов в секунду,
+# а ключ живет ровно столько, сколько нужно для полного восстановления ведра
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local size = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens'))
+local updated_at = tonumber(redis.call('HGET', KEYS[1], 'updated_at'))
+if tokens == nil or updated_at == nil then
+    tokens = size
+    updated_at = now
+end
+tokens = math.min(size, tokens + math.max(now - updated_at, 0) * rate)
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    retry_after = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(size / rate) + 1)
+return tostring(retry_after)
+"""
+
+
+class EmailThrottle:
+    def __init__(self, config: EmailThrottleConfig):
+        self.config: EmailThrottleConfig = config
+
+    def _get_coalesce_key(self, kind: EmailCodeKind, email: str) -> str:
+        return f"{self.config.key_prefix}:pending:{kind.value}:{email.lower()}"
+
+    async def coalesce(self, kind: EmailCodeKind, email: str, cache: Redis) -> bool:
+        # True - письмо нужно отправить, False - такое же письмо уже ушло недавно
+        # и его код еще действует
+        is_first = await cache.set(
+            self._get_coalesce_key(kind=kind, email=email),
+            "",
+            nx=True,
+            ex=self.config.coalesce_window_seconds,
+        )
+        return bool(is_first)
+
+    async def release(self, kind: EmailCodeKind, email: str, cache: Redis) -> None:
+        await cache.delete(self._get_coalesce_key(kind=kind, email=email))
+
+    async def _acquire(
+        self,
+        key: str,
+        bucket_size: int,
+        refill_seconds: float,
+        cache: Redis,
+    ) -> int:
+        retry_after = await cache.eval(  # pyright: ignore
+            TOKEN_BUCKET_SCRIPT,
+            1,
+            key,
+            1 / refill_seconds,
+            bucket_size,
+            time.time(),
+        )
+        return math.ceil(float(retry_after))
+
+    async def acquire_for_email(self, email: str, cache: Redis) -> int:
+        # 0 - запрос разрешен, иначе через сколько секунд можно повторить
+        return await self._acquire(
+            key=f"{self.config.key_prefix}:email:{email.lower()}",
+            bucket_size=self.config.email_bucket_size,
+            refill_seconds=self.config.email_refill_seconds,
+            cache=cache,
+        )
+
+    async def acquire_for_ip(self, ip: str, cache: Redis) -> int:
+        return await self._acquire(
+            key=f"{self.config.key_prefix}:ip:{ip}",
+            bucket_size=self.config.ip_bucket_size,
+            refill_seconds=self.config.ip_refill_seconds,
+            cache=cache,
+        )
+
+
+email_throttle: EmailThrottle = EmailThrottle(config=settings.email_throttle)
@@ -0,0 +1,200 @@
+import asyncio
+import random
+import time
+from email.message import EmailMessage
+
+import aiosmtplib
+from redis.asyncio import Redis
+
+from api.api_v1.dependencies.log_helper import LogHelper
+from api.api_v1.schemas.email import OutboxEmailScheme
+from api.api_v1.utils.email import build_email_message
+from api.api_v1.utils.email_outbox import EmailOutbox
+from core.config import EmailOutboxConfig, SmtpConfig
+
+logger = LogHelper.get_app_logger()
+
+
+class SmtpConnectionPool:
+    def __init__(self, smtp_config: SmtpConfig, size: int, timeout: float):
+        # соединения открываются при первой отправке и дальше переиспользуются,
+        # вместо нового подключения и TLS-рукопожатия на каждое письмо
+        self._idle: asyncio.Queue[aiosmtplib.SMTP] = asyncio.Queue()
+        for _ in range(size):
+            self._idle.put_nowait(
+                aiosmtplib.SMTP(
+                    hostname=smtp_config.MAIL_SERVER,
+                    port=smtp_config.MAIL_PORT,
+                    username=(
+                        smtp_config.MAIL_USERNAME
+                        if smtp_config.USE_CREDENTIALS
+                        else None
+                    ),
+                    password=(
+                        smtp_config.MAIL_PASSWORD
+                        if smtp_config.USE_CREDENTIALS
+                        else None
+                    ),
+                    use_tls=smtp_config.MAIL_SSL_TLS,
+                    start_tls=smtp_config.MAIL_STARTTLS,
+                    validate_certs=smtp_config.VALIDATE_CERTS,
+                    timeout=timeout,
+                )
+            )
+        self.size: int = size
+
+    async def send(self, message: EmailMessage) -> None:
+        smtp = await self._idle.get()
+        try:
+            if smtp.is_connected:
+                try:
+                    await smtp.send_message(message)
+                    return
+                except aiosmtplib.SMTPServerDisconnected:
+                    # сервер закрыл простаивающее соединение, переподключаемся
+                    pass
+            await smtp.connect()
+            await smtp.send_message(message)
+        except Exception:
+            smtp.close()
+            raise
+        finally:
+            self._idle.put_nowait(smtp)
+
+    async def close(self) -> None:
+        while not self._idle.empty():
+            smtp = self._idle.get_nowait()
+            if not smtp.is_connected:
+                continue
+            try:
+                await smtp.quit()
+            except aiosmtplib.SMTPException:
+                smtp.close()
+
+
+class DomainRateLimiter:
+    def __init__(
+        self,
+        rate_per_second: float,
+        burst: int,
+        overrides: dict[str, float] | None = None,
+    ):
+        self.rate_per_second: float = rate_per_second
+        self.burst: int = burst
+        self.overrides: dict[str, float] = overrides or {}
+        # token bucket на каждый домен: (токены, время последнего пополнения)
+        self._buckets: dict[str, tuple[float, float]] = {}
+
+    def acquire(self, domain: str) -> float:
+        rate = self.overrides.get(domain, self.rate_per_second)
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.get(domain, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated_at) * rate)
+        if tokens >= 1:
+            self._buckets[domain] = (tokens - 1, now)
+            return 0
+        self._buckets[domain] = (tokens, now)
+        # сколько ждать до следующего токена
+        return (1 - tokens) / rate
+
+
+class EmailWorker:
+    def __init__(
+        self,
+        config: EmailOutboxConfig,
+        outbox: EmailOutbox,
+        smtp_pool: SmtpConnectionPool,
+        rate_limiter: DomainRateLimiter,
+        cache: Redis,
+    ):
+        self.config: EmailOutboxConfig = config
+        self.outbox: EmailOutbox = outbox
+        self.smtp_pool: SmtpConnectionPool = smtp_pool
+        self.rate_limiter: DomainRateLimiter = rate_limiter
+        self.cache: Redis = cache
+        self._semaphore: asyncio.Semaphore = asyncio.Semaphore(smtp_pool.size)
+
+    def get_retry_delay(self, attempts: int) -> float:
+        delay = min(
+            self.config.retry_base_seconds * 2 ** (attempts - 1),
+            self.config.retry_max_seconds,
+        )
+        # разброс, чтобы письма, упавшие вместе, не повторялись одной пачкой
+        return delay * random.uniform(0.5, 1)
+
+    async def deliver(self, email: OutboxEmailScheme) -> None:
+        wait_seconds = self.rate_limiter.acquire(email.domain)
+        if wait_seconds:
+            # лимит домена - не ошибка отправки, попытка не засчитывается
+            await self.outbox.reschedule(
+                email=email,
+                delay_seconds=wait_seconds,
+                cache=self.cache,
+            )
+            return
+
+        try:
+            async with self._semaphore:
+                await self.smtp_pool.send(build_email_message(email))
+        except Exception as exc:
+            email.attempts += 1
+            email.last_error = repr(exc)
+            if email.attempts >= self.config.max_attempts:
+                logger.error(
+                    "Email dead-lettered. EmailId=%s Domain=%s Attempts=%s Exception=%r",
+                    email.id,
+                    email.domain,
+                    email.attempts,
+                    exc,
+                )
+                await self.outbox.dead_letter(email=email, cache=self.cache)
+                return
+            delay_seconds = self.get_retry_delay(email.attempts)
+            logger.warning(
+                "Email sending failed, retrying. EmailId=%s Domain=%s Attempts=%s RetryIn=%.1fs Exception=%r",
+                email.id,
+                email.domain,
+                email.attempts,
+                delay_seconds,
+                exc,
+            )
+            await self.outbox.reschedule(
+                email=email,
+                delay_seconds=delay_seconds,
+                cache=self.cache,
+            )
+            return
+
+        await self.outbox.ack(email=email, cache=self.cache)
+        logger.info("Email sent. EmailId=%s Domain=%s", email.id, email.domain)
+
+    async def process_batch(self) -> int:
+        emails = await self.outbox.claim(
+            cache=self.cache,
+            batch_size=self.config.batch_size,
+        )
+        # письма пачки расходятся по соединениям пула параллельно
+        await asyncio.gather(*(self.deliver(email) for email in emails))
+        return len(emails)
+
+    async def run(self, stop_event: asyncio.Event) -> None:
+        logger.info(
+            "Email worker started. SmtpConnections=%s BatchSize=%s",
+            self.smtp_pool.size,
+            self.config.batch_size,
+        )
+        while not stop_event.is_set():
+            try:
+                processed = await self.process_batch()
+            except Exception as exc:
+                logger.error("Email batch failed. Exception=%r", exc, exc_info=exc)
+                processed = 0
+            if processed < self.config.batch_size:
+                try:
+                    await asyncio.wait_for(
+                        stop_event.wait(),
+                        timeout=self.config.poll_interval_seconds,
+                    )
+                except TimeoutError:
+                    pass
+        logger.info("Email worker stopped")
@@ -1,8 +1,8 @@
+import hashlib
 from pathlib import Path
 
-import aiofiles
-import aiofiles.os
 from api.api_v1.exceptions.http_exceptions import InvalidAvatarFormat
+from api.api_v1.utils.avatar_storage import avatar_storage
 from fastapi import UploadFile
 
 from core.config import settings
@@ -11,20 +11,57 @@ from core.config import settings
 async def save_avatar(avatar: UploadFile, username: str) -> str:
     if avatar.filename is None:
         raise InvalidAvatarFormat()
-    avatar_name = username + Path(avatar.filename).suffix
-    avatar_path = settings.avatar.avatars_dir / avatar_name
+    avatar_extension = Path(avatar.filename).suffix
+    avatar_name = username + avatar_extension
+    media_type = settings.avatar.allowed_extensions_to_mime.get(
+        avatar_extension.lower(),
+        "application/octet-stream",
+    )
     try:
-        async with aiofiles.open(avatar_path, "wb") as file:
-            content = await avatar.read()
-            await file.write(content)
+        content = await avatar.read()
+        await avatar_storage.save(
+            avatar_name=avatar_name,
+            content=content,
+            media_type=media_type,
+        )
         return avatar_name
     except Exception:
-        if await aiofiles.os.path.exists(avatar_path):
+        if await avatar_storage.exists(avatar_name):
             await delete_avatar(avatar_name)
         raise
 
 
 async def delete_avatar(avatar_name: str) -> None:
-    avatar_path = settings.avatar.avatars_dir / avatar_name
-    if await aiofiles.os.path.exists(avatar_path):
-        await aiofiles.os.remove(avatar_path)
+    await avatar_storage.delete(avatar_name)
+
+
+async def get_avatar_size_and_etag(avatar: UploadFile) -> tuple[int, str]:
+    content = await avatar.read()
+    await avatar.seek(0)
+    etag = hashlib.md5(content, usedforsecurity=False).hexdigest()
+    return len(content), etag
+
+
+def format_etag(etag: str) -> str:
+    return f'"{etag}"'
+
+
+def is_etag_matching(if_none_match: str | None, etag: str) -> bool:
+    # If-None-Match сравнивается слабо: W/"x" совпадает с "x"
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(
+        candidate.strip().removeprefix("W/") == format_etag(etag)
+        for candidate in if_none_match.split(",")
+    )
+
+
+def get_avatar_url(username: str) -> str:
+    return (
+        settings.main_router.prefix
+        + settings.v1_router.prefix
+        + settings.users_router.prefix
+        + settings.users_router.get_avatar_endpoint_path.format(username=username)
+    )
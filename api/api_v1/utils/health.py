@@ -0,0 +1,104 @@
+import asyncio
+import time
+from collections.abc import Awaitable, Callable
+from typing import cast
+
+from sqlalchemy import text
+
+from api.api_v1.dependencies.database.db_helper import db_helper
+from api.api_v1.dependencies.database.redis_helper import redis_helper
+from api.api_v1.dependencies.log_helper import LogHelper
+from api.api_v1.schemas.health import HealthCheckScheme, ReadinessScheme
+from api.api_v1.utils.jwt_auth import jwt_keys
+from api.api_v1.utils.loop_monitor import EventLoopMonitor, event_loop_monitor
+from core.config import settings, HealthConfig
+
+logger = LogHelper.get_app_logger()
+
+
+async def check_database() -> None:
+    # проверяем и выдачу соединения из пула, и сам сервер
+    async with db_helper.engine.connect() as connection:
+        await connection.execute(text("SELECT 1"))
+
+
+async def check_redis() -> None:
+    # у асинхронного клиента ping всегда возвращает awaitable
+    await cast(Awaitable[bool], redis_helper.get_redis().ping())
+
+
+async def check_jwt_keys() -> None:
+    if not jwt_keys.is_loaded:
+        raise RuntimeError("JWT keys are not loaded")
+
+
+async def check_event_loop(
+    max_lag_ms: float = settings.health.max_event_loop_lag_ms,
+    monitor: EventLoopMonitor = event_loop_monitor,
+) -> None:
+    # задержку постоянно меряет монитор цикла событий, а проверка берет
+    # ее максимум за последнее окно
+    lag_ms = monitor.get_recent_lag_seconds() * 1000
+    if lag_ms > max_lag_ms:
+        raise RuntimeError(f"Event loop lag {lag_ms:.1f}ms exceeds {max_lag_ms}ms")
+
+
+class HealthChecker:
+    def __init__(
+        self,
+        config: HealthConfig,
+        checks: dict[str, Callable[[], Awaitable[None]]],
+    ):
+        self.config: HealthConfig = config
+        self.checks: dict[str, Callable[[], Awaitable[None]]] = checks
+        self._cached: tuple[float, ReadinessScheme] | None = None
+        self._lock: asyncio.Lock = asyncio.Lock()
+
+    async def _run_check(
+        self, check: Callable[[], Awaitable[None]]
+    ) -> HealthCheckScheme:
+        start_time = time.perf_counter()
+        try:
+            await asyncio.wait_for(check(), timeout=self.config.check_timeout_seconds)
+        except Exception as exc:
+            return HealthCheckScheme(
+                status="fail",
+                latency_ms=(time.perf_counter() - start_time) * 1000,
+                detail=repr(exc),
+            )
+        return HealthCheckScheme(
+            status="ok",
+            latency_ms=(time.perf_counter() - start_time) * 1000,
+        )
+
+    async def get_readiness(self) -> ReadinessScheme:
+        if self._cached is not None and self._cached[0] > time.monotonic():
+            return self._cached[1]
+        async with self._lock:
+            # пока ждали блокировку, проверки мог уже выполнить другой запрос
+            if self._cached is not None and self._cached[0] > time.monotonic():
+                return self._cached[1]
+            results = await asyncio.gather(
+                *(self._run_check(check) for check in self.checks.values())
+            )
+            checks = dict(zip(self.checks, results))
+            is_ok = all(result.status == "ok" for result in results)
+            readiness = ReadinessScheme(status="ok" if is_ok else "fail", checks=checks)
+            if not is_ok:
+                logger.warning(
+                    "Readiness check failed. Checks=%s", readiness.model_dump()
+                )
+            self._cached = (time.monotonic() + self.config.cache_ttl_seconds, readiness)
+            return readiness
+
+
+health_checker: HealthChecker = HealthChecker(
+    config=settings.health,
+    checks={
+        "database": check_database,
+        "redis": check_redis,
+        "jwt_keys": check_jwt_keys,
+        # без монитора задержку цикла событий мерить нечем
+        **({"event_loop": check_event_loop} if settings.loop_monitor.enabled else {}),
+    },
+)
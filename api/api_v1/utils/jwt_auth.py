@@ -1,26 +1,58 @@
 import datetime
 import uuid
+from pathlib import Path
+from typing import Any
 
 import jwt
 
 from api.api_v1.dependencies.log_helper import LogHelper
+from api.api_v1.dependencies.tracing_helper import tracing_helper
+from api.api_v1.utils.metrics import jwt_verify_duration_histogram
 from core.config import settings
 from core.models import User
 
 logger = LogHelper.get_app_logger()
 
 
+class JWTKeys:
+    def __init__(self):
+        self.private_key: Any = None
+        self.public_key: Any = None
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.private_key is not None and self.public_key is not None
+
+    def load(
+        self,
+        private_key_path: Path = settings.jwt_auth.private_key_path,
+        public_key_path: Path = settings.jwt_auth.public_key_path,
+        algorithm: str = settings.jwt_auth.algorithm,
+    ) -> None:
+        # разбор PEM дорогой, поэтому ключи читаются и разбираются один раз,
+        # а PyJWT получает уже готовые объекты ключей
+        jwt_algorithm = jwt.get_algorithm_by_name(algorithm)
+        self.private_key = jwt_algorithm.prepare_key(private_key_path.read_text())
+        self.public_key = jwt_algorithm.prepare_key(public_key_path.read_text())
+
+    def clear(self) -> None:
+        self.private_key = None
+        self.public_key = None
+
+
+jwt_keys: JWTKeys = JWTKeys()
+
+
 def encode_jwt(
     payload: dict,
-    private_key: str | None = None,
+    private_key: Any = None,
     algorithm: str = settings.jwt_auth.algorithm,
     expire_minutes: int = settings.jwt_auth.access_token_expire_minutes,
 ) -> str:
-    private_key = (
-        settings.jwt_auth.private_key_path.read_text()
-        if private_key is None
-        else private_key
-    )
+    if private_key is None:
+        private_key = (
+            jwt_keys.private_key or settings.jwt_auth.private_key_path.read_text()
+        )
 
     to_encode = payload.copy()
     now = datetime.datetime.now(datetime.UTC)
@@ -30,30 +62,38 @@ def encode_jwt(
         exp=expire,
         iat=now,
     )
-    encoded = jwt.encode(
-        payload=to_encode,
-        key=private_key,
-        algorithm=algorithm,
-    )
+    with tracing_helper.start_span(
+        "jwt encode", attributes={"jwt.algorithm": algorithm}
+    ):
+        encoded = jwt.encode(
+            payload=to_encode,
+            key=private_key,
+            algorithm=algorithm,
+        )
     return encoded
 
 
 def decode_jwt(
     token: str | bytes,
-    public_key: str | None = None,
+    public_key: Any = None,
     algorithm: str = settings.jwt_auth.algorithm,
 ) -> dict:
-    public_key = (
-        settings.jwt_auth.public_key_path.read_text()
-        if public_key is None
-        else public_key
-    )
-
-    decoded = jwt.decode(
-        jwt=token,
-        key=public_key,
-        algorithms=[algorithm],
-    )
+    if public_key is None:
+        public_key = (
+            jwt_keys.public_key or settings.jwt_auth.public_key_path.read_text()
+        )
+
+    with (
+        tracing_helper.start_span(
+            "jwt decode", attributes={"jwt.algorithm": algorithm}
+        ),
+        jwt_verify_duration_histogram.time(),
+    ):
+        decoded = jwt.decode(
+            jwt=token,
+            key=public_key,
+            algorithms=[algorithm],
+        )
     return decoded
 
 
@@ -0,0 +1,99 @@
+import asyncio
+import sys
+import threading
+import time
+import traceback
+
+from api.api_v1.dependencies.log_helper import LogHelper
+from api.api_v1.utils.metrics import (
+    RecentMax,
+    event_loop_blocked_counter,
+    event_loop_lag_histogram,
+)
+from core.config import settings, LoopMonitorConfig
+
+logger = LogHelper.get_app_logger()
+
+
+class EventLoopMonitor:
+    def __init__(self, config: LoopMonitorConfig):
+        self.config: LoopMonitorConfig = config
+        self.last_lag_seconds: float = 0.0
+        self.recent_lag: RecentMax = RecentMax(window_seconds=config.lag_window_seconds)
+        self._task: asyncio.Task[None] | None = None
+        self._watchdog: threading.Thread | None = None
+        self._stop_event: threading.Event = threading.Event()
+        self._heartbeat: float = time.monotonic()
+        self._loop_thread_id: int | None = None
+
+    async def _sample(self) -> None:
+        interval = self.config.interval_seconds
+        while True:
+            start_time = time.perf_counter()
+            await asyncio.sleep(interval)
+            # все, что сверх запрошенного интервала, - время, пока цикл был занят другими колбэками
+            lag = max(time.perf_counter() - start_time - interval, 0.0)
+            self._heartbeat = time.monotonic()
+            self.last_lag_seconds = lag
+            self.recent_lag.record(lag)
+            event_loop_lag_histogram.observe(lag)
+
+    def get_recent_lag_seconds(self) -> float:
+        if self._task is None:
+            return self.recent_lag.get()
+        # замер, который запаздывает прямо сейчас, тоже учитывается
+        overdue = time.monotonic() - self._heartbeat - self.config.interval_seconds
+        return max(self.recent_lag.get(), overdue, 0.0)
+
+    def _get_loop_stack(self) -> str:
+        frame = sys._current_frames().get(self._loop_thread_id)  # pyright: ignore
+        if frame is None:
+            return ""
+        return "".join(traceback.format_stack(frame))
+
+    def _watch(self) -> None:
+        threshold = self.config.blocking_threshold_ms / 1000
+        reported_heartbeat = None
+        while not self._stop_event.wait(threshold / 2):
+            heartbeat = self._heartbeat
+            blocked = time.monotonic() - heartbeat - self.config.interval_seconds
+            # пока цикл занят, heartbeat не меняется: сообщаем о каждой блокировке один раз
+            if blocked < threshold or heartbeat == reported_heartbeat:
+                continue
+            reported_heartbeat = heartbeat
+            event_loop_blocked_counter.inc()
+            # стек снимается из другого потока прямо во время блокировки,
+            # поэтому в нем виден код, который держит цикл событий
+            logger.warning(
+                "Event loop blocked. BlockedMs=%.0f Stack:\n%s",
+                blocked * 1000,
+                self._get_loop_stack(),
+            )
+
+    def start(self) -> None:
+        if self._task is not None:
+            return
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id = threading.get_ident()
+        self._task = asyncio.create_task(self._sample())
+        if self.config.debug:
+            self._stop_event.clear()
+            self._watchdog = threading.Thread(
+                target=self._watch,
+                name="event-loop-watchdog",
+                daemon=True,
+            )
+            self._watchdog.start()
+
+    async def stop(self) -> None:
+        if self._watchdog is not None:
+            self._stop_event.set()
+            self._watchdog.join()
+            self._watchdog = None
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+event_loop_monitor: EventLoopMonitor = EventLoopMonitor(config=settings.loop_monitor)
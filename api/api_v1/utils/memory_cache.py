@@ -0,0 +1,51 @@
+import time
+from collections import OrderedDict
+from collections.abc import Hashable
+from typing import Any
+
+from core.config import settings
+
+
+class TTLLRUCache:
+    def __init__(
+        self,
+        max_size: int,
+        ttl_seconds: float,
+    ):
+        self.max_size: int = max_size
+        self.ttl_seconds: float = ttl_seconds
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            return default
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._data[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+# username -> (avatar_name, media_type, avatar_etag) или None, если аватара
+# у пользователя нет
+avatar_path_cache: TTLLRUCache = TTLLRUCache(
+    max_size=settings.avatar.path_cache_max_size,
+    ttl_seconds=settings.avatar.path_cache_ttl_seconds,
+)
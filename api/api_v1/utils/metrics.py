@@ -0,0 +1,240 @@
+import itertools
+import os
+import time
+
+from prometheus_client import (
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+FAST_OPERATION_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+)
+
+request_latency_histogram = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status"],
+    buckets=(
+        0.005,
+        0.01,
+        0.025,
+        0.05,
+        0.075,
+        0.1,
+        0.25,
+        0.5,
+        0.75,
+        1.0,
+        2.5,
+        5.0,
+        10.0,
+        30.0,
+    ),
+)
+in_flight_requests_gauge = Gauge(
+    "http_requests_in_flight",
+    "HTTP requests currently being processed",
+    multiprocess_mode="livesum",
+)
+
+db_pool_checked_out_gauge = Gauge(
+    "db_pool_checked_out_connections",
+    "DB connections currently checked out from the pool",
+    multiprocess_mode="livesum",
+)
+db_pool_open_connections_gauge = Gauge(
+    "db_pool_open_connections",
+    "DB connections currently opened by the pool",
+    multiprocess_mode="livesum",
+)
+db_pool_invalidated_counter = Counter(
+    "db_pool_invalidated_connections",
+    "DB connections invalidated by the pool",
+)
+db_pool_wait_histogram = Histogram(
+    "db_pool_wait_seconds",
+    "Time spent getting a connection from the DB pool",
+    buckets=FAST_OPERATION_BUCKETS,
+)
+
+redis_command_latency_histogram = Histogram(
+    "redis_command_duration_seconds",
+    "Redis command latency",
+    ["command"],
+    buckets=FAST_OPERATION_BUCKETS,
+)
+
+bcrypt_queue_time_histogram = Histogram(
+    "bcrypt_queue_duration_seconds",
+    "Time a bcrypt call waits for a free worker thread",
+    buckets=FAST_OPERATION_BUCKETS,
+)
+bcrypt_duration_histogram = Histogram(
+    "bcrypt_duration_seconds",
+    "Time spent hashing or checking a password with bcrypt",
+    ["operation"],
+    buckets=FAST_OPERATION_BUCKETS,
+)
+
+jwt_verify_duration_histogram = Histogram(
+    "jwt_verify_duration_seconds",
+    "Time spent decoding and verifying a JWT",
+    buckets=FAST_OPERATION_BUCKETS,
+)
+
+event_loop_lag_histogram = Histogram(
+    "event_loop_lag_seconds",
+    "Delay between the scheduled and the actual wake-up of the loop monitor",
+    buckets=FAST_OPERATION_BUCKETS,
+)
+event_loop_blocked_counter = Counter(
+    "event_loop_blocked",
+    "Times a single callback held the event loop longer than the threshold",
+)
+
+log_records_dropped_counter = Counter(
+    "log_records_dropped",
+    "Log records dropped because the logging queue was full",
+    ["logger"],
+)
+
+requests_shed_counter = Counter(
+    "http_requests_shed",
+    "HTTP requests rejected by admission control",
+    ["priority", "reason"],
+)
+
+
+class RecentMax:
+    # максимум за последние window_seconds: значения хранятся в двух корзинах,
+    # и старая корзина отбрасывается целиком, когда окно проходит
+    def __init__(self, window_seconds: float):
+        self.window_seconds: float = window_seconds
+        self._bucket_start: float = time.monotonic()
+        self._current: float = 0.0
+        self._previous: float = 0.0
+
+    def _rotate(self) -> None:
+        elapsed = time.monotonic() - self._bucket_start
+        if elapsed < self.window_seconds:
+            return
+        self._previous = self._current if elapsed < 2 * self.window_seconds else 0.0
+        self._current = 0.0
+        self._bucket_start = time.monotonic()
+
+    def record(self, value: float) -> None:
+        self._rotate()
+        self._current = max(self._current, value)
+
+    def get(self) -> float:
+        self._rotate()
+        return max(self._current, self._previous)
+
+
+class PendingWaits:
+    # начала еще не закончившихся ожиданий: если пул исчерпан, долгое ожидание
+    # видно сразу, а не только когда соединение наконец получено
+    def __init__(self):
+        self._started: dict[int, float] = {}
+        self._ids: itertools.count[int] = itertools.count()
+
+    def start(self) -> int:
+        wait_id = next(self._ids)
+        self._started[wait_id] = time.monotonic()
+        return wait_id
+
+    def finish(self, wait_id: int) -> None:
+        self._started.pop(wait_id, None)
+
+    def get_longest(self) -> float:
+        # словарь хранит порядок вставки, поэтому первое ожидание самое старое
+        for started_at in self._started.values():
+            return time.monotonic() - started_at
+        return 0.0
+
+
+db_pool_recent_wait: RecentMax = RecentMax(window_seconds=1)
+db_pool_pending_waits: PendingWaits = PendingWaits()
+
+
+def observe_db_pool_wait(wait_seconds: float) -> None:
+    db_pool_wait_histogram.observe(wait_seconds)
+    db_pool_recent_wait.record(wait_seconds)
+
+
+def get_db_pool_wait() -> float:
+    return max(db_pool_recent_wait.get(), db_pool_pending_waits.get_longest())
+
+
+def observe_request(
+    method: str,
+    route: str,
+    status_code: int,
+    duration_ns: int,
+) -> None:
+    request_latency_histogram.labels(
+        method=method,
+        route=route,
+        status=str(status_code),
+    ).observe(duration_ns / 1_000_000_000)
+
+
+def instrument_db_pool(engine: AsyncEngine) -> None:
+    pool = engine.sync_engine.pool
+
+    @event.listens_for(pool, "connect")
+    def on_connect(*_):
+        db_pool_open_connections_gauge.inc()
+
+    @event.listens_for(pool, "close")
+    def on_close(*_):
+        db_pool_open_connections_gauge.dec()
+
+    @event.listens_for(pool, "checkout")
+    def on_checkout(*_):
+        db_pool_checked_out_gauge.inc()
+
+    @event.listens_for(pool, "checkin")
+    def on_checkin(*_):
+        db_pool_checked_out_gauge.dec()
+
+    @event.listens_for(pool, "invalidate")
+    def on_invalidate(*_):
+        db_pool_invalidated_counter.inc()
+
+
+def is_multiprocess_mode() -> bool:
+    return "PROMETHEUS_MULTIPROC_DIR" in os.environ
+
+
+def generate_metrics() -> bytes:
+    if is_multiprocess_mode():
+        # каждый воркер uvicorn пишет метрики в свои файлы,
+        # а при сборке они агрегируются по всем процессам
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+def mark_metrics_process_dead() -> None:
+    if is_multiprocess_mode():
+        multiprocess.mark_process_dead(os.getpid())
@@ -0,0 +1,115 @@
+import sys
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+import greenlet
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from api.api_v1.dependencies.log_helper import LogHelper
+from core.config import settings
+
+logger = LogHelper.get_app_logger()
+
+DATABASE_HELPERS_FILE = str(Path(__file__).parent / "database.py")
+
+# служебные запросы вроде SET LOCAL не считаются в бюджет запросов,
+# не получают SQL-комментарий и не попадают в трассировку
+SERVICE_QUERY_OPTION = "service_query"
+
+
+class QueryBudgetExceeded(RuntimeError):
+    pass
+
+
+class QueryStats:
+    def __init__(self, budget: int | None):
+        self.budget: int | None = budget
+        self.count: int = 0
+
+    @property
+    def is_over_budget(self) -> bool:
+        return self.budget is not None and self.count > self.budget
+
+
+# счетчик изменяется из гринлета SQLAlchemy, поэтому в contextvar
+# лежит изменяемый объект, а не само число
+_query_stats_var: ContextVar[QueryStats | None] = ContextVar(
+    "query_stats",
+    default=None,
+)
+
+
+@contextmanager
+def track_queries(
+    budget: int | None = settings.db.query_budget,
+) -> Iterator[QueryStats]:
+    query_stats = QueryStats(budget=budget)
+    token = _query_stats_var.set(query_stats)
+    try:
+        yield query_stats
+    finally:
+        _query_stats_var.reset(token)
+
+
+def get_query_stats() -> QueryStats | None:
+    return _query_stats_var.get()
+
+
+def find_calling_helper() -> str | None:
+    # запросы выполняются в гринлете, но его стек продолжается кадрами
+    # корутин, поэтому по f_back можно дойти до хелпера из utils/database.py
+    parent = greenlet.getcurrent().parent
+    for frame in (sys._getframe(), parent.gr_frame if parent is not None else None):
+        while frame is not None:
+            if frame.f_code.co_filename == DATABASE_HELPERS_FILE:
+                return frame.f_code.co_name
+            frame = frame.f_back
+    return None
+
+
+def is_service_query(context) -> bool:
+    return bool(context.execution_options.get(SERVICE_QUERY_OPTION, False))
+
+
+def instrument_query_tracking(
+    engine: AsyncEngine,
+    slow_query_threshold_ms: float = settings.db.slow_query_threshold_ms,
+    enforce_budget: bool = settings.db.query_budget_enforce,
+) -> None:
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def on_before_cursor_execute(
+        conn, cursor, statement, parameters, context, executemany
+    ):
+        if is_service_query(context):
+            return
+        query_stats = _query_stats_var.get()
+        if query_stats is not None:
+            query_stats.count += 1
+            if enforce_budget and query_stats.is_over_budget:
+                raise QueryBudgetExceeded(
+                    f"Query budget of {query_stats.budget} exceeded "
+                    f"by {find_calling_helper() or 'unknown helper'}"
+                )
+        context._query_start_time = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def on_after_cursor_execute(
+        conn, cursor, statement, parameters, context, executemany
+    ):
+        if is_service_query(context):
+            return
+        duration_ms = (time.perf_counter() - context._query_start_time) * 1000
+        if duration_ms < slow_query_threshold_ms:
+            return
+        logger.warning(
+            "Slow query. Helper=%s Duration=%.2fms Statement=%r",
+            find_calling_helper(),
+            duration_ms,
+            statement,
+        )
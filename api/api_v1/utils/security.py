@@ -1,18 +1,31 @@
+import asyncio
 import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 from pathlib import Path
+from typing import Any, Callable
 
 import bcrypt
-from PIL import Image
 
 from api.api_v1.dependencies.log_helper import LogHelper
+from api.api_v1.dependencies.tracing_helper import tracing_helper
 from api.api_v1.exceptions.http_exceptions import InvalidAvatarFormat
+from api.api_v1.utils.metrics import (
+    bcrypt_queue_time_histogram,
+    bcrypt_duration_histogram,
+)
 from fastapi import UploadFile
 
 from core.config import settings
 
 logger = LogHelper.get_app_logger()
 
+bcrypt_executor = ThreadPoolExecutor(
+    max_workers=settings.password_hashing.max_workers,
+    thread_name_prefix="bcrypt",
+)
+
 
 def hash_password(password: str) -> bytes:
     logger.debug("Starting password hashing")
@@ -28,6 +41,37 @@ def verify_password(password: str, correct_password: bytes) -> bool:
     return bcrypt.checkpw(password_bytes, correct_password)
 
 
+async def _run_in_bcrypt_executor(operation: str, func: Callable, *args: Any) -> Any:
+    submitted_at = time.perf_counter()
+
+    def run() -> Any:
+        started_at = time.perf_counter()
+        bcrypt_queue_time_histogram.observe(started_at - submitted_at)
+        try:
+            return func(*args)
+        finally:
+            bcrypt_duration_histogram.labels(operation=operation).observe(
+                time.perf_counter() - started_at
+            )
+
+    loop = asyncio.get_running_loop()
+    with tracing_helper.start_span(f"bcrypt {operation}"):
+        return await loop.run_in_executor(bcrypt_executor, run)
+
+
+async def hash_password_async(password: str) -> bytes:
+    return await _run_in_bcrypt_executor("hash", hash_password, password)
+
+
+async def verify_password_async(password: str, correct_password: bytes) -> bool:
+    return await _run_in_bcrypt_executor(
+        "verify",
+        verify_password,
+        password,
+        correct_password,
+    )
+
+
 def validate_token_type(token_payload: dict, expected_type: str) -> bool:
     token_type = token_payload.get(settings.jwt_auth.token_type_payload_key)
     return token_type == expected_type
@@ -48,6 +92,9 @@ def validate_avatar_extension(avatar: UploadFile) -> bool:
 
 
 async def validate_avatar_size(avatar: UploadFile) -> bool:
+    # Pillow нужен только при загрузке аватара, не тратим на него время при старте
+    from PIL import Image
+
     content = await avatar.read()
     image = Image.open(BytesIO(content))
     await avatar.seek(0)
@@ -0,0 +1,59 @@
+from contextvars import ContextVar
+from urllib.parse import quote
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.types import Scope
+
+from api.api_v1.dependencies.log_helper import LogHelper
+from api.api_v1.utils.query_tracking import find_calling_helper, is_service_query
+from core.config import settings
+
+# сам scope, а не шаблон роута: роутер кладет в него найденный роут
+# уже после того, как middleware начала обрабатывать запрос
+_request_scope_var: ContextVar[Scope | None] = ContextVar(
+    "request_scope",
+    default=None,
+)
+
+
+def set_request_scope(scope: Scope | None) -> None:
+    _request_scope_var.set(scope)
+
+
+def get_current_route() -> str | None:
+    scope = _request_scope_var.get()
+    if scope is None:
+        return None
+    return getattr(scope.get("route"), "path_format", None)
+
+
+def build_sql_comment(tags: dict[str, str | None]) -> str:
+    # формат sqlcommenter: ключи по алфавиту, значения url-encoded в кавычках
+    serialized = ",".join(
+        f"{key}='{quote(value, safe='')}'"
+        for key, value in sorted(tags.items())
+        if value is not None
+    )
+    return f" /*{serialized}*/" if serialized else ""
+
+
+def instrument_sql_comments(
+    engine: AsyncEngine,
+    include_request_id: bool = settings.db.sql_comments_include_request_id,
+) -> None:
+    @event.listens_for(engine.sync_engine, "before_cursor_execute", retval=True)
+    def on_before_cursor_execute(
+        conn, cursor, statement, parameters, context, executemany
+    ):
+        if is_service_query(context):
+            return statement, parameters
+        tags = {
+            "route": get_current_route(),
+            "helper": find_calling_helper(),
+        }
+        # request_id делает текст каждого запроса уникальным, из-за чего
+        # asyncpg не может переиспользовать подготовленные выражения
+        if include_request_id:
+            tags["request_id"] = LogHelper.get_request_id()
+        return statement + build_sql_comment(tags), parameters
@@ -0,0 +1,43 @@
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+from api.api_v1.utils.query_tracking import SERVICE_QUERY_OPTION
+
+# SQLSTATE query_canceled: так PostgreSQL завершает запрос по statement_timeout
+QUERY_CANCELED_SQLSTATE = "57014"
+
+_statement_timeout_var: ContextVar[int | None] = ContextVar(
+    "statement_timeout",
+    default=None,
+)
+
+
+class StatementTimeout:
+    def __init__(self, timeout_ms: int | None):
+        self.timeout_ms: int | None = timeout_ms
+
+    async def __call__(self) -> None:
+        # зависимость роута выполняется после зависимости роутера,
+        # поэтому таймаут роута перекрывает таймаут роутера
+        _statement_timeout_var.set(self.timeout_ms)
+
+
+def instrument_statement_timeout(session_class: type[Session] = Session) -> None:
+    @event.listens_for(session_class, "after_begin")
+    def on_after_begin(session, transaction, connection):
+        timeout_ms = _statement_timeout_var.get()
+        if timeout_ms is None:
+            return
+        # SET LOCAL действует до конца транзакции, поэтому выставляется
+        # заново в каждой транзакции сессии
+        connection.exec_driver_sql(
+            f"SET LOCAL statement_timeout = {int(timeout_ms)}",
+            execution_options={SERVICE_QUERY_OPTION: True},
+        )
+
+
+def is_statement_timeout_error(exc: DBAPIError) -> bool:
+    return getattr(exc.orig, "sqlstate", None) == QUERY_CANCELED_SQLSTATE
@@ -0,0 +1,207 @@
+import asyncio
+import time
+from collections.abc import Awaitable
+from typing import cast
+from uuid import UUID
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from api.api_v1.dependencies.database.db_helper import db_helper
+from api.api_v1.dependencies.log_helper import LogHelper
+from api.api_v1.schemas.story import StoryDetailScheme
+from api.api_v1.utils.database import get_story_by_uuid
+from core.config import settings, StoriesCacheConfig
+
+logger = LogHelper.get_app_logger()
+
+# запись пишется, только если поколение истории не изменилось с начала чтения
+# из БД: иначе загрузка, пересекшаяся с правкой или удалением, вернула бы
+# в кэш старую версию. Пустой payload - запомненное отсутствие истории
+SAVE_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[1] then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'fresh_until', ARGV[2], 'payload', ARGV[3])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return 1
+"""
+
+
+class StoryDetailCache:
+    def __init__(self, config: StoriesCacheConfig):
+        self.config: StoriesCacheConfig = config
+        # загрузки, которые уже выполняются в этом процессе: параллельные
+        # запросы одной и той же истории ждут одну загрузку вместо своих
+        self._in_flight: dict[UUID, asyncio.Task[bytes | None]] = {}
+        self._refresh_tasks: dict[UUID, asyncio.Task[None]] = {}
+
+    def _get_key(self, story_uuid: UUID) -> str:
+        return f"{self.config.detail_key_prefix}{story_uuid}"
+
+    def _get_generation_key(self, story_uuid: UUID) -> str:
+        return f"{self.config.detail_generation_key_prefix}{story_uuid}"
+
+    async def get(self, story_uuid: UUID, cache: Redis) -> bytes | None:
+        try:
+            fresh_until, payload = await cast(
+                Awaitable[list[bytes | None]],
+                cache.hmget(self._get_key(story_uuid), ["fresh_until", "payload"]),
+            )
+        except RedisError as exc:
+            logger.warning(
+                "Story detail cache read failed, loading from DB. StoryUUID=%s Exception=%r",
+                story_uuid,
+                exc,
+            )
+            return await self._load_once(story_uuid=story_uuid, cache=cache)
+        if payload is None:
+            return await self._load_once(story_uuid=story_uuid, cache=cache)
+        if not payload:
+            return None
+        if float(fresh_until or 0) < time.time():
+            # устаревшую запись отдаем сразу, а обновляем ее в фоне
+            self._schedule_refresh(story_uuid=story_uuid, cache=cache)
+        return payload
+
+    async def invalidate(self, story_uuid: UUID, cache: Redis) -> None:
+        generation_key = self._get_generation_key(story_uuid)
+        try:
+            async with cache.pipeline(transaction=True) as pipe:
+                pipe.incr(generation_key)
+                # поколение нужно только пока идут загрузки, начатые до правки,
+                # а они ограничены statement timeout
+                pipe.expire(
+                    generation_key,
+                    int(
+                        self.config.detail_fresh_seconds
+                        + self.config.detail_stale_seconds
+                    ),
+                )
+                pipe.delete(self._get_key(story_uuid))
+                await pipe.execute()
+        except RedisError as exc:
+            # правка уже сохранена в БД, а старая запись истечет по TTL
+            logger.warning(
+                "Story detail cache invalidation failed. StoryUUID=%s Exception=%r",
+                story_uuid,
+                exc,
+            )
+
+    async def _load_once(self, story_uuid: UUID, cache: Redis) -> bytes | None:
+        task = self._in_flight.get(story_uuid)
+        if task is None:
+            task = asyncio.create_task(self._load(story_uuid=story_uuid, cache=cache))
+            self._in_flight[story_uuid] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(story_uuid, None))
+        # shield: отмена одного из ожидающих запросов не отменяет загрузку для остальных
+        return await asyncio.shield(task)
+
+    async def _load(self, story_uuid: UUID, cache: Redis) -> bytes | None:
+        try:
+            generation = await cache.get(self._get_generation_key(story_uuid))
+        except RedisError as exc:
+            # без поколения запись нельзя безопасно сохранить, отдаем только БД
+            logger.warning(
+                "Story detail cache is unavailable, serving from DB. StoryUUID=%s Exception=%r",
+                story_uuid,
+                exc,
+            )
+            return await self._read_payload(story_uuid=story_uuid)
+
+        payload = await self._read_payload(story_uuid=story_uuid)
+        if payload is None:
+            await self._save(
+                story_uuid=story_uuid,
+                generation=generation,
+                payload=b"",
+                expire_seconds=self.config.detail_missing_seconds,
+                cache=cache,
+            )
+            return None
+
+        await self._save(
+            story_uuid=story_uuid,
+            generation=generation,
+            payload=payload,
+            expire_seconds=int(
+                self.config.detail_fresh_seconds + self.config.detail_stale_seconds
+            ),
+            cache=cache,
+        )
+        return payload
+
+    async def _read_payload(self, story_uuid: UUID) -> bytes | None:
+        async with db_helper.session_factory() as session:
+            story = await get_story_by_uuid(story_uuid=story_uuid, session=session)
+        if story is None:
+            return None
+        return (
+            StoryDetailScheme.model_validate(story, from_attributes=True)
+            .model_dump_json()
+            .encode()
+        )
+
+    async def _save(
+        self,
+        story_uuid: UUID,
+        generation: bytes | None,
+        payload: bytes,
+        expire_seconds: int,
+        cache: Redis,
+    ) -> None:
+        try:
+            await cache.eval(  # pyright: ignore
+                SAVE_SCRIPT,
+                2,
+                self._get_key(story_uuid),
+                self._get_generation_key(story_uuid),
+                generation or b"0",
+                time.time() + self.config.detail_fresh_seconds,
+                payload,
+                expire_seconds,
+            )
+        except RedisError as exc:
+            # ответ уже получен из БД, кэш заполнится следующей загрузкой
+            logger.warning(
+                "Story detail cache write failed. StoryUUID=%s Exception=%r",
+                story_uuid,
+                exc,
+            )
+
+    def _schedule_refresh(self, story_uuid: UUID, cache: Redis) -> None:
+        # пока обновление уже идет в этом процессе, новые устаревшие попадания
+        # не создают ни задач, ни запросов блокировки в Redis
+        if story_uuid in self._in_flight or story_uuid in self._refresh_tasks:
+            return
+        task = asyncio.create_task(self._refresh(story_uuid=story_uuid, cache=cache))
+        self._refresh_tasks[story_uuid] = task
+        task.add_done_callback(lambda _: self._refresh_tasks.pop(story_uuid, None))
+
+    async def _refresh(self, story_uuid: UUID, cache: Redis) -> None:
+        try:
+            # блокировка в Redis не дает нескольким воркерам обновлять одну запись
+            is_locked = await cache.set(
+                f"{self.config.detail_lock_key_prefix}{story_uuid}",
+                "",
+                nx=True,
+                ex=self.config.detail_lock_seconds,
+            )
+            if not is_locked:
+                return
+            await self._load_once(story_uuid=story_uuid, cache=cache)
+        except Exception as exc:
+            logger.warning(
+                "Story detail cache refresh failed. StoryUUID=%s Exception=%r",
+                story_uuid,
+                exc,
+            )
+
+    async def close(self) -> None:
+        tasks = list(self._refresh_tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+story_detail_cache: StoryDetailCache = StoryDetailCache(config=settings.stories_cache)
@@ -0,0 +1,53 @@
+import uuid
+
+from api.api_v1.dependencies.database.db_helper import db_helper
+from api.api_v1.dependencies.database.redis_helper import redis_helper
+from api.api_v1.dependencies.log_helper import LogHelper
+from api.api_v1.schemas.story import StoryScheme
+from api.api_v1.schemas.user import CurrentUserScheme, UserWithStoriesScheme
+from api.api_v1.utils.database import (
+    get_story_list_items,
+    get_story_by_uuid,
+    get_user_by_username_or_email,
+)
+from api.api_v1.utils.json_response import get_type_adapter
+from api.api_v1.utils.jwt_auth import jwt_keys
+from core.config import settings
+
+logger = LogHelper.get_app_logger()
+
+# модели ответов, которые отдаются через model_json_response
+HOT_RESPONSE_MODELS = (
+    list[StoryScheme],
+    CurrentUserScheme,
+    UserWithStoriesScheme,
+)
+
+
+async def warmup_hot_queries() -> None:
+    # первое выполнение запроса компилирует его и кладет в кэш SQLAlchemy,
+    # поэтому прогоняем самые частые запросы до первого пользователя
+    async with db_helper.session_factory() as session:
+        await get_story_list_items(session=session)
+        await get_story_by_uuid(story_uuid=uuid.uuid4(), session=session)
+        await get_user_by_username_or_email(session=session)
+
+
+def warmup_serializers() -> None:
+    for response_model in HOT_RESPONSE_MODELS:
+        get_type_adapter(response_model)
+
+
+async def warmup() -> None:
+    db_connections = settings.warmup.db_connections or settings.db.pool_size
+    logger.info(
+        "Warming up. DbConnections=%s RedisConnections=%s",
+        db_connections,
+        settings.warmup.redis_connections,
+    )
+    jwt_keys.load()
+    warmup_serializers()
+    await db_helper.warmup(connections=db_connections)
+    await redis_helper.warmup(connections=settings.warmup.redis_connections)
+    await warmup_hot_queries()
+    logger.info("Warmup finished")
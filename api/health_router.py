@@ -0,0 +1,41 @@
+from fastapi import APIRouter
+from starlette import status
+from starlette.requests import Request
+from starlette.responses import Response
+
+from api.api_v1.schemas.auth_responses import StatusSuccessResponse
+from api.api_v1.schemas.health import ReadinessScheme
+from api.api_v1.utils.health import health_checker
+from core.config import settings
+
+health_router = APIRouter(
+    prefix=settings.health.prefix,
+    tags=settings.health.tags,
+)
+
+
+@health_router.get(
+    settings.health.live_endpoint_path,
+    response_model=StatusSuccessResponse,
+    status_code=status.HTTP_200_OK,
+)
+async def live_endpoint():
+    # процесс отвечает - значит жив, зависимости здесь не проверяются,
+    # иначе падение БД приводило бы к перезапуску всех контейнеров
+    return StatusSuccessResponse()
+
+
+@health_router.get(
+    settings.health.ready_endpoint_path,
+    response_model=ReadinessScheme,
+    status_code=status.HTTP_200_OK,
+    responses={status.HTTP_503_SERVICE_UNAVAILABLE: {"model": ReadinessScheme}},
+)
+async def ready_endpoint(request: Request, response: Response):
+    if not getattr(request.app.state, "is_ready", False):
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return ReadinessScheme(status="fail", checks={})
+    readiness = await health_checker.get_readiness()
+    if readiness.status != "ok":
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return readiness
@@ -0,0 +1,21 @@
+from fastapi import APIRouter
+from starlette import status
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response
+from prometheus_client import CONTENT_TYPE_LATEST
+
+from api.api_v1.utils.metrics import generate_metrics
+from core.config import settings
+
+metrics_router = APIRouter(tags=settings.metrics.tags)
+
+
+@metrics_router.get(
+    settings.metrics.path,
+    status_code=status.HTTP_200_OK,
+    include_in_schema=False,
+)
+async def metrics_endpoint():
+    # в multiprocess режиме метрики читаются из файлов всех воркеров
+    content = await run_in_threadpool(generate_metrics)
+    return Response(content=content, media_type=CONTENT_TYPE_LATEST)
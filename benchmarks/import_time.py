@@ -0,0 +1,57 @@
+"""Профиль времени импорта приложения через python -X importtime.
+
+Запуск из корня проекта: python -m benchmarks.import_time [--top 20] [--budget-ms 2000]
+
+Импорт main выполняется в отдельном процессе, чтобы кэш модулей текущего
+интерпретатора не влиял на результат. С --budget-ms скрипт завершается с
+ошибкой, если суммарное время импорта превышает бюджет.
+"""
+
+import argparse
+import subprocess
+import sys
+
+REPEAT = 5
+
+
+def measure(module: str) -> dict[str, int]:
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    # строки вида "import time: self [us] | cumulative | imported package"
+    cumulative_us = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        cumulative_us[name.strip()] = int(cumulative)
+    return cumulative_us
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--budget-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    # лучший из нескольких запусков, чтобы убрать шум файлового кэша
+    runs = [measure(args.module) for _ in range(REPEAT)]
+    best = min(runs, key=lambda run: run[args.module])
+    total_ms = best[args.module] / 1000
+
+    print(f"{'cumulative, ms':>15}  module")
+    for name, cumulative in sorted(best.items(), key=lambda item: -item[1])[: args.top]:
+        print(f"{cumulative / 1000:>15.1f}  {name}")
+    print(f"\nimport {args.module}: {total_ms:.1f}ms")
+
+    if args.budget_ms is not None and total_ms > args.budget_ms:
+        print(f"Import time budget of {args.budget_ms}ms exceeded", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Сравнение сериализации ответов: стандартный путь FastAPI и pydantic-core.
+
+Запуск из корня проекта: python -m benchmarks.json_serialization
+
+Сценарии: страница ленты из 20 историй и профиль пользователя с 500 историями.
+"""
+
+import datetime
+import functools
+import timeit
+import uuid
+from types import SimpleNamespace
+
+from fastapi._compat import ModelField
+from fastapi.utils import create_model_field
+from starlette.responses import JSONResponse
+
+from api.api_v1.schemas.dto import StoryListItem
+from api.api_v1.schemas.story import StoryScheme
+from api.api_v1.schemas.user import CurrentUserScheme
+from api.api_v1.utils.json_response import FastJSONResponse, model_json_response
+
+REPEAT = 5
+NUMBER = 200
+
+
+def make_stories(count: int) -> list[StoryListItem]:
+    now = datetime.datetime.now(datetime.UTC)
+    return [
+        StoryListItem(
+            id=uuid.uuid4(),
+            name=f"story {i}",
+            likes_number=i,
+            created_at=now - datetime.timedelta(seconds=i),
+            author_username="author",
+        )
+        for i in range(count)
+    ]
+
+
+def make_profile(stories_count: int) -> SimpleNamespace:
+    return SimpleNamespace(
+        username="author",
+        is_active=True,
+        role="user",
+        registered_at=datetime.datetime.now(datetime.UTC),
+        avatar_name=None,
+        bio="bio",
+        stories=make_stories(stories_count),
+    )
+
+
+@functools.cache
+def get_response_field(response_model) -> ModelField:
+    return create_model_field(
+        name="Response",
+        type_=response_model,
+        mode="serialization",
+    )
+
+
+def fastapi_default(content, response_model, response_class=JSONResponse) -> bytes:
+    # то же, что делает serialize_response в FastAPI: validate, serialize в
+    # json-совместимые python-объекты и render классом ответа
+    field = get_response_field(response_model)
+    value, _ = field.validate(content, {}, loc=("response",))
+    # Response.body типизирован как bytes | memoryview, рендер всегда дает bytes
+    return bytes(response_class(field.serialize(value)).body)
+
+
+def main() -> None:
+    scenarios = (
+        ("feed, 20 stories", make_stories(20), list[StoryScheme]),
+        ("profile, 500 stories", make_profile(500), CurrentUserScheme),
+    )
+    variants = (
+        ("JSONResponse", lambda c, m: fastapi_default(c, m)),
+        ("FastJSONResponse", lambda c, m: fastapi_default(c, m, FastJSONResponse)),
+        ("model_json_response", lambda c, m: model_json_response(c, m).body),
+    )
+    print(f"{'scenario':<22} {'variant':<20} {'us/op':>10}")
+    for scenario, content, response_model in scenarios:
+        for variant, serialize in variants:
+            best = min(
+                timeit.repeat(
+                    lambda: serialize(content, response_model),
+                    repeat=REPEAT,
+                    number=NUMBER,
+                )
+            )
+            print(f"{scenario:<22} {variant:<20} {best / NUMBER * 1_000_000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
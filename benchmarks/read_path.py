@@ -0,0 +1,129 @@
+"""Сравнение чтения списков через ORM и через Core + DTO.
+
+Запуск из корня проекта: python -m benchmarks.read_path
+
+Используется синхронный SQLite в памяти, чтобы бенчмарк не зависел от
+PostgreSQL: сеть и драйвер одинаковы для обоих вариантов, а разница
+приходится на построение ORM-объектов и identity map.
+
+Кроме времени через tracemalloc меряется память одного чтения: пик
+выделенного во время вызова и число блоков, которые остаются у результата.
+"""
+
+import datetime
+import timeit
+import tracemalloc
+import uuid
+from typing import Callable
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+from api.api_v1.schemas.dto import StoryListItem
+from api.api_v1.schemas.story import StoryScheme
+from core.models import Story, User
+
+ROWS = (20, 100, 1000)
+REPEAT = 5
+NUMBER = 20
+
+
+def fill_database(session: Session, rows: int) -> None:
+    session.add(
+        User(username="author", email="author@example.com", hashed_password=b"")
+    )
+    now = datetime.datetime.now(datetime.UTC)
+    session.add_all(
+        Story(
+            id=uuid.uuid4(),
+            name=f"story {i}",
+            text="text " * 500,
+            likes_number=i,
+            created_at=now - datetime.timedelta(seconds=i),
+            author_username="author",
+        )
+        for i in range(rows)
+    )
+    session.commit()
+
+
+def read_orm(session: Session, rows: int) -> list:
+    stories = session.scalars(
+        select(Story).order_by(Story.created_at.desc()).limit(rows)
+    ).all()
+    result = [
+        StoryScheme.model_validate(story, from_attributes=True) for story in stories
+    ]
+    session.expunge_all()
+    return result
+
+
+def read_core(session: Session, rows: int) -> list:
+    columns = [Story.__table__.c[name] for name in StoryListItem.__slots__]
+    result = session.execute(
+        select(*columns).order_by(Story.__table__.c.created_at.desc()).limit(rows)
+    )
+    return [
+        StoryScheme.model_validate(StoryListItem(*row), from_attributes=True)
+        for row in result
+    ]
+
+
+def measure_memory(read: Callable[[], list]) -> tuple[int, int]:
+    # первый вызов прогревает кэши компиляции запросов, они не относятся к строкам
+    read()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        start_size, _ = tracemalloc.get_traced_memory()
+        result = read()
+        _, peak_size = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    retained_blocks = sum(
+        stat.count_diff for stat in after.compare_to(before, "filename")
+    )
+    del result
+    return peak_size - start_size, retained_blocks
+
+
+def main() -> None:
+    print(
+        f"{'rows':>6} {'orm, ms':>10} {'core, ms':>10} {'speedup':>8}"
+        f" {'orm peak, KiB':>14} {'core peak, KiB':>15}"
+        f" {'orm blocks':>11} {'core blocks':>12}"
+    )
+    for rows in ROWS:
+        engine = create_engine("sqlite://")
+        Story.metadata.create_all(
+            engine,
+            tables=[Story.metadata.tables["users"], Story.metadata.tables["stories"]],
+        )
+        with Session(engine) as session:
+            fill_database(session, rows)
+            timings = {}
+            peaks = {}
+            blocks = {}
+            for name, read in (("orm", read_orm), ("core", read_core)):
+                best = min(
+                    timeit.repeat(
+                        lambda: read(session, rows),
+                        repeat=REPEAT,
+                        number=NUMBER,
+                    )
+                )
+                timings[name] = best / NUMBER * 1000
+                peaks[name], blocks[name] = measure_memory(lambda: read(session, rows))
+        engine.dispose()
+        print(
+            f"{rows:>6} {timings['orm']:>10.3f} {timings['core']:>10.3f} "
+            f"{timings['orm'] / timings['core']:>7.2f}x"
+            f" {peaks['orm'] / 1024:>14.1f} {peaks['core'] / 1024:>15.1f}"
+            f" {blocks['orm']:>11} {blocks['core']:>12}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,9 @@
 import logging
+import os
 import string
 from enum import Enum
 from pathlib import Path
-from typing import Literal
+from typing import Any, Literal
 
 from pydantic import BaseModel, PostgresDsn, computed_field, RedisDsn
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -11,6 +12,42 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 class RunConfig(BaseModel):
     host: str
     port: int
+    reload: bool = False
+    # None - по одному воркеру на ядро
+    workers: int | None = None
+    loop: Literal["auto", "asyncio", "uvloop"] = "auto"
+    http: Literal["auto", "h11", "httptools"] = "auto"
+    backlog: int = 2048
+    limit_concurrency: int | None = None
+    # воркер перезапускается после стольких запросов, что ограничивает рост памяти;
+    # перезапускать воркеры умеет только супервизор uvicorn при нескольких
+    # процессах, с одним процессом весь сервер просто завершился бы
+    limit_max_requests: int | None = 10_000
+    timeout_keep_alive: int = 5
+    timeout_graceful_shutdown: int | None = 30
+
+    @property
+    def workers_count(self) -> int:
+        return self.workers or os.cpu_count() or 1
+
+    def get_uvicorn_options(self) -> dict[str, Any]:
+        # reload работает только с одним процессом
+        workers = None if self.reload else self.workers_count
+        return {
+            "host": self.host,
+            "port": self.port,
+            "reload": self.reload,
+            "workers": workers,
+            "loop": self.loop,
+            "http": self.http,
+            "backlog": self.backlog,
+            "limit_concurrency": self.limit_concurrency,
+            "limit_max_requests": (
+                self.limit_max_requests if workers is not None and workers > 1 else None
+            ),
+            "timeout_keep_alive": self.timeout_keep_alive,
+            "timeout_graceful_shutdown": self.timeout_graceful_shutdown,
+        }
 
 
 class DatabaseConfig(BaseModel):
@@ -23,6 +60,12 @@ class DatabaseConfig(BaseModel):
     echo_pool: bool = False
     max_overflow: int = 50
     pool_size: int = 10
+    slow_query_threshold_ms: float = 200
+    query_budget: int = 30
+    query_budget_enforce: bool = False
+    application_name: str = "pet-project"
+    sql_comments: bool = False
+    sql_comments_include_request_id: bool = False
 
     naming_convention: dict[str, str] = {
         "ix": "ix_%(column_0_label)s",
@@ -68,6 +111,8 @@ class LoggingConfig(BaseModel):
     date_format: str = "%d/%b/%Y %H:%M:%S"
     api_log_file: Path = Path(__file__).parent.parent / "logs" / "api_access_log.log"
     app_log_file: Path = Path(__file__).parent.parent / "logs" / "app_log.log"
+    queue_max_size: int = 10_000
+    queue_overflow_policy: Literal["drop", "block"] = "drop"
 
     @property
     def log_level_value(self):
@@ -88,6 +133,10 @@ class JWTAuthConfig(BaseModel):
     token_header_prefix: str = "Bearer"
 
 
+class PasswordHashingConfig(BaseModel):
+    max_workers: int = 4
+
+
 class CookieConfig(BaseModel):
     refresh_token_key: str = "refresh_token"
     path: str = "/"
@@ -97,6 +146,61 @@ class CookieConfig(BaseModel):
     samesite: Literal["lax", "strict", "none"] = "lax"
 
 
+class MetricsConfig(BaseModel):
+    path: str = "/metrics"
+    tags: list[str | Enum] = ["Metrics"]
+
+
+class HealthConfig(BaseModel):
+    prefix: str = "/health"
+    tags: list[str | Enum] = ["Health"]
+    live_endpoint_path: str = "/live"
+    ready_endpoint_path: str = "/ready"
+    # результат проверок переиспользуется, чтобы частые пробы не нагружали БД
+    cache_ttl_seconds: float = 1
+    check_timeout_seconds: float = 1
+    max_event_loop_lag_ms: float = 200
+
+
+class LoopMonitorConfig(BaseModel):
+    enabled: bool = True
+    interval_seconds: float = 0.5
+    # окно, за которое readiness-проверка берет максимальную задержку
+    lag_window_seconds: float = 5
+    # отладочный режим: логировать стек кода, который держит цикл событий дольше порога
+    debug: bool = False
+    blocking_threshold_ms: float = 100
+
+
+class AdmissionConfig(BaseModel):
+    enabled: bool = True
+    max_in_flight: int = 200
+    max_db_pool_wait_ms: float = 500
+    max_event_loop_lag_ms: float = 200
+    # низкоприоритетные роуты отклоняются раньше - при этой доле от лимитов
+    low_priority_ratio: float = 0.5
+    retry_after_seconds: int = 1
+    # None - пути собираются из префиксов роутеров: health, metrics и refresh
+    # токена никогда не отклоняются, поиск историй отклоняется первым
+    critical_paths: list[str] | None = None
+    low_priority_paths: list[str] | None = None
+
+
+class TracingConfig(BaseModel):
+    enabled: bool = False
+    service_name: str = "pet-project"
+    exporter: Literal["otlp", "file"] = "otlp"
+    otlp_endpoint: str = "http://localhost:4318/v1/traces"
+    file_path: Path = Path(__file__).parent.parent / "logs" / "traces.jsonl"
+
+
+class WarmupConfig(BaseModel):
+    enabled: bool = True
+    # None - столько соединений, сколько держит пул (db.pool_size)
+    db_connections: int | None = None
+    redis_connections: int = 10
+
+
 class MainRouterConfig(BaseModel):
     prefix: str = "/api"
 
@@ -116,18 +220,23 @@ class AuthRouterConfig(BaseModel):
     send_email_token_endpoint_path: str = "/send-email-verification-token"
     forgot_password_endpoint_path: str = "/forgot-password"
     change_password_endpoint_path: str = "/change-password"
+    statement_timeout_ms: int | None = 5000
 
 
 class StoriesRouterConfig(BaseModel):
     prefix: str = "/stories"
     tags: list[str | Enum] = ["Stories"]
     get_stories_endpoint_path: str = "/all"
+    stories_per_page: int = 20
     get_story_endpoint_path: str = "/{story_uuid}"
     get_stories_by_name_or_text_endpoint_path: str = "/search"
     create_story_endpoint_path: str = "/"
     edit_story_endpoint_path: str = "/{story_uuid}"
     delete_story_endpoint_path: str = "/{story_uuid}"
     like_story_endpoint_path: str = "/{story_uuid}/like"
+    # SET LOCAL statement_timeout для запросов роутера, None - без ограничения
+    statement_timeout_ms: int | None = 5000
+    search_statement_timeout_ms: int | None = 2000
 
 
 class UsersRouterConfig(BaseModel):
@@ -138,6 +247,8 @@ class UsersRouterConfig(BaseModel):
     get_user_endpoint_path: str = "/{username}"
     edit_profile_endpoint_path: str = "/me"
     get_avatar_endpoint_path: str = "/{username}/avatar"
+    get_avatars_metadata_endpoint_path: str = "/avatars/batch"
+    statement_timeout_ms: int | None = 5000
 
 
 class AdminRouterConfig(BaseModel):
@@ -149,6 +260,7 @@ class AdminRouterConfig(BaseModel):
     demote_admin_endpoint_path: str = "/demote-admin"
     block_user_endpoint_path: str = "/block-user"
     unblock_user_endpoint_path: str = "/unblock-user"
+    statement_timeout_ms: int | None = 5000
 
 
 class SmtpConfig(BaseModel):
@@ -164,21 +276,95 @@ class SmtpConfig(BaseModel):
     VALIDATE_CERTS: bool
 
 
+class EmailOutboxConfig(BaseModel):
+    key_prefix: str = "email:outbox"
+    batch_size: int = 50
+    poll_interval_seconds: float = 1
+    # письмо, которое воркер взял и не подтвердил за это время, снова станет доступно
+    lease_seconds: int = 60
+    max_attempts: int = 8
+    retry_base_seconds: float = 5
+    retry_max_seconds: float = 15 * 60
+    smtp_connections: int = 4
+    smtp_timeout_seconds: float = 30
+    domain_rate_per_second: float = 5
+    domain_burst: int = 10
+    domain_rate_overrides: dict[str, float] = {}
+
+
+class EmailThrottleConfig(BaseModel):
+    key_prefix: str = "email:throttle"
+    # повторный запрос письма в этом окне не создает новый код и не шлет письмо
+    coalesce_window_seconds: int = 60
+    # token bucket: размер ведра и время, за которое восстанавливается один токен
+    email_bucket_size: int = 3
+    email_refill_seconds: float = 10 * 60
+    ip_bucket_size: int = 10
+    ip_refill_seconds: float = 60
+
+
 class EmailTokensConfig(BaseModel):
     token_length: int = 6
     token_symbols: str = string.ascii_lowercase + string.digits
     email_verification_token_exp_minutes: int = 10
     forgot_password_token_exp_minutes: int = 10
+    # redis - коды живут в ключах с EX, postgres - в таблице email_codes
+    storage: Literal["redis", "postgres"] = "redis"
+    key_prefix: str = "email:codes"
+    issue_attempts: int = 5
+
+
+class StoriesCacheConfig(BaseModel):
+    feed_key: str = "stories:feed"
+    feed_complete_key: str = "stories:feed:complete"
+    story_key_prefix: str = "stories:feed:story:"
+    # растет при каждом изменении ленты, заполнение из БД сверяется с ним
+    feed_version_key: str = "stories:feed:version"
+    feed_lock_key: str = "stories:feed:lock"
+    feed_lock_seconds: int = 5
+    feed_max_size: int = 1000
+    ttl_seconds: int = 60 * 60
+    detail_key_prefix: str = "stories:detail:"
+    detail_lock_key_prefix: str = "stories:detail:lock:"
+    detail_generation_key_prefix: str = "stories:detail:generation:"
+    detail_fresh_seconds: float = 5
+    detail_stale_seconds: float = 60
+    # сколько помнить, что истории нет, чтобы повторные 404 не шли в БД
+    detail_missing_seconds: int = 5
+    detail_lock_seconds: int = 5
+
+
+class AvatarS3Config(BaseModel):
+    endpoint_url: str | None = None
+    region_name: str | None = None
+    bucket: str = "avatars"
+    key_prefix: str = ""
+    access_key_id: str | None = None
+    secret_access_key: str | None = None
+    presigned_url_expire_seconds: int = 60 * 60
 
 
 class AvatarConfig(BaseModel):
+    storage: Literal["local", "s3"] = "local"
     avatars_dir: Path = Path(__file__).parent.parent / "avatars"
+    x_accel_redirect: bool = False
+    x_accel_redirect_location: str = "/protected-avatars/"
     allowed_extensions_to_mime: dict[str, str] = {
         ".jpg": "image/jpeg",
         ".jpeg": "image/jpeg",
         ".png": "image/png",
     }
     size: tuple[int, int] = (200, 200)
+    path_cache_max_size: int = 10_000
+    # кэш путей свой у каждого воркера: сброс рассылается через этот канал,
+    # а TTL ограничивает устаревание, если сообщение не дошло
+    path_cache_ttl_seconds: float = 60
+    path_cache_invalidation_channel: str = "avatars:path_cache:invalidate"
+    # адрес аватара не меняется при замене файла, поэтому клиент каждый раз
+    # перепроверяет его по ETag и получает 304, если аватар тот же
+    cache_control: str = "public, no-cache"
+    batch_max_usernames: int = 100
+    s3: AvatarS3Config = AvatarS3Config()
 
 
 class Settings(BaseSettings):
@@ -193,15 +379,25 @@ class Settings(BaseSettings):
     redis: RedisConfig
     log: LoggingConfig = LoggingConfig()
     jwt_auth: JWTAuthConfig = JWTAuthConfig()
+    password_hashing: PasswordHashingConfig = PasswordHashingConfig()
     cookie: CookieConfig = CookieConfig()
+    metrics: MetricsConfig = MetricsConfig()
+    health: HealthConfig = HealthConfig()
+    loop_monitor: LoopMonitorConfig = LoopMonitorConfig()
+    admission: AdmissionConfig = AdmissionConfig()
+    tracing: TracingConfig = TracingConfig()
+    warmup: WarmupConfig = WarmupConfig()
     main_router: MainRouterConfig = MainRouterConfig()
     v1_router: V1RouterConfig = V1RouterConfig()
     auth_router: AuthRouterConfig = AuthRouterConfig()
     users_router: UsersRouterConfig = UsersRouterConfig()
     admin_router: AdminRouterConfig = AdminRouterConfig()
     smtp: SmtpConfig
+    email_outbox: EmailOutboxConfig = EmailOutboxConfig()
+    email_throttle: EmailThrottleConfig = EmailThrottleConfig()
     email_tokens: EmailTokensConfig = EmailTokensConfig()
     stories_router: StoriesRouterConfig = StoriesRouterConfig()
+    stories_cache: StoriesCacheConfig = StoriesCacheConfig()
     avatar: AvatarConfig = AvatarConfig()
 
 
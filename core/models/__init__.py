@@ -2,6 +2,7 @@ __all__ = (
     "Base",
     "User",
     "Token",
+    "EmailCode",
     "Story",
     "UserStoryAssociation",
 )
@@ -9,5 +10,6 @@ __all__ = (
 from core.models.base import Base
 from core.models.user import User
 from core.models.token import Token
+from core.models.email_code import EmailCode
 from core.models.story import Story
 from core.models.user_story_association import UserStoryAssociation
@@ -0,0 +1,46 @@
+import datetime
+from enum import Enum
+
+from sqlalchemy import ForeignKey, DateTime, String, Index, UniqueConstraint
+from sqlalchemy import text as text_
+from sqlalchemy.orm import Mapped, mapped_column
+
+from core.models.base import Base
+
+
+class EmailCodeKind(str, Enum):
+    EMAIL_VERIFICATION = "email_verification"
+    FORGOT_PASSWORD = "forgot_password"
+
+
+class EmailCode(Base):
+    __tablename__ = "email_codes"
+    __table_args__ = (
+        # у пользователя действует только последний выданный код каждого вида
+        UniqueConstraint("username", "kind"),
+        # поиск идет по хешу кода внутри одного вида, частичный индекс на вид
+        # меньше общего и не хранит строки другого вида
+        *(
+            Index(
+                f"ix_email_codes_{kind.value}_code_hash",
+                "code_hash",
+                unique=True,
+                postgresql_where=text_(f"kind = '{kind.value}'"),
+            )
+            for kind in EmailCodeKind
+        ),
+        Index("ix_email_codes_expires_at", "expires_at"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    username: Mapped[str] = mapped_column(
+        ForeignKey("users.username", ondelete="CASCADE"),
+        nullable=False,
+    )
+    kind: Mapped[str] = mapped_column(String(32), nullable=False)
+    # sha256 от кода, сам код в базе не хранится
+    code_hash: Mapped[str] = mapped_column(String(64), nullable=False)
+    expires_at: Mapped[datetime.datetime] = mapped_column(
+        DateTime(timezone=True),
+        nullable=False,
+    )
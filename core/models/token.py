@@ -1,7 +1,6 @@
-import datetime
 from typing import TYPE_CHECKING
 
-from sqlalchemy import ForeignKey, DateTime
+from sqlalchemy import ForeignKey
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from core.models import Base
@@ -16,14 +15,3 @@ class Token(Base):
     id: Mapped[int] = mapped_column(primary_key=True)
     username: Mapped[str] = mapped_column(ForeignKey("users.username"), unique=True)
     user: Mapped["User"] = relationship(back_populates="tokens")
-
-    email_verification_token: Mapped[str | None] = mapped_column(nullable=True)
-    email_verification_token_exp: Mapped[datetime.datetime | None] = mapped_column(
-        DateTime(timezone=True),
-        nullable=True,
-    )
-    forgot_password_token: Mapped[str | None] = mapped_column(nullable=True)
-    forgot_password_token_exp: Mapped[datetime.datetime | None] = mapped_column(
-        DateTime(timezone=True),
-        nullable=True,
-    )
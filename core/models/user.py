@@ -30,6 +30,8 @@ class User(Base):
         nullable=True,
     )
     avatar_name: Mapped[str | None] = mapped_column(nullable=True)
+    avatar_size: Mapped[int | None] = mapped_column(nullable=True)
+    avatar_etag: Mapped[str | None] = mapped_column(String(64), nullable=True)
     is_active: Mapped[bool] = mapped_column(
         nullable=False,
         default=True,
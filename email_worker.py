@@ -0,0 +1,47 @@
+import asyncio
+import signal
+
+from api.api_v1.dependencies.database.redis_helper import redis_helper
+from api.api_v1.dependencies.log_helper import LogHelper
+from api.api_v1.utils.email_outbox import email_outbox
+from api.api_v1.utils.email_worker import (
+    DomainRateLimiter,
+    EmailWorker,
+    SmtpConnectionPool,
+)
+from core.config import settings
+
+
+async def main() -> None:
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        # текущая пачка дописывается, новые письма не берутся
+        loop.add_signal_handler(signal_number, stop_event.set)
+
+    smtp_pool = SmtpConnectionPool(
+        smtp_config=settings.smtp,
+        size=settings.email_outbox.smtp_connections,
+        timeout=settings.email_outbox.smtp_timeout_seconds,
+    )
+    worker = EmailWorker(
+        config=settings.email_outbox,
+        outbox=email_outbox,
+        smtp_pool=smtp_pool,
+        rate_limiter=DomainRateLimiter(
+            rate_per_second=settings.email_outbox.domain_rate_per_second,
+            burst=settings.email_outbox.domain_burst,
+            overrides=settings.email_outbox.domain_rate_overrides,
+        ),
+        cache=redis_helper.get_redis(),
+    )
+    try:
+        await worker.run(stop_event)
+    finally:
+        await smtp_pool.close()
+        await redis_helper.close()
+        LogHelper.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,18 +1,85 @@
-import time
+from collections.abc import AsyncGenerator
+from contextlib import asynccontextmanager
 
 import uvicorn
 from fastapi import FastAPI
+from fastapi.exception_handlers import http_exception_handler
+from sqlalchemy.exc import DBAPIError
 from starlette.requests import Request
-from starlette.responses import Response
+from api.api_v1.dependencies.database.db_helper import db_helper
+from api.api_v1.dependencies.database.redis_helper import redis_helper
 from api.api_v1.dependencies.log_helper import LogHelper
+from api.api_v1.dependencies.tracing_helper import tracing_helper
+from api.api_v1.exceptions.http_exceptions import StatementTimeoutExceeded
+from api.api_v1.middlewares.admission import AdmissionControlMiddleware
+from api.api_v1.middlewares.client_disconnect import ClientDisconnectMiddleware
+from api.api_v1.middlewares.process_time import ProcessTimeMiddleware
+from api.api_v1.utils.avatar_storage import avatar_storage
+from api.api_v1.utils.cache_invalidation import avatar_path_invalidation
+from api.api_v1.utils.json_response import FastJSONResponse
+from api.api_v1.utils.loop_monitor import event_loop_monitor
+from api.api_v1.utils.metrics import instrument_db_pool, mark_metrics_process_dead
+from api.api_v1.utils.query_tracking import instrument_query_tracking
+from api.api_v1.utils.sql_comments import instrument_sql_comments
+from api.api_v1.utils.statement_timeout import (
+    instrument_statement_timeout,
+    is_statement_timeout_error,
+)
+from api.api_v1.utils.story_cache import story_detail_cache
+from api.api_v1.utils.warmup import warmup
+from api.health_router import health_router
 from api.main_router import api_router
+from api.metrics_router import metrics_router
 from core.config import settings
 
 logger = LogHelper.get_api_logger()
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
+    app.state.is_ready = False
+    tracing_helper.setup()
+    if settings.loop_monitor.enabled:
+        event_loop_monitor.start()
+    avatar_path_invalidation.start()
+    if settings.warmup.enabled:
+        try:
+            await warmup()
+        except Exception as exc:
+            # без прогрева приложение работает, просто первые запросы будут медленнее
+            logger.error("Warmup failed. Exception=%r", exc, exc_info=exc)
+    app.state.is_ready = True
+    yield
+    app.state.is_ready = False
+    await event_loop_monitor.stop()
+    await avatar_path_invalidation.stop()
+    await story_detail_cache.close()
+    await avatar_storage.close()
+    await redis_helper.close()
+    await db_helper.dispose()
+    tracing_helper.shutdown()
+    mark_metrics_process_dead()
+    LogHelper.shutdown()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
+
+app.add_middleware(ClientDisconnectMiddleware)
+if settings.admission.enabled:
+    # добавляется раньше, чтобы отклоненные запросы тоже попадали в логи и метрики
+    app.add_middleware(AdmissionControlMiddleware)
+app.add_middleware(ProcessTimeMiddleware)
 
 app.include_router(router=api_router)
+app.include_router(router=metrics_router)
+app.include_router(router=health_router)
+
+if settings.db.sql_comments:
+    instrument_sql_comments(db_helper.engine)
+instrument_db_pool(db_helper.engine)
+instrument_statement_timeout()
+instrument_query_tracking(db_helper.engine)
+tracing_helper.instrument_engine(db_helper.engine)
 
 
 @app.exception_handler(Exception)
@@ -27,28 +94,19 @@ async def global_exception_handler(request: Request, exc: Exception):
     raise exc
 
 
-@app.middleware("http")
-async def process_time_log_middleware(request: Request, call_next):
-    request_id = request.headers.get("X-Request-ID")
-    LogHelper.set_request_id(request_id)
-
-    start_time = time.time()
-    response: Response = await call_next(request)
-    process_time = round(time.time() - start_time, 3)
-    logger.info(
-        "Method=%s Path=%s StatusCode=%s ProcessTime=%s",
+@app.exception_handler(DBAPIError)
+async def db_exception_handler(request: Request, exc: DBAPIError):
+    if not is_statement_timeout_error(exc):
+        # остальные ошибки БД обрабатывает global_exception_handler
+        raise exc
+    logger.warning(
+        "Method=%s Path=%s Statement timeout exceeded. Exception=%r",
         request.method,
         request.url.path,
-        response.status_code,
-        process_time,
+        exc,
     )
-    return response
+    return await http_exception_handler(request, StatementTimeoutExceeded())
 
 
 if __name__ == "__main__":
-    uvicorn.run(
-        "main:app",
-        host=settings.run.host,
-        port=settings.run.port,
-        reload=True,
-    )
+    uvicorn.run("main:app", **settings.run.get_uvicorn_options())
@@ -0,0 +1,32 @@
+"""add avatar metadata to users
+
+Revision ID: 4f1c2a9d7e3b
+Revises: 085ea4d1ce71
+Create Date: 2026-10-19 11:42:08.511204
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "4f1c2a9d7e3b"
+down_revision: Union[str, None] = "085ea4d1ce71"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("users", sa.Column("avatar_size", sa.Integer(), nullable=True))
+    op.add_column(
+        "users", sa.Column("avatar_etag", sa.String(length=64), nullable=True)
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("users", "avatar_etag")
+    op.drop_column("users", "avatar_size")
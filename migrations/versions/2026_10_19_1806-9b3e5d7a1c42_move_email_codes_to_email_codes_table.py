@@ -0,0 +1,99 @@
+"""move email codes to email_codes table
+
+Revision ID: 9b3e5d7a1c42
+Revises: 4f1c2a9d7e3b
+Create Date: 2026-10-19 18:06:31.274519
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "9b3e5d7a1c42"
+down_revision: Union[str, None] = "4f1c2a9d7e3b"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "email_codes",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("username", sa.String(length=150), nullable=False),
+        sa.Column("kind", sa.String(length=32), nullable=False),
+        sa.Column("code_hash", sa.String(length=64), nullable=False),
+        sa.Column("expires_at", sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["username"],
+            ["users.username"],
+            name=op.f("fk_email_codes_username_users"),
+            ondelete="CASCADE",
+        ),
+        sa.PrimaryKeyConstraint("id", name=op.f("pk_email_codes")),
+        sa.UniqueConstraint("username", "kind", name=op.f("uq_email_codes_username")),
+    )
+    op.create_index(
+        "ix_email_codes_email_verification_code_hash",
+        "email_codes",
+        ["code_hash"],
+        unique=True,
+        postgresql_where=sa.text("kind = 'email_verification'"),
+    )
+    op.create_index(
+        "ix_email_codes_forgot_password_code_hash",
+        "email_codes",
+        ["code_hash"],
+        unique=True,
+        postgresql_where=sa.text("kind = 'forgot_password'"),
+    )
+    op.create_index("ix_email_codes_expires_at", "email_codes", ["expires_at"])
+    # коды живут минуты, поэтому действующие коды не переносятся:
+    # пользователь просто запросит новый
+    op.drop_column("tokens", "forgot_password_token_exp")
+    op.drop_column("tokens", "forgot_password_token")
+    op.drop_column("tokens", "email_verification_token_exp")
+    op.drop_column("tokens", "email_verification_token")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.add_column(
+        "tokens",
+        sa.Column("email_verification_token", sa.String(), nullable=True),
+    )
+    op.add_column(
+        "tokens",
+        sa.Column(
+            "email_verification_token_exp",
+            sa.DateTime(timezone=True),
+            nullable=True,
+        ),
+    )
+    op.add_column(
+        "tokens",
+        sa.Column("forgot_password_token", sa.String(), nullable=True),
+    )
+    op.add_column(
+        "tokens",
+        sa.Column(
+            "forgot_password_token_exp",
+            sa.DateTime(timezone=True),
+            nullable=True,
+        ),
+    )
+    op.drop_index("ix_email_codes_expires_at", table_name="email_codes")
+    op.drop_index(
+        "ix_email_codes_forgot_password_code_hash",
+        table_name="email_codes",
+        postgresql_where=sa.text("kind = 'forgot_password'"),
+    )
+    op.drop_index(
+        "ix_email_codes_email_verification_code_hash",
+        table_name="email_codes",
+        postgresql_where=sa.text("kind = 'email_verification'"),
+    )
+    op.drop_table("email_codes")
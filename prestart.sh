@@ -19,6 +19,14 @@ chmod o+r certificates/ssl_certificate_key.pem
 echo "Certificates generated"
 
 
+if [ -n "$PROMETHEUS_MULTIPROC_DIR" ]; then
+  echo "Prepare Prometheus multiprocess directory..."
+  rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+  mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+  echo "Prometheus multiprocess directory prepared"
+fi
+
+
 echo "Apply migrations..."
 uv run alembic upgrade head
 echo "Migrations applied"
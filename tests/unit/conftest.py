@@ -3,12 +3,12 @@ import os
 os.environ["TESTING"] = "1"
 import asyncio
 import datetime
+import pathlib
 from asyncio import AbstractEventLoop
 from typing import Generator
-from unittest.mock import AsyncMock, Mock, MagicMock, patch
+from unittest.mock import AsyncMock, patch
 
 import pytest
-from fastapi import BackgroundTasks
 from sqlalchemy.ext.asyncio import AsyncSession
 
 
@@ -29,13 +29,16 @@ def mock_jwt_keys() -> Generator[None, None, None]:
     private_key_content = "mock private key"
     public_key_content = "mock public key"
 
-    def mock_read_text(self):
+    read_text = pathlib.Path.read_text
+
+    def mock_read_text(self, *args, **kwargs):
         path_str = str(self)
         if "private" in path_str:
             return private_key_content
         elif "public" in path_str:
             return public_key_content
-        return private_key_content
+        # остальные файлы (например, скрипты fakeredis) читаются как есть
+        return read_text(self, *args, **kwargs)
 
     with patch("pathlib.Path.read_text", side_effect=mock_read_text, autospec=True):
         yield
@@ -46,17 +49,6 @@ def mock_db_session() -> AsyncMock:
     return AsyncMock(spec=AsyncSession)
 
 
-@pytest.fixture()
-def mock_background_tasks() -> Mock:
-    return Mock(spec=BackgroundTasks)
-
-
-@pytest.fixture()
-def mock_fastmail() -> Generator[MagicMock, None, None]:
-    with patch("api.api_v1.utils.email.fm") as mock:
-        yield mock
-
-
 @pytest.fixture()
 def mock_datetime_now(monkeypatch) -> datetime.datetime:
     fixed_now = datetime.datetime(
@@ -1,28 +1,80 @@
+import asyncio
 import datetime
+import hashlib
+import logging
+import os
+import queue
+import socket
+import subprocess
+import sys
+import time
 import uuid
+from collections.abc import Generator
+from contextlib import asynccontextmanager
 from io import BytesIO
+from pathlib import Path
 from typing import Any
-from unittest.mock import AsyncMock, MagicMock, Mock, patch
+from unittest.mock import ANY, AsyncMock, MagicMock, Mock, patch
 from uuid import UUID
 
 import bcrypt
 import jwt
 import pytest
 from PIL import Image
+from redis.exceptions import ConnectionError as RedisConnectionError
 from fastapi import UploadFile
-from fastapi_mail import MessageSchema, MessageType
+from prometheus_client import REGISTRY
 from sqlalchemy import Result
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import DBAPIError, IntegrityError, SQLAlchemyError
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.util import greenlet_spawn
+from starlette.responses import (
+    FileResponse,
+    JSONResponse,
+    RedirectResponse,
+    Response,
+)
 
+from api.api_v1.dependencies.auth import limit_email_requests_by_ip
+from api.api_v1.dependencies.log_helper import BoundedQueueHandler, LogHelper
+from api.api_v1.dependencies.database.db_helper import (
+    DbHelper,
+    TimedAsyncAdaptedQueuePool,
+)
+from api.api_v1.dependencies.database.redis_helper import (
+    InstrumentedRedis,
+    RedisHelper,
+)
+from api.api_v1.dependencies.tracing_helper import (
+    REQUEST_ID_ATTRIBUTE,
+    TracingHelper,
+)
+from api.api_v1.exceptions.http_exceptions import AvatarNotFound, TooManyEmailRequests
+from api.api_v1.middlewares.admission import AdmissionControlMiddleware
+from api.api_v1.middlewares.client_disconnect import ClientDisconnectMiddleware
+from api.api_v1.middlewares.process_time import (
+    ProcessTimeMiddleware,
+    UNMATCHED_ROUTE,
+)
+from api.api_v1.utils.admission import AdmissionController
+from api.api_v1.utils.cache import (
+    get_cached_stories_page,
+    get_feed_version,
+    fill_stories_feed,
+    add_story_to_feed,
+    update_story_in_feed,
+    remove_story_from_feed,
+    acquire_feed_fill_lock,
+)
 from api.api_v1.utils.database import (
     get_user_by_username_or_email,
-    get_user_by_email_verification_token,
-    get_user_by_forgot_password_token,
-    update_user_email_verification_token,
-    update_forgot_password_token,
     change_user_password,
     confirm_user_email,
-    get_stories,
+    get_story_list_items,
+    get_user_list_items,
     get_stories_by_name_or_text,
     get_story_by_uuid,
     create_user_with_tokens,
@@ -31,22 +83,85 @@ from api.api_v1.utils.database import (
     delete_story,
     like_story,
     update_user,
-    get_active_users,
-    get_inactive_users,
+    get_avatars_metadata,
     make_admin,
     demote_admin,
     block_user,
     unblock_user,
 )
-from api.api_v1.utils.email import send_plain_message_to_email
-from api.api_v1.utils.files import save_avatar, delete_avatar
+from api.api_v1.routers.stories import get_stories_endpoint
+from api.api_v1.routers.users import get_avatar_endpoint
+from api.api_v1.schemas.email import OutboxEmailScheme
+from api.api_v1.schemas.story import StoryScheme
+from api.api_v1.utils.avatar_storage import LocalAvatarStorage, S3AvatarStorage
+from api.api_v1.utils.email import build_email_message, send_plain_message_to_email
+from api.api_v1.utils.email_codes import (
+    PostgresEmailCodeStore,
+    RedisEmailCodeStore,
+    hash_code,
+)
+from api.api_v1.utils.email_outbox import EmailOutbox
+from api.api_v1.utils.email_throttle import EmailThrottle
+from api.api_v1.utils.email_worker import (
+    DomainRateLimiter,
+    EmailWorker,
+    SmtpConnectionPool,
+)
+from api.api_v1.utils.files import (
+    save_avatar,
+    delete_avatar,
+    get_avatar_size_and_etag,
+    get_avatar_url,
+    is_etag_matching,
+)
 from api.api_v1.utils.jwt_auth import (
+    JWTKeys,
+    jwt_keys,
     encode_jwt,
     decode_jwt,
     create_jwt,
     create_access_token,
     create_refresh_token,
 )
+from api.api_v1.utils.health import HealthChecker, check_event_loop, check_jwt_keys
+from api.api_v1.utils.json_response import (
+    FastJSONResponse,
+    get_type_adapter,
+    model_json_response,
+)
+from api.api_v1.utils.loop_monitor import EventLoopMonitor
+from api.api_v1.utils.cache_invalidation import (
+    CacheInvalidation,
+    avatar_path_invalidation,
+)
+from api.api_v1.utils.memory_cache import TTLLRUCache, avatar_path_cache
+from api.api_v1.utils.metrics import (
+    observe_request,
+    generate_metrics,
+    instrument_db_pool,
+    PendingWaits,
+    RecentMax,
+    db_pool_pending_waits,
+)
+from api.api_v1.utils.query_tracking import (
+    SERVICE_QUERY_OPTION,
+    QueryBudgetExceeded,
+    find_calling_helper,
+    instrument_query_tracking,
+    track_queries,
+)
+from api.api_v1.utils.sql_comments import (
+    build_sql_comment,
+    instrument_sql_comments,
+    set_request_scope,
+)
+from api.api_v1.utils.statement_timeout import (
+    StatementTimeout,
+    instrument_statement_timeout,
+    is_statement_timeout_error,
+)
+from api.api_v1.utils.story_cache import StoryDetailCache
+from api.api_v1.utils.warmup import warmup
 from api.api_v1.utils.security import (
     hash_password,
     verify_password,
@@ -54,9 +169,24 @@ from api.api_v1.utils.security import (
     generate_email_token,
     validate_avatar_extension,
     validate_avatar_size,
+    hash_password_async,
+    verify_password_async,
+)
+from core.config import (
+    settings,
+    AdmissionConfig,
+    AvatarS3Config,
+    EmailOutboxConfig,
+    EmailThrottleConfig,
+    EmailTokensConfig,
+    HealthConfig,
+    LoopMonitorConfig,
+    RunConfig,
+    StoriesCacheConfig,
+    TracingConfig,
 )
-from core.config import settings
 from core.models import User, Token, Story
+from core.models.email_code import EmailCodeKind
 from core.models.user import Role
 
 
@@ -156,86 +286,6 @@ class TestDatabase:
             mock_db_session.execute.assert_awaited_once()
             assert user is None
 
-    class TestGetUserByEmailVerificationToken:
-        async def test_existent_token(
-            self,
-            mock_db_session: AsyncMock,
-        ):
-            token = "valid_token"
-            mock_user = User(
-                tokens=Token(
-                    email_verification_token=token,
-                ),
-            )
-            mock_result = MagicMock(spec=Result)
-            mock_result.scalar_one_or_none.return_value = mock_user
-            mock_db_session.execute.return_value = mock_result
-
-            user = await get_user_by_email_verification_token(
-                email_verification_token=token,
-                session=mock_db_session,
-            )
-
-            mock_db_session.execute.assert_awaited_once()
-            assert user == mock_user
-
-        async def test_nonexistent_token(
-            self,
-            mock_db_session: AsyncMock,
-        ):
-            token = "nonexistent_token"
-            mock_result = MagicMock(spec=Result)
-            mock_result.scalar_one_or_none.return_value = None
-            mock_db_session.execute.return_value = mock_result
-
-            user = await get_user_by_email_verification_token(
-                email_verification_token=token,
-                session=mock_db_session,
-            )
-
-            mock_db_session.execute.assert_awaited_once()
-            assert user is None
-
-    class TestGetUserByForgotPasswordToken:
-        async def test_existent_token(
-            self,
-            mock_db_session: AsyncMock,
-        ):
-            token = "valid_token"
-            mock_user = User(
-                tokens=Token(
-                    forgot_password_token=token,
-                ),
-            )
-            mock_result = MagicMock(spec=Result)
-            mock_result.scalar_one_or_none.return_value = mock_user
-            mock_db_session.execute.return_value = mock_result
-
-            user = await get_user_by_forgot_password_token(
-                forgot_password_token=token,
-                session=mock_db_session,
-            )
-
-            mock_db_session.execute.assert_awaited_once()
-            assert user == mock_user
-
-        async def test_nonexistent_token(
-            self,
-            mock_db_session: AsyncMock,
-        ):
-            token = "nonexistent_token"
-            mock_result = MagicMock(spec=Result)
-            mock_result.scalar_one_or_none.return_value = None
-            mock_db_session.execute.return_value = mock_result
-
-            user = await get_user_by_forgot_password_token(
-                forgot_password_token=token,
-                session=mock_db_session,
-            )
-
-            mock_db_session.execute.assert_awaited_once()
-            assert user is None
-
     class TestCreateUserWithTokens:
         async def test_success(
             self,
@@ -287,113 +337,6 @@ class TestDatabase:
             mock_db_session.commit.assert_awaited_once()
             mock_db_session.rollback.assert_awaited_once()
 
-    class TestUpdateUserEmailVerificationToken:
-        async def test_success(
-            self,
-            mock_db_session: AsyncMock,
-        ):
-            user = User(tokens=Token())
-            email_verification_token = "new_email_verification_token"
-            expire_minutes = 5
-
-            updated_user = await update_user_email_verification_token(
-                user=user,
-                email_verification_token=email_verification_token,
-                expire_minutes=expire_minutes,
-                session=mock_db_session,
-            )
-
-            assert isinstance(updated_user, User)
-            assert (
-                updated_user.tokens.email_verification_token == email_verification_token
-            )
-            expected_expiration = datetime.datetime.now(
-                datetime.UTC
-            ) + datetime.timedelta(minutes=expire_minutes)
-            assert updated_user.tokens.email_verification_token_exp is not None
-            expiration_time_diff = abs(
-                (
-                    updated_user.tokens.email_verification_token_exp
-                    - expected_expiration
-                ).total_seconds()
-            )
-            assert expiration_time_diff < 10
-            mock_db_session.commit.assert_awaited_once()
-            mock_db_session.refresh.assert_awaited_once()
-
-        async def test_with_exception(
-            self,
-            mock_db_session: AsyncMock,
-        ):
-            user = User(tokens=Token())
-            email_verification_token = "new_email_verification_token"
-            expire_minutes = 5
-            mock_db_session.commit.side_effect = SQLAlchemyError("Test error")
-
-            with pytest.raises(SQLAlchemyError, match="Test error"):
-                await update_user_email_verification_token(
-                    user=user,
-                    email_verification_token=email_verification_token,
-                    expire_minutes=expire_minutes,
-                    session=mock_db_session,
-                )
-
-            mock_db_session.commit.assert_awaited_once()
-            mock_db_session.rollback.assert_awaited_once()
-            mock_db_session.refresh.assert_not_awaited()
-
-    class TestUpdateForgotPasswordToken:
-        async def test_success(
-            self,
-            mock_db_session: AsyncMock,
-        ):
-            user = User(tokens=Token())
-            forgot_password_token = "new_forgot_password_token"
-            expire_minutes = 5
-
-            updated_user = await update_forgot_password_token(
-                user=user,
-                forgot_password_token=forgot_password_token,
-                expire_minutes=expire_minutes,
-                session=mock_db_session,
-            )
-
-            assert isinstance(updated_user, User)
-            assert updated_user.tokens.forgot_password_token == forgot_password_token
-            expected_expiration = datetime.datetime.now(
-                datetime.UTC
-            ) + datetime.timedelta(minutes=expire_minutes)
-            assert updated_user.tokens.forgot_password_token_exp is not None
-            expiration_time_diff = abs(
-                (
-                    updated_user.tokens.forgot_password_token_exp - expected_expiration
-                ).total_seconds()
-            )
-            assert expiration_time_diff < 10
-            mock_db_session.commit.assert_awaited_once()
-            mock_db_session.refresh.assert_awaited_once()
-
-        async def test_with_exception(
-            self,
-            mock_db_session: AsyncMock,
-        ):
-            user = User(tokens=Token())
-            forgot_password_token = "new_forgot_password_token"
-            expire_minutes = 5
-            mock_db_session.commit.side_effect = SQLAlchemyError("Test error")
-
-            with pytest.raises(SQLAlchemyError, match="Test error"):
-                await update_forgot_password_token(
-                    user=user,
-                    forgot_password_token=forgot_password_token,
-                    expire_minutes=expire_minutes,
-                    session=mock_db_session,
-                )
-
-            mock_db_session.commit.assert_awaited_once()
-            mock_db_session.rollback.assert_awaited_once()
-            mock_db_session.refresh.assert_not_awaited()
-
     class TestChangeUserPassword:
         async def test_success(
             self,
@@ -401,15 +344,7 @@ class TestDatabase:
         ):
             hashed_password = b"password"
             new_hashed_password = b"new_password"
-            forgot_password_token = "forgot_password_token"
-            forgot_password_token_exp = datetime.datetime.now(datetime.UTC)
-            mock_user = User(
-                hashed_password=hashed_password,
-                tokens=Token(
-                    forgot_password_token=forgot_password_token,
-                    forgot_password_token_exp=forgot_password_token_exp,
-                ),
-            )
+            mock_user = User(hashed_password=hashed_password)
 
             updated_user = await change_user_password(
                 user=mock_user,
@@ -419,8 +354,6 @@ class TestDatabase:
 
             assert isinstance(updated_user, User)
             assert updated_user.hashed_password == new_hashed_password
-            assert updated_user.tokens.forgot_password_token is None
-            assert updated_user.tokens.forgot_password_token_exp is None
             mock_db_session.commit.assert_awaited_once()
             mock_db_session.refresh.assert_awaited_once()
             mock_db_session.rollback.assert_not_awaited()
@@ -431,15 +364,7 @@ class TestDatabase:
         ):
             hashed_password = b"password"
             new_hashed_password = b"new_password"
-            forgot_password_token = "forgot_password_token"
-            forgot_password_token_exp = datetime.datetime.now(datetime.UTC)
-            mock_user = User(
-                hashed_password=hashed_password,
-                tokens=Token(
-                    forgot_password_token=forgot_password_token,
-                    forgot_password_token_exp=forgot_password_token_exp,
-                ),
-            )
+            mock_user = User(hashed_password=hashed_password)
             mock_db_session.commit.side_effect = SQLAlchemyError("Test error")
 
             with pytest.raises(SQLAlchemyError, match="Test error"):
@@ -458,18 +383,11 @@ class TestDatabase:
             self,
             mock_db_session: AsyncMock,
         ):
-            email_verification_token = "email_verification_token"
-            email_verification_token_exp = datetime.datetime.now(datetime.UTC)
-            mock_user = User(
-                is_email_verified=False,
-                tokens=Token(
-                    email_verification_token=email_verification_token,
-                    email_verification_token_exp=email_verification_token_exp,
-                ),
-            )
+            mock_user = User(is_email_verified=False)
 
             await confirm_user_email(user=mock_user, session=mock_db_session)
 
+            assert mock_user.is_email_verified is True
             mock_db_session.commit.assert_awaited_once()
             mock_db_session.rollback.assert_not_awaited()
 
@@ -477,15 +395,7 @@ class TestDatabase:
             self,
             mock_db_session: AsyncMock,
         ):
-            email_verification_token = "email_verification_token"
-            email_verification_token_exp = datetime.datetime.now(datetime.UTC)
-            mock_user = User(
-                is_email_verified=False,
-                tokens=Token(
-                    email_verification_token=email_verification_token,
-                    email_verification_token_exp=email_verification_token_exp,
-                ),
-            )
+            mock_user = User(is_email_verified=False)
             mock_db_session.commit.side_effect = SQLAlchemyError("Test error")
 
             with pytest.raises(SQLAlchemyError, match="Test error"):
@@ -494,46 +404,6 @@ class TestDatabase:
             mock_db_session.commit.assert_awaited_once()
             mock_db_session.rollback.assert_awaited_once()
 
-    class TestGetStories:
-        async def test_some_stories(
-            self,
-            mock_db_session: AsyncMock,
-        ):
-            mock_story1 = Story(name="story 1")
-            mock_story2 = Story(name="story 2")
-
-            mock_scalars_result = MagicMock(spec=Result)
-            mock_scalars_result.fetchall.return_value = [mock_story1, mock_story2]
-
-            mock_result = MagicMock(spec=Result)
-            mock_result.scalars.return_value = mock_scalars_result
-
-            mock_db_session.execute.return_value = mock_result
-
-            stories = await get_stories(session=mock_db_session)
-
-            assert len(stories) == 2
-            assert stories[0].name == mock_story1.name
-            assert stories[1].name == mock_story2.name
-            mock_db_session.execute.assert_awaited_once()
-
-        async def test_empty_result(
-            self,
-            mock_db_session: AsyncMock,
-        ):
-            mock_scalars_result = MagicMock(spec=Result)
-            mock_scalars_result.fetchall.return_value = []
-
-            mock_result = MagicMock(spec=Result)
-            mock_result.scalars.return_value = mock_scalars_result
-
-            mock_db_session.execute.return_value = mock_result
-
-            stories = await get_stories(session=mock_db_session)
-
-            assert len(stories) == 0
-            mock_db_session.execute.assert_awaited_once()
-
     class TestGetStoriesByNameOrText:
         async def test_empty_result(
             self,
@@ -639,6 +509,21 @@ class TestDatabase:
             assert stories[2].text == mock_story3.text
             mock_db_session.execute.assert_awaited_once()
 
+        async def test_list_projection(
+            self,
+            mock_db_session: AsyncMock,
+        ):
+            mock_db_session.execute.return_value = MagicMock(spec=Result)
+
+            await get_stories_by_name_or_text(query="test", session=mock_db_session)
+
+            stmt = mock_db_session.execute.call_args.args[0]
+            sql = str(stmt.compile(dialect=postgresql.dialect()))
+            selected_columns, filters = sql.split("FROM")
+            assert "stories.text" not in selected_columns
+            assert "stories.text ILIKE" in filters
+            assert "JOIN" not in sql
+
     class TestGetStoryByUuid:
         async def test_success(
             self,
@@ -678,97 +563,74 @@ class TestDatabase:
             mock_db_session.execute.assert_awaited_once()
             assert story is None
 
-    class TestGetActiveUsers:
+    class TestGetAvatarsMetadata:
         async def test_success(
             self,
             mock_db_session: AsyncMock,
         ):
-            mock_user1 = User(
-                username="user1",
-                is_active=True,
-            )
-            mock_user2 = User(
-                username="user2",
-                is_active=True,
-            )
-            mock_result = MagicMock(spec=Result)
-            mock_result.scalars.return_value.fetchall.return_value = [
-                mock_user1,
-                mock_user2,
+            rows = [
+                ("user1", "user1.png", 1024, "etag1"),
+                ("user2", None, None, None),
             ]
-            mock_db_session.execute.return_value = mock_result
-
-            active_users = await get_active_users(
-                session=mock_db_session,
-            )
-
-            mock_db_session.execute.assert_awaited_once()
-            assert len(active_users) == 2
-            assert active_users[0].username == "user1"
-            assert active_users[0].is_active
-            assert active_users[1].username == "user2"
-            assert active_users[1].is_active
-
-        async def test_empty_result(
-            self,
-            mock_db_session: AsyncMock,
-        ):
             mock_result = MagicMock(spec=Result)
-            mock_result.scalars.return_value.fetchall.return_value = []
+            mock_result.all.return_value = rows
             mock_db_session.execute.return_value = mock_result
 
-            active_users = await get_active_users(
+            avatars_metadata = await get_avatars_metadata(
+                usernames=["user1", "user2"],
                 session=mock_db_session,
             )
 
             mock_db_session.execute.assert_awaited_once()
-            assert len(active_users) == 0
+            assert avatars_metadata == rows
+            stmt = mock_db_session.execute.call_args.args[0]
+            compiled = str(stmt.compile(dialect=postgresql.dialect()))
+            assert "users.username = ANY (%(usernames)s::VARCHAR[])" in compiled
 
-    class TestGetInactiveUsers:
+    class TestGetStoryListItems:
         async def test_success(
             self,
             mock_db_session: AsyncMock,
         ):
-            mock_user1 = User(
-                username="user1",
-                is_active=False,
-            )
-            mock_user2 = User(
-                username="user2",
-                is_active=False,
-            )
-            mock_result = MagicMock(spec=Result)
-            mock_result.scalars.return_value.fetchall.return_value = [
-                mock_user1,
-                mock_user2,
+            story_id = uuid.uuid4()
+            created_at = datetime.datetime.now(datetime.UTC)
+            mock_db_session.execute.return_value = [
+                (story_id, "name", 1, created_at, "username"),
             ]
-            mock_db_session.execute.return_value = mock_result
 
-            inactive_users = await get_inactive_users(
-                session=mock_db_session,
-            )
+            stories = await get_story_list_items(session=mock_db_session, page=2)
 
-            mock_db_session.execute.assert_awaited_once()
-            assert len(inactive_users) == 2
-            assert inactive_users[0].username == "user1"
-            assert not inactive_users[0].is_active
-            assert inactive_users[1].username == "user2"
-            assert not inactive_users[1].is_active
+            assert len(stories) == 1
+            assert stories[0].id == story_id
+            assert stories[0].author_username == "username"
+            stmt = mock_db_session.execute.call_args.args[0]
+            sql = str(stmt.compile(dialect=postgresql.dialect()))
+            assert "stories.text" not in sql
+            assert "ORDER BY stories.created_at DESC" in sql
 
-        async def test_empty_result(
+    class TestGetUserListItems:
+        @pytest.mark.parametrize("is_active", [True, False])
+        async def test_success(
             self,
             mock_db_session: AsyncMock,
+            is_active: bool,
         ):
-            mock_result = MagicMock(spec=Result)
-            mock_result.scalars.return_value.fetchall.return_value = []
-            mock_db_session.execute.return_value = mock_result
+            registered_at = datetime.datetime.now(datetime.UTC)
+            mock_db_session.execute.return_value = [
+                ("username", is_active, Role.USER.value, registered_at, None),
+            ]
 
-            inactive_users = await get_inactive_users(
+            users = await get_user_list_items(
                 session=mock_db_session,
+                is_active=is_active,
             )
 
-            mock_db_session.execute.assert_awaited_once()
-            assert len(inactive_users) == 0
+            assert users[0].username == "username"
+            assert users[0].is_active is is_active
+            stmt = mock_db_session.execute.call_args.args[0]
+            sql = str(stmt.compile(dialect=postgresql.dialect()))
+            assert "users.hashed_password" not in sql
+            assert f"users.is_active IS {str(is_active).lower()}" in sql
 
     class TestMakeAdmin:
         async def test_success(
@@ -1136,6 +998,14 @@ class TestDatabase:
             mock_db_session.rollback.assert_awaited_once()
 
     class TestUpdateUser:
+        @pytest.fixture(autouse=True)
+        def mock_redis_helper(self) -> Generator[MagicMock, None, None]:
+            with patch.object(
+                avatar_path_invalidation, "redis_helper"
+            ) as mock_redis_helper:
+                mock_redis_helper.get_redis.return_value.publish = AsyncMock()
+                yield mock_redis_helper
+
         async def test_success(
             self,
             mock_db_session: AsyncMock,
@@ -1162,6 +1032,44 @@ class TestDatabase:
             assert updated_user.bio == new_bio
             assert updated_user.avatar_name == new_avatar_name
 
+        async def test_with_avatar_metadata(
+            self,
+            mock_db_session: AsyncMock,
+        ):
+            mock_user = User(avatar_name="testavatar.jpg")
+
+            updated_user = await update_user(
+                avatar_name="newtestavatar.jpg",
+                avatar_size=1024,
+                avatar_etag="etag",
+                user=mock_user,
+                session=mock_db_session,
+            )
+
+            assert updated_user.avatar_name == "newtestavatar.jpg"
+            assert updated_user.avatar_size == 1024
+            assert updated_user.avatar_etag == "etag"
+
+        async def test_invalidates_avatar_path_cache(
+            self,
+            mock_db_session: AsyncMock,
+            mock_redis_helper: MagicMock,
+        ):
+            username = "username"
+            mock_user = User(username=username, avatar_name="username.jpg")
+            avatar_path_cache.set(username, ("username.jpg", "image/jpeg", "abc"))
+
+            await update_user(
+                avatar_name="username.png",
+                user=mock_user,
+                session=mock_db_session,
+            )
+
+            assert avatar_path_cache.get(username) is None
+            mock_redis_helper.get_redis.return_value.publish.assert_awaited_once_with(
+                settings.avatar.path_cache_invalidation_channel, username
+            )
+
         async def test_with_exception(
             self,
             mock_db_session: AsyncMock,
@@ -1187,34 +1095,667 @@ class TestDatabase:
             mock_db_session.refresh.assert_not_awaited()
 
 
-class TestEmail:
-    class TestSendPlainMessage:
-        def test_success(
-            self,
-            mock_background_tasks: Mock,
-            mock_fastmail: MagicMock,
-        ):
-            subject = "Test subject"
-            email_address = "test@example.com"
-            body = "Test message"
+@pytest.mark.anyio
+class TestCache:
+    @staticmethod
+    def make_story() -> Story:
+        return Story(
+            id=uuid.uuid4(),
+            name="name",
+            text="text",
+            likes_number=0,
+            created_at=datetime.datetime.now(datetime.UTC),
+            author_username="username",
+        )
+
+    @staticmethod
+    def make_cache(pipeline_result: list | None = None) -> AsyncMock:
+        cache = AsyncMock()
+        pipe = MagicMock()
+        pipe.execute = AsyncMock(return_value=pipeline_result or [])
+        cache.pipeline = MagicMock()
+        cache.pipeline.return_value.__aenter__.return_value = pipe
+        return cache
+
+    class TestGetCachedStoriesPage:
+        async def test_full_page(self):
+            cache = AsyncMock()
+            cache.zrevrange.return_value = [b"1", b"2"]
+            cache.mget.return_value = [b'{"id": 1}', b'{"id": 2}']
+
+            result = await get_cached_stories_page(page=2, per_page=2, cache=cache)
+
+            assert result == [b'{"id": 1}', b'{"id": 2}']
+            cache.zrevrange.assert_awaited_once_with(settings.stories_cache.feed_key, 2, 3)  # fmt: skip
+            cache.mget.assert_awaited_once_with(
+                [
+                    settings.stories_cache.story_key_prefix + "1",
+                    settings.stories_cache.story_key_prefix + "2",
+                ]
+            )
+            cache.exists.assert_not_awaited()
+
+        async def test_short_page_of_incomplete_feed(self):
+            cache = AsyncMock()
+            cache.zrevrange.return_value = [b"1"]
+            cache.exists.return_value = 0
+
+            result = await get_cached_stories_page(page=1, per_page=2, cache=cache)
+
+            assert result is None
+            cache.mget.assert_not_awaited()
+
+        async def test_short_page_of_complete_feed(self):
+            cache = AsyncMock()
+            cache.zrevrange.return_value = []
+            cache.exists.return_value = 1
+
+            result = await get_cached_stories_page(page=3, per_page=2, cache=cache)
+
+            assert result == []
+
+        async def test_expired_payload(self):
+            cache = AsyncMock()
+            cache.zrevrange.return_value = [b"1", b"2"]
+            cache.mget.return_value = [b'{"id": 1}', None]
+
+            result = await get_cached_stories_page(page=1, per_page=2, cache=cache)
+
+            assert result is None
+
+    @pytest.mark.parametrize("is_filled", [0, 1])
+    async def test_fill_stories_feed(self, is_filled: int):
+        cache = AsyncMock()
+        cache.eval.return_value = is_filled
+        story = TestCache.make_story()
+
+        result = await fill_stories_feed(stories=[story], version=7, cache=cache)
+
+        assert result is bool(is_filled)
+        args = cache.eval.call_args.args
+        assert args[1:5] == (
+            3,
+            settings.stories_cache.feed_key,
+            settings.stories_cache.feed_complete_key,
+            settings.stories_cache.feed_version_key,
+        )
+        # версия снимка, признак полной ленты и тройка id, score, payload
+        assert args[5] == 7
+        assert args[8] == 1
+        assert args[10:12] == (str(story.id), story.created_at.timestamp())
+
+    async def test_get_feed_version(self):
+        cache = AsyncMock()
+        cache.get.side_effect = [None, b"3"]
+
+        assert await get_feed_version(cache=cache) == 0
+        assert await get_feed_version(cache=cache) == 3
+
+    @pytest.mark.parametrize("trimmed", [0, 1])
+    async def test_add_story_to_feed(self, trimmed: int):
+        cache = TestCache.make_cache(pipeline_result=[1, 1, True, trimmed])
+
+        await add_story_to_feed(story=TestCache.make_story(), cache=cache)
+
+        pipe = cache.pipeline.return_value.__aenter__.return_value
+        pipe.incr.assert_called_once_with(settings.stories_cache.feed_version_key)
+        if trimmed:
+            cache.delete.assert_awaited_once_with(settings.stories_cache.feed_complete_key)  # fmt: skip
+        else:
+            cache.delete.assert_not_awaited()
+
+    async def test_update_story_in_feed(self):
+        cache = TestCache.make_cache()
+        story = TestCache.make_story()
+
+        await update_story_in_feed(story=story, cache=cache)
+
+        pipe = cache.pipeline.return_value.__aenter__.return_value
+        pipe.incr.assert_called_once_with(settings.stories_cache.feed_version_key)
+        pipe.set.assert_called_once()
+        assert pipe.set.call_args.args[0] == settings.stories_cache.story_key_prefix + str(story.id)  # fmt: skip
+        assert pipe.set.call_args.kwargs["xx"] is True
+
+    async def test_redis_error_is_a_cache_miss(self):
+        cache = TestCache.make_cache()
+        cache.zrevrange.side_effect = RedisConnectionError
+        cache.set.side_effect = RedisConnectionError
+        cache.get.side_effect = RedisConnectionError
+        pipe = cache.pipeline.return_value.__aenter__.return_value
+        pipe.execute.side_effect = RedisConnectionError
+
+        assert await get_cached_stories_page(page=1, cache=cache) is None
+        assert await acquire_feed_fill_lock(cache=cache) is False
+        assert await get_feed_version(cache=cache) is None
+        # запись в БД уже сохранена, поэтому ошибка ленты не доходит до клиента
+        await add_story_to_feed(story=TestCache.make_story(), cache=cache)
+        await update_story_in_feed(story=TestCache.make_story(), cache=cache)
+        await remove_story_from_feed(story_id=uuid.uuid4(), cache=cache)
+
+    async def test_stories_endpoint_without_redis(self):
+        cache = AsyncMock()
+        cache.zrevrange.side_effect = RedisConnectionError
+        cache.set.side_effect = RedisConnectionError
+        story = TestCache.make_story()
+
+        with patch(
+            "api.api_v1.routers.stories.get_story_list_items",
+            new_callable=AsyncMock,
+            return_value=[story],
+        ) as mock_get_story_list_items:
+            response = await get_stories_endpoint(
+                session=AsyncMock(), cache=cache, page=1
+            )
+
+        assert response.status_code == 200
+        mock_get_story_list_items.assert_awaited_once()
+
 
-            send_plain_message_to_email(
-                subject=subject,
-                email_address=email_address,
-                body=body,
-                background_tasks=mock_background_tasks,
+@pytest.mark.anyio
+class TestStoryDetailCache:
+    @pytest.fixture
+    def story_cache(self) -> StoryDetailCache:
+        return StoryDetailCache(config=StoriesCacheConfig())
+
+    @pytest.fixture
+    def mock_cache(self) -> AsyncMock:
+        cache = AsyncMock()
+        pipe = MagicMock()
+        pipe.execute = AsyncMock()
+        cache.pipeline = MagicMock()
+        cache.pipeline.return_value.__aenter__.return_value = pipe
+        return cache
+
+    async def test_fresh_hit(self, story_cache, mock_cache):
+        mock_cache.hmget.return_value = [str(datetime.datetime.now().timestamp() + 60).encode(), b"payload"]  # fmt: skip
+
+        with patch.object(story_cache, "_schedule_refresh") as mock_refresh:
+            result = await story_cache.get(story_uuid=uuid.uuid4(), cache=mock_cache)
+
+        assert result == b"payload"
+        mock_refresh.assert_not_called()
+
+    async def test_stale_hit(self, story_cache, mock_cache):
+        story_uuid = uuid.uuid4()
+        mock_cache.hmget.return_value = [b"0", b"stale payload"]
+
+        with patch.object(story_cache, "_schedule_refresh") as mock_refresh:
+            result = await story_cache.get(story_uuid=story_uuid, cache=mock_cache)
+
+        assert result == b"stale payload"
+        mock_refresh.assert_called_once_with(story_uuid=story_uuid, cache=mock_cache)
+
+    async def test_concurrent_misses_load_once(self, story_cache, mock_cache):
+        story = TestCache.make_story()
+        mock_cache.hmget.return_value = [None, None]
+
+        async def slow_get_story_by_uuid(**_):
+            await asyncio.sleep(0.01)
+            return story
+
+        with (
+            patch("api.api_v1.utils.story_cache.db_helper") as mock_db_helper,
+            patch("api.api_v1.utils.story_cache.get_story_by_uuid", side_effect=slow_get_story_by_uuid) as mock_get,  # fmt: skip
+        ):
+            mock_db_helper.session_factory.return_value = AsyncMock()
+            results = await asyncio.gather(
+                story_cache.get(story_uuid=story.id, cache=mock_cache),
+                story_cache.get(story_uuid=story.id, cache=mock_cache),
             )
 
-            mock_background_tasks.add_task.assert_called_once()
-            args = mock_background_tasks.add_task.call_args[0]
-            assert args[0] == mock_fastmail.send_message
-            message = args[1]
-            assert isinstance(message, MessageSchema)
-            assert message.subject == subject
-            assert message.recipients[0].email == email_address
-            assert message.body == body
-            assert message.subtype == MessageType.plain
-            assert args[2] is None
+        mock_get.assert_called_once()
+        assert results[0] == results[1]
+        assert b'"text":"text"' in results[0]
+        assert story_cache._in_flight == {}
+
+    async def test_missing_story(self, story_cache, mock_cache):
+        mock_cache.hmget.return_value = [None, None]
+        mock_cache.get.return_value = b"2"
+
+        with (
+            patch("api.api_v1.utils.story_cache.db_helper") as mock_db_helper,
+            patch("api.api_v1.utils.story_cache.get_story_by_uuid", return_value=None),
+        ):
+            mock_db_helper.session_factory.return_value = AsyncMock()
+            result = await story_cache.get(story_uuid=uuid.uuid4(), cache=mock_cache)
+
+        assert result is None
+        # отсутствие запоминается ненадолго и тоже сверяется с поколением
+        args = mock_cache.eval.call_args.args
+        assert args[4] == b"2"
+        assert args[6:] == (b"", story_cache.config.detail_missing_seconds)
+
+    async def test_missing_story_hit(self, story_cache, mock_cache):
+        mock_cache.hmget.return_value = [b"0", b""]
+
+        with patch.object(story_cache, "_load_once") as mock_load:
+            result = await story_cache.get(story_uuid=uuid.uuid4(), cache=mock_cache)
+
+        assert result is None
+        mock_load.assert_not_called()
+
+    async def test_invalidate_bumps_generation(self, story_cache, mock_cache):
+        story_uuid = uuid.uuid4()
+
+        await story_cache.invalidate(story_uuid=story_uuid, cache=mock_cache)
+
+        pipe = mock_cache.pipeline.return_value.__aenter__.return_value
+        pipe.incr.assert_called_once_with(f"stories:detail:generation:{story_uuid}")
+        pipe.delete.assert_called_once_with(f"stories:detail:{story_uuid}")
+
+    async def test_save_skipped_after_invalidate(self, story_cache):
+        fakeredis = pytest.importorskip("fakeredis")
+        cache = fakeredis.FakeAsyncRedis()
+        story_uuid = uuid.uuid4()
+
+        # загрузка прочитала поколение до правки, а пишет после нее
+        await story_cache.invalidate(story_uuid=story_uuid, cache=cache)
+        await story_cache._save(story_uuid=story_uuid, generation=None, payload=b"old", expire_seconds=60, cache=cache)  # fmt: skip
+        assert not await cache.exists(f"stories:detail:{story_uuid}")
+
+        await story_cache._save(story_uuid=story_uuid, generation=b"1", payload=b"new", expire_seconds=60, cache=cache)  # fmt: skip
+        assert await story_cache.get(story_uuid=story_uuid, cache=cache) == b"new"
+
+    async def test_stale_hits_refresh_once(self, story_cache, mock_cache):
+        story_uuid = uuid.uuid4()
+        mock_cache.hmget.return_value = [b"0", b"stale payload"]
+
+        with patch.object(story_cache, "_load_once", new_callable=AsyncMock):
+            await story_cache.get(story_uuid=story_uuid, cache=mock_cache)
+            await story_cache.get(story_uuid=story_uuid, cache=mock_cache)
+            await asyncio.gather(*story_cache._refresh_tasks.values())
+            await asyncio.sleep(0)
+
+        mock_cache.set.assert_awaited_once()
+        assert story_cache._refresh_tasks == {}
+
+    async def test_redis_down_serves_from_db(self, story_cache, mock_cache):
+        story = TestCache.make_story()
+        mock_cache.hmget.side_effect = RedisConnectionError
+        mock_cache.get.side_effect = RedisConnectionError
+
+        with (
+            patch("api.api_v1.utils.story_cache.db_helper") as mock_db_helper,
+            patch("api.api_v1.utils.story_cache.get_story_by_uuid", return_value=story),
+        ):
+            mock_db_helper.session_factory.return_value = AsyncMock()
+            result = await story_cache.get(story_uuid=story.id, cache=mock_cache)
+
+        assert result is not None
+        assert b'"text":"text"' in result
+        mock_cache.eval.assert_not_awaited()
+
+    async def test_failed_save_still_returns_payload(self, story_cache, mock_cache):
+        story = TestCache.make_story()
+        mock_cache.hmget.return_value = [None, None]
+        mock_cache.get.return_value = None
+        mock_cache.eval.side_effect = RedisConnectionError
+
+        with (
+            patch("api.api_v1.utils.story_cache.db_helper") as mock_db_helper,
+            patch("api.api_v1.utils.story_cache.get_story_by_uuid", return_value=story),
+        ):
+            mock_db_helper.session_factory.return_value = AsyncMock()
+            result = await story_cache.get(story_uuid=story.id, cache=mock_cache)
+
+        assert result is not None
+        mock_cache.eval.assert_awaited_once()
+
+    async def test_invalidate_when_redis_is_down(self, story_cache, mock_cache):
+        pipe = mock_cache.pipeline.return_value.__aenter__.return_value
+        pipe.execute.side_effect = RedisConnectionError
+
+        # правка уже в БД, поэтому ошибка Redis не превращается в 500
+        await story_cache.invalidate(story_uuid=uuid.uuid4(), cache=mock_cache)
+
+    async def test_refresh_when_redis_is_down(self, story_cache, mock_cache):
+        mock_cache.set.side_effect = RedisConnectionError
+
+        with patch.object(story_cache, "_load_once", new_callable=AsyncMock) as mock_load:  # fmt: skip
+            await story_cache._refresh(story_uuid=uuid.uuid4(), cache=mock_cache)
+
+        mock_load.assert_not_awaited()
+
+
+class TestJsonResponse:
+    def test_fast_json_response_matches_json_response(self):
+        content = {"name": "история", "likes_number": 1, "tags": [None, True]}
+
+        assert FastJSONResponse(content).body == JSONResponse(content).body
+
+    def test_model_json_response(self):
+        story = TestCache.make_story()
+
+        response = model_json_response(
+            content=[story],
+            response_model=list[StoryScheme],
+            status_code=201,
+        )
+
+        assert response.status_code == 201
+        assert response.media_type == "application/json"
+        assert bytes(response.body).startswith(f'[{{"id":"{story.id}","name":"name"'.encode())  # fmt: skip
+        assert b'"text"' not in response.body
+
+    def test_type_adapter_is_cached(self):
+        assert get_type_adapter(list[StoryScheme]) is get_type_adapter(list[StoryScheme])  # fmt: skip
+
+
+class TestEmail:
+    @pytest.fixture
+    def mock_cache(self) -> AsyncMock:
+        cache = AsyncMock()
+        pipe = MagicMock()
+        pipe.execute = AsyncMock()
+        cache.pipeline = MagicMock()
+        cache.pipeline.return_value.__aenter__.return_value = pipe
+        return cache
+
+    @pytest.fixture
+    def email(self) -> OutboxEmailScheme:
+        return OutboxEmailScheme(
+            recipient="test@Example.com",
+            subject="Test subject",
+            body="Test message",
+        )
+
+    @pytest.mark.anyio
+    async def test_send_plain_message_enqueues(self, mock_cache):
+        await send_plain_message_to_email(
+            subject="Test subject",
+            email_address="test@example.com",
+            body="Test message",
+            cache=mock_cache,
+        )
+
+        pipe = mock_cache.pipeline.return_value.__aenter__.return_value
+        key, email_id, payload = pipe.hset.call_args.args
+        assert key == "email:outbox:messages"
+        email = OutboxEmailScheme.model_validate_json(payload)
+        assert email.id == email_id
+        assert email.recipient == "test@example.com"
+        assert email.attempts == 0
+        schedule_key, mapping = pipe.zadd.call_args.args
+        assert schedule_key == "email:outbox:schedule"
+        assert list(mapping) == [email_id]
+
+    def test_build_email_message(self, email):
+        message = build_email_message(email)
+
+        assert message["To"] == "test@Example.com"
+        assert message["Subject"] == "Test subject"
+        assert message["From"].addresses[0].addr_spec == settings.smtp.MAIL_FROM
+        assert message.get_content().strip() == "Test message"
+        assert email.domain == "example.com"
+
+    class TestEmailOutbox:
+        @pytest.mark.anyio
+        async def test_claim(self):
+            outbox = EmailOutbox(EmailOutboxConfig(lease_seconds=30))
+            email = OutboxEmailScheme(recipient="a@example.com", subject="s", body="b")
+            cache = AsyncMock()
+            cache.eval.return_value = [email.model_dump_json().encode()]
+
+            claimed = await outbox.claim(cache=cache, batch_size=10)
+
+            assert claimed == [email]
+            args = cache.eval.call_args.args
+            assert args[1:4] == (2, outbox.schedule_key, outbox.messages_key)
+            assert args[5] == 10
+            assert args[6] == pytest.approx(args[4] + 30)
+
+    @pytest.mark.anyio
+    class TestEmailWorker:
+        @pytest.fixture
+        def outbox(self) -> AsyncMock:
+            return AsyncMock(spec=EmailOutbox)
+
+        @pytest.fixture
+        def smtp_pool(self) -> AsyncMock:
+            smtp_pool = AsyncMock(spec=SmtpConnectionPool)
+            smtp_pool.size = 2
+            return smtp_pool
+
+        @pytest.fixture
+        def worker(self, outbox, smtp_pool) -> EmailWorker:
+            return EmailWorker(
+                config=EmailOutboxConfig(max_attempts=2, retry_base_seconds=10),
+                outbox=outbox,
+                smtp_pool=smtp_pool,
+                rate_limiter=DomainRateLimiter(rate_per_second=1, burst=1),
+                cache=AsyncMock(),
+            )
+
+        async def test_success(self, worker, outbox, smtp_pool, email):
+            outbox.claim.return_value = [email]
+
+            assert await worker.process_batch() == 1
+
+            smtp_pool.send.assert_awaited_once()
+            outbox.ack.assert_awaited_once_with(email=email, cache=worker.cache)
+
+        async def test_retry_then_dead_letter(self, worker, outbox, smtp_pool, email):
+            smtp_pool.send.side_effect = OSError("Connection refused")
+            worker.rate_limiter = DomainRateLimiter(rate_per_second=1, burst=10)
+
+            await worker.deliver(email)
+            outbox.reschedule.assert_awaited_once()
+            assert email.attempts == 1
+            assert 5 <= outbox.reschedule.call_args.kwargs["delay_seconds"] <= 10
+
+            await worker.deliver(email)
+            outbox.dead_letter.assert_awaited_once_with(email=email, cache=worker.cache)
+            assert "Connection refused" in email.last_error
+
+        async def test_domain_rate_limit(self, worker, outbox, smtp_pool, email):
+            await worker.deliver(email)
+            await worker.deliver(email)
+
+            smtp_pool.send.assert_awaited_once()
+            outbox.reschedule.assert_awaited_once()
+            assert 0 < outbox.reschedule.call_args.kwargs["delay_seconds"] <= 1
+            assert email.attempts == 0
+
+    def test_domain_rate_limiter(self):
+        rate_limiter = DomainRateLimiter(
+            rate_per_second=1,
+            burst=2,
+            overrides={"fast.com": 1000},
+        )
+
+        assert rate_limiter.acquire("example.com") == 0
+        assert rate_limiter.acquire("example.com") == 0
+        assert rate_limiter.acquire("example.com") > 0
+        # у каждого домена свой лимит
+        assert rate_limiter.acquire("other.com") == 0
+
+    @pytest.mark.anyio
+    async def test_smtp_pool_reuses_connection(self, email):
+        aiosmtpd_controller = pytest.importorskip("aiosmtpd.controller")
+        received = []
+        ehlo_count = 0
+
+        class Handler:
+            async def handle_EHLO(self, server, session, envelope, hostname, responses):  # fmt: skip
+                nonlocal ehlo_count
+                ehlo_count += 1
+                session.host_name = hostname
+                return responses
+
+            async def handle_DATA(self, server, session, envelope):
+                received.append(envelope)
+                return "250 OK"
+
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        controller = aiosmtpd_controller.Controller(Handler(), hostname="127.0.0.1", port=port)  # fmt: skip
+        controller.start()
+        smtp_pool = SmtpConnectionPool(
+            smtp_config=settings.smtp.model_copy(
+                update={
+                    "MAIL_SERVER": "127.0.0.1",
+                    "MAIL_PORT": port,
+                    "MAIL_STARTTLS": False,
+                    "MAIL_SSL_TLS": False,
+                    "USE_CREDENTIALS": False,
+                }
+            ),
+            size=1,
+            timeout=5,
+        )
+        try:
+            await smtp_pool.send(build_email_message(email))
+            await smtp_pool.send(build_email_message(email))
+        finally:
+            await smtp_pool.close()
+            controller.stop()
+
+        assert len(received) == 2
+        assert received[0].rcpt_tos == ["test@Example.com"]
+        assert ehlo_count == 1
+
+    def test_worker_imports_in_multiprocess_mode(self, tmp_path):
+        # как в контейнере: PROMETHEUS_MULTIPROC_DIR из Dockerfile, каталог
+        # создает entrypoint сервиса email-worker
+        multiproc_dir = tmp_path / "prometheus_multiproc"
+        multiproc_dir.mkdir()
+
+        result = subprocess.run(
+            [sys.executable, "-c", "import email_worker"],
+            cwd=Path(__file__).resolve().parents[2],
+            env={**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(multiproc_dir)},
+            capture_output=True,
+            text=True,
+            timeout=60,
+        )
+
+        assert result.returncode == 0, result.stderr
+        assert list(multiproc_dir.glob("histogram_*.db"))
+
+
+@pytest.mark.anyio
+class TestEmailThrottle:
+    @pytest.fixture
+    def email_throttle(self) -> EmailThrottle:
+        return EmailThrottle(EmailThrottleConfig(coalesce_window_seconds=30))
+
+    async def test_coalesce(self, email_throttle):
+        cache = AsyncMock()
+        cache.set.side_effect = [True, None]
+
+        assert await email_throttle.coalesce(kind=EmailCodeKind.FORGOT_PASSWORD, email="A@example.com", cache=cache)  # fmt: skip
+        assert not await email_throttle.coalesce(kind=EmailCodeKind.FORGOT_PASSWORD, email="a@example.com", cache=cache)  # fmt: skip
+
+        keys = [call.args[0] for call in cache.set.call_args_list]
+        assert keys == ["email:throttle:pending:forgot_password:a@example.com"] * 2
+        assert cache.set.call_args.kwargs == {"nx": True, "ex": 30}
+
+    async def test_acquire(self, email_throttle):
+        cache = AsyncMock()
+        cache.eval.side_effect = [b"0", b"12.3"]
+
+        assert await email_throttle.acquire_for_ip(ip="127.0.0.1", cache=cache) == 0
+        assert await email_throttle.acquire_for_email(email="a@example.com", cache=cache) == 13  # fmt: skip
+
+        ip_args, email_args = (call.args for call in cache.eval.call_args_list)
+        assert ip_args[2] == "email:throttle:ip:127.0.0.1"
+        assert email_args[2] == "email:throttle:email:a@example.com"
+
+    async def test_limit_email_requests_by_ip(self):
+        request = MagicMock(headers={"x-real-ip": "10.0.0.1"})
+        with patch("api.api_v1.dependencies.auth.email_throttle") as mock_throttle:
+            mock_throttle.acquire_for_ip = AsyncMock(return_value=7)
+            with pytest.raises(TooManyEmailRequests) as exc_info:
+                await limit_email_requests_by_ip(request=request, cache=AsyncMock())
+
+        mock_throttle.acquire_for_ip.assert_awaited_once()
+        assert mock_throttle.acquire_for_ip.call_args.kwargs["ip"] == "10.0.0.1"
+        assert exc_info.value.status_code == 429
+        assert exc_info.value.headers == {"Retry-After": "7"}
+
+
+@pytest.mark.anyio
+class TestEmailCodes:
+    @pytest.fixture
+    def config(self) -> EmailTokensConfig:
+        return EmailTokensConfig(email_verification_token_exp_minutes=10)
+
+    @pytest.fixture
+    def cache(self) -> AsyncMock:
+        return AsyncMock()
+
+    @pytest.fixture
+    def redis_store(self, config, cache) -> RedisEmailCodeStore:
+        redis_helper = MagicMock()
+        redis_helper.get_redis.return_value = cache
+        return RedisEmailCodeStore(config=config, redis_helper=redis_helper)
+
+    @pytest.fixture
+    def session(self) -> AsyncMock:
+        return AsyncMock()
+
+    @pytest.fixture
+    def postgres_store(self, config, session) -> PostgresEmailCodeStore:
+        session_factory = MagicMock()
+        session_factory.return_value.__aenter__.return_value = session
+        return PostgresEmailCodeStore(config=config, session_factory=session_factory)
+
+    async def test_redis_issue_retries_on_collision(self, redis_store, cache):
+        cache.eval.side_effect = [0, 1]
+
+        code = await redis_store.issue(kind=EmailCodeKind.EMAIL_VERIFICATION, username="alice")  # fmt: skip
+
+        assert cache.eval.await_count == 2
+        args = cache.eval.call_args.args
+        assert args[1:4] == (
+            2,
+            f"email:codes:email_verification:{hash_code(code)}",
+            "email:codes:email_verification:user:alice",
+        )
+        # ключ живет ровно столько, сколько действует код
+        assert args[6] == 600
+
+    async def test_issue_gives_up_after_attempts(self, redis_store, cache):
+        cache.eval.return_value = 0
+
+        with pytest.raises(RuntimeError):
+            await redis_store.issue(kind=EmailCodeKind.FORGOT_PASSWORD, username="alice")  # fmt: skip
+
+        assert cache.eval.await_count == redis_store.config.issue_attempts
+
+    async def test_redis_pop(self, redis_store, cache):
+        cache.eval.side_effect = [b"alice", None]
+
+        assert await redis_store.pop(kind=EmailCodeKind.FORGOT_PASSWORD, code="abc123") == "alice"  # fmt: skip
+        assert await redis_store.pop(kind=EmailCodeKind.FORGOT_PASSWORD, code="abc123") is None  # fmt: skip
+
+        assert cache.eval.call_args.args[2] == (
+            f"email:codes:forgot_password:{hash_code('abc123')}"
+        )
+
+    async def test_postgres_issue_collision(self, postgres_store, session):
+        session.execute.side_effect = [None, IntegrityError("", {}, Exception()), None, None]  # fmt: skip
+
+        code = await postgres_store.issue(kind=EmailCodeKind.EMAIL_VERIFICATION, username="alice")  # fmt: skip
+
+        assert len(code) == postgres_store.config.token_length
+        session.rollback.assert_awaited_once()
+        session.commit.assert_awaited_once()
+
+    async def test_postgres_pop_uses_partial_index(self, postgres_store, session):
+        result = MagicMock(spec=Result)
+        result.scalar_one_or_none.return_value = "alice"
+        session.execute.return_value = result
+
+        username = await postgres_store.pop(kind=EmailCodeKind.FORGOT_PASSWORD, code="abc123")  # fmt: skip
+
+        assert username == "alice"
+        session.commit.assert_awaited_once()
+        stmt = session.execute.call_args.args[0]
+        sql = str(stmt.compile(dialect=postgresql.dialect(), compile_kwargs={"render_postcompile": True}))  # fmt: skip
+        # вид должен попасть в SQL литералом, иначе частичный индекс не подойдет
+        assert "email_codes.kind = 'forgot_password'" in sql
 
 
 @pytest.mark.anyio
@@ -1311,8 +1852,1113 @@ class TestFiles:
                     mock_exists.assert_awaited_once_with(expected_path)
                     mock_remove.assert_awaited_once_with(expected_path)
 
+    class TestGetAvatarSizeAndEtag:
+        async def test_success(self):
+            mock_avatar = MagicMock(spec=UploadFile)
+            mock_avatar.read.return_value = b"test data"
+
+            size, etag = await get_avatar_size_and_etag(avatar=mock_avatar)
+
+            assert size == len(b"test data")
+            assert etag == hashlib.md5(b"test data").hexdigest()
+            mock_avatar.seek.assert_awaited_once_with(0)
+
+    class TestGetAvatarUrl:
+        def test_success(self):
+            avatar_url = get_avatar_url(username="username")
+
+            assert avatar_url == "/api/v1/users/username/avatar"
+
+    class TestIsEtagMatching:
+        @pytest.mark.parametrize(
+            "if_none_match, expected",
+            [
+                (None, False),
+                ('"abc"', True),
+                ('W/"abc"', True),
+                ('"other", "abc"', True),
+                ("*", True),
+                ('"other"', False),
+                ("abc", False),
+            ],
+        )
+        def test_matching(self, if_none_match: str | None, expected: bool):
+            assert is_etag_matching(if_none_match=if_none_match, etag="abc") is expected
+
+    class TestGetAvatarEndpoint:
+        async def test_not_modified(self):
+            with patch("api.api_v1.routers.users.avatar_storage") as mock_storage:
+                response = await get_avatar_endpoint(
+                    username="username",
+                    avatar=("username.png", "image/png", "abc"),
+                    if_none_match='"abc"',
+                )
+
+            assert response.status_code == 304
+            assert response.headers["etag"] == '"abc"'
+            assert response.headers["cache-control"] == settings.avatar.cache_control
+            assert response.body == b""
+            mock_storage.get_avatar_response.assert_not_called()
+
+        async def test_modified(self):
+            with patch("api.api_v1.routers.users.avatar_storage") as mock_storage:
+                mock_storage.get_avatar_response = AsyncMock(return_value=Response())
+                response = await get_avatar_endpoint(
+                    username="username",
+                    avatar=("username.png", "image/png", "abc"),
+                    if_none_match='"old"',
+                )
+
+            assert response.status_code == 200
+            assert response.headers["etag"] == '"abc"'
+            mock_storage.get_avatar_response.assert_awaited_once_with(
+                avatar_name="username.png",
+                media_type="image/png",
+            )
+
+        async def test_file_gone(self):
+            with (
+                patch("api.api_v1.routers.users.avatar_storage") as mock_storage,
+                patch(
+                    "api.api_v1.routers.users.avatar_path_invalidation"
+                ) as mock_invalidation,
+            ):
+                mock_storage.get_avatar_response = AsyncMock(
+                    side_effect=FileNotFoundError
+                )
+                mock_invalidation.invalidate = AsyncMock()
+                with pytest.raises(AvatarNotFound):
+                    await get_avatar_endpoint(
+                        username="username",
+                        avatar=("username.png", "image/png", "abc"),
+                        if_none_match=None,
+                    )
+
+            mock_invalidation.invalidate.assert_awaited_once_with("username")
+
+
+@pytest.mark.anyio
+class TestAvatarStorage:
+    class TestLocalAvatarStorage:
+        async def test_get_avatar_response(self, tmp_path: Path):
+            (tmp_path / "username.png").write_bytes(b"avatar")
+            storage = LocalAvatarStorage(avatars_dir=tmp_path)
+
+            response = await storage.get_avatar_response(
+                avatar_name="username.png",
+                media_type="image/png",
+            )
+
+            assert isinstance(response, FileResponse)
+            assert response.path == tmp_path / "username.png"
+            assert response.media_type == "image/png"
+            assert response.headers["content-length"] == "6"
+
+        async def test_get_avatar_response_missing_file(self, tmp_path: Path):
+            storage = LocalAvatarStorage(avatars_dir=tmp_path)
+
+            with pytest.raises(FileNotFoundError):
+                await storage.get_avatar_response(
+                    avatar_name="username.png",
+                    media_type="image/png",
+                )
+
+        async def test_get_avatar_response_with_x_accel_redirect(self):
+            storage = LocalAvatarStorage(
+                avatars_dir=settings.avatar.avatars_dir,
+                x_accel_redirect_location="/protected-avatars/",
+            )
+
+            response = await storage.get_avatar_response(
+                avatar_name="username.png",
+                media_type="image/png",
+            )
+
+            assert not isinstance(response, FileResponse)
+            assert response.body == b""
+            assert response.headers["x-accel-redirect"] == "/protected-avatars/username.png"  # fmt: skip
+            assert response.headers["content-type"] == "image/png"
+
+    class TestS3AvatarStorage:
+        @pytest.fixture()
+        def s3_config(self) -> AvatarS3Config:
+            return AvatarS3Config(bucket="test-bucket", key_prefix="avatars/")
+
+        @pytest.fixture()
+        def mock_s3_client(self) -> AsyncMock:
+            return AsyncMock()
+
+        @pytest.fixture()
+        def storage(
+            self,
+            s3_config: AvatarS3Config,
+            mock_s3_client: AsyncMock,
+        ) -> S3AvatarStorage:
+            storage = S3AvatarStorage(config=s3_config)
+            storage._client = mock_s3_client
+            return storage
+
+        async def test_save(
+            self,
+            storage: S3AvatarStorage,
+            mock_s3_client: AsyncMock,
+        ):
+            await storage.save(
+                avatar_name="username.png",
+                content=b"test data",
+                media_type="image/png",
+            )
+
+            mock_s3_client.put_object.assert_awaited_once_with(
+                Bucket="test-bucket",
+                Key="avatars/username.png",
+                Body=b"test data",
+                ContentType="image/png",
+            )
+
+        async def test_delete(
+            self,
+            storage: S3AvatarStorage,
+            mock_s3_client: AsyncMock,
+        ):
+            await storage.delete(avatar_name="username.png")
+
+            mock_s3_client.delete_object.assert_awaited_once_with(
+                Bucket="test-bucket",
+                Key="avatars/username.png",
+            )
+
+        async def test_get_avatar_response_redirects_to_presigned_url(
+            self,
+            storage: S3AvatarStorage,
+            s3_config: AvatarS3Config,
+            mock_s3_client: AsyncMock,
+        ):
+            presigned_url = (
+                "https://s3.example.com/avatars/username.png?X-Amz-Signature=abc"
+            )
+            mock_s3_client.generate_presigned_url.return_value = presigned_url
+
+            response = await storage.get_avatar_response(
+                avatar_name="username.png",
+                media_type="image/png",
+            )
+
+            assert isinstance(response, RedirectResponse)
+            assert response.status_code == 307
+            assert response.headers["location"] == presigned_url
+            mock_s3_client.generate_presigned_url.assert_awaited_once_with(
+                "get_object",
+                Params={
+                    "Bucket": "test-bucket",
+                    "Key": "avatars/username.png",
+                    "ResponseContentType": "image/png",
+                },
+                ExpiresIn=s3_config.presigned_url_expire_seconds,
+            )
+
+
+class TestMemoryCache:
+    class TestTTLLRUCache:
+        def test_get_and_set(self):
+            cache = TTLLRUCache(max_size=10, ttl_seconds=60)
+
+            cache.set("key", "value")
+
+            assert cache.get("key") == "value"
+            assert cache.get("missing") is None
+            assert cache.get("missing", default="default") == "default"
+
+        def test_negative_entry(self):
+            cache = TTLLRUCache(max_size=10, ttl_seconds=60)
+            missing = object()
+
+            cache.set("key", None)
+
+            assert cache.get("key", default=missing) is None
+            assert cache.get("other", default=missing) is missing
+
+        def test_expiration(self):
+            cache = TTLLRUCache(max_size=10, ttl_seconds=60)
+            with patch("time.monotonic", return_value=100.0):
+                cache.set("key", "value")
+            with patch("time.monotonic", return_value=159.0):
+                assert cache.get("key") == "value"
+            with patch("time.monotonic", return_value=160.0):
+                assert cache.get("key") is None
+            assert len(cache) == 0
+
+        def test_evicts_least_recently_used(self):
+            cache = TTLLRUCache(max_size=2, ttl_seconds=60)
+            cache.set("first", 1)
+            cache.set("second", 2)
+            cache.get("first")
+
+            cache.set("third", 3)
+
+            assert cache.get("first") == 1
+            assert cache.get("second") is None
+            assert cache.get("third") == 3
+            assert len(cache) == 2
+
+        def test_invalidate(self):
+            cache = TTLLRUCache(max_size=10, ttl_seconds=60)
+            cache.set("key", "value")
+
+            cache.invalidate("key")
+            cache.invalidate("missing")
+
+            assert cache.get("key") is None
+
+    @pytest.mark.anyio
+    class TestCacheInvalidation:
+        @pytest.fixture()
+        def cache(self) -> TTLLRUCache:
+            return TTLLRUCache(max_size=10, ttl_seconds=60)
+
+        async def test_invalidate_publishes(self, cache: TTLLRUCache):
+            redis_helper = MagicMock()
+            redis_helper.get_redis.return_value.publish = AsyncMock()
+            invalidation = CacheInvalidation(
+                cache=cache, channel="channel", redis_helper=redis_helper
+            )
+            cache.set("key", "value")
+
+            await invalidation.invalidate("key")
+
+            assert cache.get("key") is None
+            redis_helper.get_redis.return_value.publish.assert_awaited_once_with(
+                "channel", "key"
+            )
+
+        async def test_invalidate_when_redis_is_down(self, cache: TTLLRUCache):
+            redis_helper = MagicMock()
+            redis_helper.get_redis.return_value.publish = AsyncMock(
+                side_effect=RedisConnectionError
+            )
+            invalidation = CacheInvalidation(
+                cache=cache, channel="channel", redis_helper=redis_helper
+            )
+            cache.set("key", "value")
+
+            await invalidation.invalidate("key")
+
+            assert cache.get("key") is None
+
+        async def test_listener_invalidates_other_workers(self, cache: TTLLRUCache):
+            fakeredis = pytest.importorskip("fakeredis")
+            server = fakeredis.FakeServer()
+            redis_helper = MagicMock()
+            redis_helper.get_redis.side_effect = lambda: fakeredis.FakeAsyncRedis(
+                server=server
+            )
+            # кэш другого воркера, который запись не обрабатывал
+            other_cache = TTLLRUCache(max_size=10, ttl_seconds=60)
+            invalidation = CacheInvalidation(
+                cache=cache, channel="channel", redis_helper=redis_helper
+            )
+            listener = CacheInvalidation(
+                cache=other_cache, channel="channel", redis_helper=redis_helper
+            )
+            publisher = fakeredis.FakeAsyncRedis(server=server)
+            listener.start()
+            try:
+                while await publisher.pubsub_numsub("channel") != [(b"channel", 1)]:
+                    await asyncio.sleep(0.01)
+                other_cache.set("key", "value")
+                other_cache.set("other", "value")
+
+                await invalidation.invalidate("key")
+                for _ in range(100):
+                    if other_cache.get("key") is None:
+                        break
+                    await asyncio.sleep(0.01)
+            finally:
+                await listener.stop()
+
+            assert other_cache.get("key") is None
+            assert other_cache.get("other") == "value"
+
+
+class TestLogHelper:
+    class TestBoundedQueueHandler:
+        @staticmethod
+        def make_record(message: str) -> logging.LogRecord:
+            return logging.LogRecord(
+                name="test",
+                level=logging.INFO,
+                pathname=__file__,
+                lineno=1,
+                msg=message,
+                args=None,
+                exc_info=None,
+            )
+
+        def test_drop_policy_drops_records_when_queue_is_full(self):
+            log_queue = queue.Queue(maxsize=1)
+            handler = BoundedQueueHandler(log_queue=log_queue, overflow_policy="drop")
+            dropped_before = get_metric_value("log_records_dropped_total", {"logger": "test"})  # fmt: skip
+
+            handler.handle(self.make_record("first"))
+            handler.handle(self.make_record("second"))
+
+            assert log_queue.qsize() == 1
+            assert log_queue.get_nowait().getMessage() == "first"
+            assert handler.dropped_records == 1
+            assert get_metric_value("log_records_dropped_total", {"logger": "test"}) == dropped_before + 1  # fmt: skip
+
+        def test_block_policy_waits_for_free_slot(self):
+            log_queue = MagicMock(spec=queue.Queue)
+            handler = BoundedQueueHandler(log_queue=log_queue, overflow_policy="block")
+
+            handler.handle(self.make_record("message"))
+
+            log_queue.put.assert_called_once()
+            log_queue.put_nowait.assert_not_called()
+            assert handler.dropped_records == 0
+
+
+@pytest.mark.anyio
+class TestProcessTimeMiddleware:
+    @staticmethod
+    def make_scope(headers: list[tuple[bytes, bytes]] | None = None) -> dict:
+        return {
+            "type": "http",
+            "method": "GET",
+            "path": "/api/v1/users/username",
+            "headers": headers or [],
+        }
+
+    async def test_records_route_template_and_status(self):
+        route = MagicMock(path_format="/api/v1/users/{username}")
+        sent_messages = []
+
+        async def app(scope, receive, send):
+            scope["route"] = route
+            await send({"type": "http.response.start", "status": 201})
+            await send({"type": "http.response.body", "body": b"chunk", "more_body": True})  # fmt: skip
+            await send({"type": "http.response.body", "body": b""})
+
+        async def send(message):
+            sent_messages.append(message)
+
+        middleware = ProcessTimeMiddleware(app)
+        with patch("api.api_v1.middlewares.process_time.observe_request") as mock_observe:  # fmt: skip
+            await middleware(self.make_scope(), AsyncMock(), send)
+
+        assert len(sent_messages) == 3
+        assert sent_messages[1]["body"] == b"chunk"
+        mock_observe.assert_called_once()
+        kwargs = mock_observe.call_args.kwargs
+        assert kwargs["method"] == "GET"
+        assert kwargs["route"] == "/api/v1/users/{username}"
+        assert kwargs["status_code"] == 201
+        assert kwargs["duration_ns"] >= 0
+
+    async def test_unmatched_route_and_exception(self):
+        async def app(scope, receive, send):
+            raise RuntimeError("Test error")
+
+        middleware = ProcessTimeMiddleware(app)
+        with patch("api.api_v1.middlewares.process_time.observe_request") as mock_observe:  # fmt: skip
+            with pytest.raises(RuntimeError, match="Test error"):
+                await middleware(self.make_scope(), AsyncMock(), AsyncMock())
+
+        kwargs = mock_observe.call_args.kwargs
+        assert kwargs["route"] == UNMATCHED_ROUTE
+        assert kwargs["status_code"] == 500
+
+    async def test_sets_request_id(self):
+        request_ids = []
+
+        async def app(scope, receive, send):
+            request_ids.append(LogHelper.get_request_id())
+
+        middleware = ProcessTimeMiddleware(app)
+        with patch("api.api_v1.middlewares.process_time.observe_request"):
+            await middleware(
+                self.make_scope(headers=[(b"x-request-id", b"request-id")]),
+                AsyncMock(),
+                AsyncMock(),
+            )
+
+        assert request_ids == ["request-id"]
+
+
+def get_metric_value(name: str, labels: dict[str, str] | None = None) -> float:
+    return REGISTRY.get_sample_value(name, labels or {}) or 0.0
+
+
+class TestMetrics:
+    class TestObserveRequest:
+        def test_success(self):
+            labels = {"method": "GET", "route": "/test/{id}", "status": "200"}
+            count_before = get_metric_value("http_request_duration_seconds_count", labels)  # fmt: skip
+
+            observe_request(
+                method="GET",
+                route="/test/{id}",
+                status_code=200,
+                duration_ns=5_000_000,
+            )
+
+            count_after = get_metric_value("http_request_duration_seconds_count", labels)  # fmt: skip
+            assert count_after == count_before + 1
+
+    class TestGenerateMetrics:
+        def test_success(self):
+            content = generate_metrics()
+
+            assert b"http_request_duration_seconds" in content
+            assert b"http_requests_in_flight" in content
+
+    class TestInstrumentDbPool:
+        def test_checkout_and_checkin(self):
+            engine = create_async_engine(str(settings.db.url))
+            instrument_db_pool(engine)
+            checked_out_before = get_metric_value("db_pool_checked_out_connections")
+
+            engine.sync_engine.pool.dispatch.checkout(None, None, None)
+            assert get_metric_value("db_pool_checked_out_connections") == checked_out_before + 1  # fmt: skip
+
+            engine.sync_engine.pool.dispatch.checkin(None, None)
+            assert get_metric_value("db_pool_checked_out_connections") == checked_out_before  # fmt: skip
+
+    class TestRecentMax:
+        def test_keeps_max_within_window(self):
+            recent_max = RecentMax(window_seconds=60)
+            recent_max.record(0.2)
+            recent_max.record(0.1)
+
+            assert recent_max.get() == 0.2
+
+        def test_expires_after_two_windows(self):
+            recent_max = RecentMax(window_seconds=60)
+            recent_max.record(0.2)
+
+            with patch("api.api_v1.utils.metrics.time.monotonic", return_value=time.monotonic() + 120):  # fmt: skip
+                assert recent_max.get() == 0.0
+
+    class TestPendingWaits:
+        def test_longest_is_oldest_unfinished(self):
+            pending_waits = PendingWaits()
+            with patch("api.api_v1.utils.metrics.time.monotonic", return_value=100.0):  # fmt: skip
+                first = pending_waits.start()
+            with patch("api.api_v1.utils.metrics.time.monotonic", return_value=101.0):  # fmt: skip
+                pending_waits.start()
+
+            with patch("api.api_v1.utils.metrics.time.monotonic", return_value=102.0):  # fmt: skip
+                assert pending_waits.get_longest() == 2.0
+                pending_waits.finish(first)
+                assert pending_waits.get_longest() == 1.0
+
+        def test_empty(self):
+            assert PendingWaits().get_longest() == 0.0
+
+        def test_pool_marks_wait_before_checkout(self):
+            pending_during_checkout = []
+
+            def do_get(pool):
+                # соединение еще не получено, а ожидание уже видно
+                pending_during_checkout.append(dict(db_pool_pending_waits._started))
+                return MagicMock()
+
+            pool = TimedAsyncAdaptedQueuePool(creator=MagicMock())
+            with patch.object(AsyncAdaptedQueuePool, "_do_get", do_get):
+                pool._do_get()
+
+            assert len(pending_during_checkout[0]) == 1
+            assert db_pool_pending_waits._started == {}
+
+
+class TestAdmissionController:
+    @pytest.fixture
+    def controller(self) -> AdmissionController:
+        return AdmissionController(
+            AdmissionConfig(
+                max_in_flight=10,
+                max_db_pool_wait_ms=100,
+                max_event_loop_lag_ms=100,
+                low_priority_ratio=0.5,
+                critical_paths=["/api/v1/auth/refresh"],
+                low_priority_paths=["/api/v1/stories/search"],
+            )
+        )
+
+    def test_default_paths_from_settings(self):
+        controller = AdmissionController(AdmissionConfig())
+
+        refresh_path = (
+            settings.main_router.prefix
+            + settings.v1_router.prefix
+            + settings.auth_router.prefix
+            + settings.auth_router.refresh_endpoint_path
+        )
+        assert controller.get_priority(refresh_path) == "critical"
+        assert controller.get_priority(settings.health.prefix + "/live") == "critical"
+        assert controller.get_priority(settings.metrics.path) == "critical"
+        assert controller.get_priority("/api/v1/stories/search") == "low"
+        assert controller.get_priority("/api/v1/stories/all") == "normal"
+
+    def test_get_priority(self, controller):
+        assert controller.get_priority("/api/v1/auth/refresh") == "critical"
+        assert controller.get_priority("/api/v1/stories/search") == "low"
+        assert controller.get_priority("/api/v1/stories/all") == "normal"
+
+    def test_no_overload(self, controller):
+        with patch("api.api_v1.utils.admission.get_db_pool_wait") as mock_wait:
+            mock_wait.return_value = 0.0
+            assert controller.check("/api/v1/stories/search") == ("low", None)
+
+    def test_in_flight(self, controller):
+        controller.in_flight = 5
+        with patch("api.api_v1.utils.admission.get_db_pool_wait") as mock_wait:
+            mock_wait.return_value = 0.0
+            # низкий приоритет отклоняется на половине лимита, обычный - еще нет
+            assert controller.check("/api/v1/stories/search") == ("low", "in_flight")
+            assert controller.check("/api/v1/stories/all") == ("normal", None)
+
+            controller.in_flight = 100
+            assert controller.check("/api/v1/stories/all") == ("normal", "in_flight")
+            assert controller.check("/api/v1/auth/refresh") == ("critical", None)
+
+    def test_db_pool_wait_and_event_loop_lag(self, controller):
+        with (
+            patch("api.api_v1.utils.admission.get_db_pool_wait") as mock_wait,
+            patch("api.api_v1.utils.admission.event_loop_monitor") as mock_monitor,
+        ):
+            mock_wait.return_value = 0.2
+            mock_monitor.last_lag_seconds = 0.0
+            assert controller.get_overload_reason() == "db_pool_wait"
+
+            mock_wait.return_value = 0.0
+            mock_monitor.last_lag_seconds = 0.2
+            assert controller.get_overload_reason() == "event_loop_lag"
+
+
+@pytest.mark.anyio
+class TestClientDisconnectMiddleware:
+    @staticmethod
+    def make_scope(method: str = "GET") -> dict:
+        return {"type": "http", "method": method, "path": "/api/v1/stories/search", "headers": []}  # fmt: skip
+
+    async def test_cancels_on_disconnect(self):
+        receive_messages = asyncio.Queue()
+        receive_messages.put_nowait({"type": "http.request", "body": b""})
+        app_cancelled = asyncio.Event()
+
+        async def app(scope, receive, send):
+            await receive()
+            # клиент уходит, пока приложение ждет ответа от БД
+            receive_messages.put_nowait({"type": "http.disconnect"})
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                app_cancelled.set()
+                raise
+
+        scope = self.make_scope()
+        await ClientDisconnectMiddleware(app)(scope, receive_messages.get, AsyncMock())
+
+        assert app_cancelled.is_set()
+        assert scope["client_disconnected"] is True
+
+    async def test_disconnect_after_response(self):
+        receive_messages = asyncio.Queue()
+        receive_messages.put_nowait({"type": "http.request", "body": b""})
+
+        async def app(scope, receive, send):
+            await receive()
+            await send({"type": "http.response.start", "status": 200})
+            await send({"type": "http.response.body", "body": b"ok"})
+            # сервер отдает http.disconnect уже после ответа
+            receive_messages.put_nowait({"type": "http.disconnect"})
+
+        scope = self.make_scope()
+        send = AsyncMock()
+        await ClientDisconnectMiddleware(app)(scope, receive_messages.get, send)
+
+        assert send.await_count == 2
+        assert "client_disconnected" not in scope
+
+    async def test_skips_unsafe_methods(self):
+        app = AsyncMock()
+        receive = AsyncMock()
+
+        await ClientDisconnectMiddleware(app)(self.make_scope("POST"), receive, AsyncMock())  # fmt: skip
+
+        app.assert_awaited_once_with(ANY, receive, ANY)
+
+
+class TestStatementTimeout:
+    @pytest.fixture
+    def session_class(self) -> type[Session]:
+        # отдельный класс, чтобы слушатель не остался на Session для других тестов
+        class TimeoutSession(Session):
+            pass
+
+        instrument_statement_timeout(TimeoutSession)
+        return TimeoutSession
+
+    @pytest.mark.anyio
+    async def test_sets_local_timeout(self, session_class):
+        connection = MagicMock()
+        session = session_class()
+
+        async def handle_request():
+            await StatementTimeout(1500)()
+            session.dispatch.after_begin(session, None, connection)
+
+        # задача получает копию контекста, поэтому таймаут не утекает в тест
+        await asyncio.create_task(handle_request())
+        connection.exec_driver_sql.assert_called_once_with(
+            "SET LOCAL statement_timeout = 1500",
+            execution_options={SERVICE_QUERY_OPTION: True},
+        )
+
+        session.dispatch.after_begin(session, None, connection)
+        connection.exec_driver_sql.assert_called_once()
+
+    def test_is_statement_timeout_error(self):
+        canceled = DBAPIError("SELECT 1", None, MagicMock(sqlstate="57014"))
+        other = DBAPIError("SELECT 1", None, MagicMock(sqlstate="23505"))
+
+        assert is_statement_timeout_error(canceled)
+        assert not is_statement_timeout_error(other)
+
+
+@pytest.mark.anyio
+class TestAdmissionControlMiddleware:
+    @staticmethod
+    def make_scope(path: str) -> dict:
+        return {"type": "http", "method": "GET", "path": path, "headers": []}
+
+    async def test_sheds_with_retry_after(self):
+        controller = MagicMock()
+        controller.check.return_value = ("low", "in_flight")
+        controller.config.retry_after_seconds = 3
+        app = AsyncMock()
+        sent_messages = []
+
+        async def send(message):
+            sent_messages.append(message)
+
+        middleware = AdmissionControlMiddleware(app, controller=controller)
+        await middleware(self.make_scope("/api/v1/stories/search"), AsyncMock(), send)
+
+        app.assert_not_awaited()
+        assert sent_messages[0]["status"] == 503
+        assert (b"retry-after", b"3") in sent_messages[0]["headers"]
+
+    async def test_admits_and_tracks_in_flight(self):
+        controller = AdmissionController(AdmissionConfig())
+        in_flight_during_request = []
+
+        async def app(scope, receive, send):
+            in_flight_during_request.append(controller.in_flight)
+
+        middleware = AdmissionControlMiddleware(app, controller=controller)
+        with patch("api.api_v1.utils.admission.get_db_pool_wait") as mock_wait:
+            mock_wait.return_value = 0.0
+            await middleware(self.make_scope("/api/v1/stories/all"), AsyncMock(), AsyncMock())  # fmt: skip
+
+        assert in_flight_during_request == [1]
+        assert controller.in_flight == 0
+
+
+@pytest.mark.anyio
+class TestInstrumentedRedis:
+    async def test_records_command_latency(self):
+        labels = {"command": "GET"}
+        count_before = get_metric_value("redis_command_duration_seconds_count", labels)  # fmt: skip
+        with patch("redis.asyncio.Redis.execute_command", new_callable=AsyncMock, return_value=b"value"):  # fmt: skip
+            redis = InstrumentedRedis()
+
+            result = await redis.execute_command("GET", "key")
+
+        assert result == b"value"
+        count_after = get_metric_value("redis_command_duration_seconds_count", labels)  # fmt: skip
+        assert count_after == count_before + 1
+
+
+@pytest.mark.anyio
+class TestQueryTracking:
+    @staticmethod
+    def execute(
+        engine, statement: str = "SELECT 1", execution_options: dict | None = None
+    ) -> None:
+        context = Mock(execution_options=execution_options or {})
+        engine.sync_engine.dispatch.before_cursor_execute(None, None, statement, {}, context, False)  # fmt: skip
+        engine.sync_engine.dispatch.after_cursor_execute(None, None, statement, {}, context, False)  # fmt: skip
+
+    async def test_counts_queries_per_request(self):
+        engine = create_async_engine(str(settings.db.url))
+        instrument_query_tracking(engine, enforce_budget=False)
+
+        with track_queries(budget=1) as query_stats:
+            self.execute(engine)
+            self.execute(engine)
+
+        assert query_stats.count == 2
+        assert query_stats.is_over_budget is True
+
+        self.execute(engine)
+        assert query_stats.count == 2
+
+    async def test_skips_service_queries(self):
+        engine = create_async_engine(str(settings.db.url))
+        instrument_query_tracking(
+            engine, enforce_budget=True, slow_query_threshold_ms=0
+        )
+
+        with (
+            track_queries(budget=0) as query_stats,
+            patch("api.api_v1.utils.query_tracking.logger") as mock_logger,
+        ):
+            self.execute(engine, statement="SET LOCAL statement_timeout = 1000", execution_options={SERVICE_QUERY_OPTION: True})  # fmt: skip
+
+        assert query_stats.count == 0
+        mock_logger.warning.assert_not_called()
+
+    async def test_enforce_budget(self):
+        engine = create_async_engine(str(settings.db.url))
+        instrument_query_tracking(engine, enforce_budget=True)
+
+        with track_queries(budget=1):
+            self.execute(engine)
+            with pytest.raises(QueryBudgetExceeded):
+                self.execute(engine)
+
+    async def test_logs_slow_query(self):
+        engine = create_async_engine(str(settings.db.url))
+        instrument_query_tracking(engine, slow_query_threshold_ms=0)
+
+        with patch("api.api_v1.utils.query_tracking.logger") as mock_logger:
+            self.execute(engine, statement="SELECT stories.id FROM stories")
+
+        mock_logger.warning.assert_called_once()
+        assert "SELECT stories.id FROM stories" in mock_logger.warning.call_args.args
+
+    async def test_find_calling_helper(self):
+        async def get_stories():
+            return await greenlet_spawn(find_calling_helper)
+
+        with patch("api.api_v1.utils.query_tracking.DATABASE_HELPERS_FILE", __file__):
+            assert await get_stories() == "get_stories"
+
+
+@pytest.mark.anyio
+class TestSqlComments:
+    def test_build_sql_comment(self):
+        comment = build_sql_comment(
+            {"route": "/api/v1/stories/{story_uuid}", "helper": "get_stories", "request_id": None}  # fmt: skip
+        )
+
+        assert comment == " /*helper='get_stories',route='%2Fapi%2Fv1%2Fstories%2F%7Bstory_uuid%7D'*/"  # fmt: skip
+
+    def test_build_sql_comment_without_tags(self):
+        assert build_sql_comment({"route": None}) == ""
+
+    @pytest.mark.parametrize("include_request_id", [True, False])
+    async def test_instrument_sql_comments(self, include_request_id: bool):
+        engine = create_async_engine(str(settings.db.url))
+        instrument_sql_comments(engine, include_request_id=include_request_id)
+        set_request_scope({"route": MagicMock(path_format="/api/v1/stories/all")})
+        LogHelper.set_request_id("request-id")
+        try:
+            (listener,) = engine.sync_engine.dispatch.before_cursor_execute
+            statement, parameters = listener(None, None, "SELECT 1", {}, Mock(execution_options={}), False)  # fmt: skip
+        finally:
+            set_request_scope(None)
+            LogHelper.set_request_id(None)
+
+        assert statement.startswith("SELECT 1 /*")
+        assert "route='%2Fapi%2Fv1%2Fstories%2Fall'" in statement
+        assert ("request_id='request-id'" in statement) is include_request_id
+
+    async def test_skips_service_queries(self):
+        engine = create_async_engine(str(settings.db.url))
+        instrument_sql_comments(engine)
+        context = Mock(execution_options={SERVICE_QUERY_OPTION: True})
+
+        (listener,) = engine.sync_engine.dispatch.before_cursor_execute
+        statement, _ = listener(None, None, "SET LOCAL statement_timeout = 1000", {}, context, False)  # fmt: skip
+
+        assert statement == "SET LOCAL statement_timeout = 1000"
+
+
+class TestTracingHelper:
+    @pytest.fixture
+    def span_exporter(self):
+        pytest.importorskip("opentelemetry.sdk")
+        from opentelemetry.sdk.trace.export.in_memory_span_exporter import (
+            InMemorySpanExporter,
+        )
+
+        return InMemorySpanExporter()
+
+    @pytest.fixture
+    def tracing(self, span_exporter):
+        from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+
+        tracing = TracingHelper(config=TracingConfig())
+        tracing.setup(span_processor=SimpleSpanProcessor(span_exporter))
+        yield tracing
+        tracing.shutdown()
+
+    def test_disabled(self):
+        tracing = TracingHelper(config=TracingConfig(enabled=False))
+        tracing.setup()
+
+        with tracing.start_span("test") as span:
+            assert span is None
+        assert tracing.enabled is False
+
+    def test_nested_spans_with_request_id(self, tracing, span_exporter):
+        LogHelper.set_request_id("test-request-id")
+        try:
+            with tracing.start_span("parent"):
+                with tracing.start_span("child", attributes={"key": "value"}):
+                    pass
+        finally:
+            LogHelper.set_request_id(None)
+
+        child, parent = span_exporter.get_finished_spans()
+        assert child.name == "child"
+        assert child.parent.span_id == parent.context.span_id
+        assert child.attributes["key"] == "value"
+        assert child.attributes[REQUEST_ID_ATTRIBUTE] == "test-request-id"
+
+    def test_instrument_engine(self, tracing, span_exporter):
+        engine = create_async_engine(str(settings.db.url))
+        tracing.instrument_engine(engine)
+        context = Mock(execution_options={})
+        statement = "SELECT users.id FROM users"
+
+        engine.sync_engine.dispatch.before_cursor_execute(None, None, statement, {}, context, False)  # fmt: skip
+        engine.sync_engine.dispatch.after_cursor_execute(None, None, statement, {}, context, False)  # fmt: skip
+
+        (span,) = span_exporter.get_finished_spans()
+        assert span.name == "SQL SELECT"
+        assert span.attributes["db.statement"] == statement
+        assert span.attributes["db.system"] == "postgresql"
+
+    def test_instrument_engine_skips_service_queries(self, tracing, span_exporter):
+        engine = create_async_engine(str(settings.db.url))
+        tracing.instrument_engine(engine)
+        context = Mock(execution_options={SERVICE_QUERY_OPTION: True})
+        statement = "SET LOCAL statement_timeout = 1000"
+
+        engine.sync_engine.dispatch.before_cursor_execute(None, None, statement, {}, context, False)  # fmt: skip
+        engine.sync_engine.dispatch.after_cursor_execute(None, None, statement, {}, context, False)  # fmt: skip
+
+        assert span_exporter.get_finished_spans() == ()
+
+
+@pytest.mark.anyio
+class TestWarmup:
+    async def test_db_helper_warmup(self):
+        helper = DbHelper(
+            url=str(settings.db.url),
+            echo=False,
+            echo_pool=False,
+            max_overflow=0,
+            pool_size=3,
+        )
+        opened_connections = []
+
+        @asynccontextmanager
+        async def connect():
+            opened_connections.append(object())
+            yield
+
+        with patch.object(helper, "engine") as mock_engine:
+            mock_engine.connect = connect
+            await helper.warmup(connections=3)
+
+        assert len(opened_connections) == 3
+
+    async def test_redis_helper_warmup(self):
+        helper = RedisHelper(url=str(settings.redis.url))
+        mock_redis = AsyncMock()
+
+        with patch.object(helper, "get_redis", return_value=mock_redis):
+            await helper.warmup(connections=4)
+
+        assert mock_redis.ping.await_count == 4
+
+    async def test_warmup(self):
+        with (
+            patch("api.api_v1.utils.warmup.jwt_keys") as mock_jwt_keys,
+            patch("api.api_v1.utils.warmup.db_helper") as mock_db_helper,
+            patch("api.api_v1.utils.warmup.redis_helper") as mock_redis_helper,
+            patch("api.api_v1.utils.warmup.warmup_hot_queries") as mock_warmup_queries,
+        ):
+            mock_db_helper.warmup = AsyncMock()
+            mock_redis_helper.warmup = AsyncMock()
+            await warmup()
+
+        mock_jwt_keys.load.assert_called_once()
+        mock_db_helper.warmup.assert_awaited_once_with(connections=settings.db.pool_size)  # fmt: skip
+        mock_redis_helper.warmup.assert_awaited_once_with(connections=settings.warmup.redis_connections)  # fmt: skip
+        mock_warmup_queries.assert_awaited_once()
+
+
+@pytest.mark.anyio
+class TestHealth:
+    class TestHealthChecker:
+        async def test_all_checks_ok(self):
+            checker = HealthChecker(
+                config=HealthConfig(),
+                checks={"first": AsyncMock(), "second": AsyncMock()},
+            )
+
+            readiness = await checker.get_readiness()
+
+            assert readiness.status == "ok"
+            assert set(readiness.checks) == {"first", "second"}
+            latency_ms = readiness.checks["first"].latency_ms
+            assert latency_ms is not None and latency_ms >= 0
+
+        async def test_failed_and_timed_out_checks(self):
+            async def slow_check():
+                await asyncio.sleep(1)
+
+            checker = HealthChecker(
+                config=HealthConfig(check_timeout_seconds=0.01),
+                checks={
+                    "ok": AsyncMock(),
+                    "failed": AsyncMock(side_effect=ConnectionError("Test error")),
+                    "slow": slow_check,
+                },
+            )
+
+            readiness = await checker.get_readiness()
+
+            assert readiness.status == "fail"
+            assert readiness.checks["ok"].status == "ok"
+            assert readiness.checks["failed"].status == "fail"
+            detail = readiness.checks["failed"].detail
+            assert detail is not None and "Test error" in detail
+            assert readiness.checks["slow"].status == "fail"
+
+        async def test_cached_result(self):
+            check = AsyncMock()
+            checker = HealthChecker(
+                config=HealthConfig(cache_ttl_seconds=60),
+                checks={"check": check},
+            )
+
+            await checker.get_readiness()
+            await checker.get_readiness()
+
+            check.assert_awaited_once()
+
+    async def test_check_jwt_keys(self):
+        with patch.multiple(jwt_keys, private_key=None, public_key=None):
+            with pytest.raises(RuntimeError):
+                await check_jwt_keys()
+
+    async def test_check_event_loop(self):
+        monitor = MagicMock(spec=EventLoopMonitor)
+        monitor.get_recent_lag_seconds.return_value = 0.3
+
+        await check_event_loop(max_lag_ms=500, monitor=monitor)
+        with pytest.raises(RuntimeError):
+            await check_event_loop(max_lag_ms=200, monitor=monitor)
+
+
+@pytest.mark.anyio
+class TestEventLoopMonitor:
+    async def test_records_lag(self):
+        monitor = EventLoopMonitor(LoopMonitorConfig(interval_seconds=0.01))
+        with patch(
+            "api.api_v1.utils.loop_monitor.event_loop_lag_histogram"
+        ) as mock_histogram:
+            monitor.start()
+            await asyncio.sleep(0)
+            # блокируем цикл событий, пока монитор ждет своего интервала
+            time.sleep(0.05)
+            await asyncio.sleep(0.005)
+            await monitor.stop()
+
+        lags = [call.args[0] for call in mock_histogram.observe.call_args_list]
+        assert max(lags) >= 0.03
+        assert monitor.get_recent_lag_seconds() >= 0.03
+
+    async def test_recent_lag_includes_overdue_sample(self):
+        monitor = EventLoopMonitor(LoopMonitorConfig(interval_seconds=0.01))
+        monitor.start()
+        try:
+            await asyncio.sleep(0)
+            # замер еще не выполнился, но задержка уже видна
+            time.sleep(0.05)
+            assert monitor.get_recent_lag_seconds() >= 0.03
+        finally:
+            await monitor.stop()
+
+    async def test_logs_blocking_stack(self):
+        monitor = EventLoopMonitor(
+            LoopMonitorConfig(
+                interval_seconds=0.01,
+                debug=True,
+                blocking_threshold_ms=20,
+            )
+        )
+        with patch("api.api_v1.utils.loop_monitor.logger") as mock_logger:
+            monitor.start()
+            await asyncio.sleep(0.02)
+            time.sleep(0.1)
+            await asyncio.sleep(0.02)
+            await monitor.stop()
+
+        mock_logger.warning.assert_called_once()
+        stack = mock_logger.warning.call_args.args[-1]
+        assert "test_logs_blocking_stack" in stack
+
 
 class TestJWTAuth:
+    class TestJWTKeys:
+        @pytest.fixture
+        def pem_keys(self) -> tuple[str, str]:
+            from cryptography.hazmat.primitives import serialization
+            from cryptography.hazmat.primitives.asymmetric import rsa
+
+            private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+            private_pem = private_key.private_bytes(
+                encoding=serialization.Encoding.PEM,
+                format=serialization.PrivateFormat.PKCS8,
+                encryption_algorithm=serialization.NoEncryption(),
+            ).decode()
+            public_pem = (
+                private_key.public_key()
+                .public_bytes(
+                    encoding=serialization.Encoding.PEM,
+                    format=serialization.PublicFormat.SubjectPublicKeyInfo,
+                )
+                .decode()
+            )
+            return private_pem, public_pem
+
+        def test_load_and_roundtrip(self, pem_keys):
+            private_pem, public_pem = pem_keys
+            keys = JWTKeys()
+            with patch("pathlib.Path.read_text", side_effect=[private_pem, public_pem]):
+                keys.load()
+
+            assert keys.is_loaded
+            with patch.multiple(jwt_keys, private_key=keys.private_key, public_key=keys.public_key):  # fmt: skip
+                token = encode_jwt(payload={"sub": "username"})
+                assert decode_jwt(token=token)["sub"] == "username"
+
+        def test_clear(self):
+            keys = JWTKeys()
+            keys.private_key = keys.public_key = object()
+
+            keys.clear()
+
+            assert keys.is_loaded is False
+
     class TestEncodeJWT:
         def test_success(self, mock_datetime_now):
             payload = {"sub": 123}
@@ -1612,6 +3258,30 @@ class TestSecurity:
                 correct_password=hashed_password,
             )
 
+    @pytest.mark.anyio
+    class TestPasswordAsync:
+        async def test_hash_and_verify(self):
+            password = "password"
+
+            hashed_password = await hash_password_async(password=password)
+
+            assert await verify_password_async(
+                password=password,
+                correct_password=hashed_password,
+            )
+            assert not await verify_password_async(
+                password="wrongpassword",
+                correct_password=hashed_password,
+            )
+
+        async def test_records_queue_time(self):
+            queue_time_count_before = get_metric_value("bcrypt_queue_duration_seconds_count")  # fmt: skip
+
+            await hash_password_async(password="password")
+
+            queue_time_count_after = get_metric_value("bcrypt_queue_duration_seconds_count")  # fmt: skip
+            assert queue_time_count_after == queue_time_count_before + 1
+
     class TestValidateTokenType:
         def test_success(self):
             expected_type = "access"
@@ -1700,3 +3370,35 @@ class TestSecurity:
             avatar.seek = AsyncMock()
 
             assert not await validate_avatar_size(avatar=avatar)
+
+
+class TestRunConfig:
+    @pytest.mark.parametrize(
+        "workers, reload, expected_workers, expected_limit_max_requests",
+        [
+            (1, False, 1, None),
+            (4, False, 4, 10_000),
+            (4, True, None, None),
+        ],
+    )
+    def test_get_uvicorn_options(
+        self,
+        workers: int,
+        reload: bool,
+        expected_workers: int | None,
+        expected_limit_max_requests: int | None,
+    ):
+        run_config = RunConfig(
+            host="0.0.0.0",
+            port=8000,
+            workers=workers,
+            reload=reload,
+            limit_max_requests=10_000,
+        )
+
+        options = run_config.get_uvicorn_options()
+
+        # без супервизора uvicorn сервер завершился бы вместо перезапуска воркера
+        assert options["workers"] == expected_workers
+        assert options["limit_max_requests"] == expected_limit_max_requests
+        assert options["reload"] is reload